@@ -1,8 +1,45 @@
 import os
+import time
+import bisect
 import streamlit as st
-import yaml
+from streamlit.errors import StreamlitAPIException
 import json
 import base64
+from storage import get_path, set_path, DatasetLockedError
+from ingest import iter_json_array
+from status import StatusCounters
+from export import ExportCache, EXPORT_FORMATS, export_filename
+from resources import load_yaml, load_text
+from widget_state import WidgetStateManager
+from prefetch import Prefetcher
+from shared_dataset import DatasetManager
+from models import register_config_options, to_json
+from instrumentation import METRICS, timed
+from review_items import missing_review_fields_legacy, normalize_items, point_pages, first_open_page
+
+@st.cache_resource
+def get_dataset_manager():
+    # Shared by every session of this server process: one copy of each dataset in memory
+    return DatasetManager()
+
+
+@st.cache_resource
+def get_export_cache():
+    # Download payloads per dataset and version, shared by every session
+    return ExportCache()
+
+
+# Matches listed in the sidebar search selectbox
+SEARCH_RESULTS_SHOWN = 500
+
+
+def rerun_fragment():
+    # scope="fragment" is only allowed while the fragment itself is rerunning; on a full run rerun the app
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
 
 class AnnotationApp:
     def __init__(self):
@@ -20,73 +57,345 @@ class AnnotationApp:
             st.session_state.annotation_filepath = ""
         if 'dataset_name' not in st.session_state:
             st.session_state.dataset_name = ""
+        if 'store' not in st.session_state:
+            st.session_state.store = None
+        if 'save_scheduler' not in st.session_state:
+            st.session_state.save_scheduler = None
+        if 'status' not in st.session_state:
+            st.session_state.status = None
+        if 'dataset' not in st.session_state:
+            st.session_state.dataset = None
+        if 'widget_state' not in st.session_state:
+            st.session_state.widget_state = WidgetStateManager()
+        if 'prefetcher' not in st.session_state:
+            st.session_state.prefetcher = Prefetcher()
 
     def load_css(self):
         css_path = "src/annotation/annotation.css"
         if os.path.exists(css_path):
-            with open(css_path) as css_file:
-                css_content = css_file.read()
-                st.markdown(f'<style>{css_content}</style>', unsafe_allow_html=True)
+            css_content = load_text(css_path)
+            st.markdown(f'<style>{css_content}</style>', unsafe_allow_html=True)
 
     def load_config(self):
-        with open("src/config/annotation_config_1.yaml", "r") as file:
-            config = yaml.safe_load(file)
-        return config
+        # Parsed once per process (re-read when the file changes) instead of on every rerun
+        return load_yaml("src/config/annotation_config_1.yaml")
+
+    def display_metrics_panel(self):
+        # Opt-in: timings of this server process (all sessions), p50/p95 over the recent calls
+        if not st.sidebar.checkbox("Show timings", key="show_timings"):
+            return
+        snapshot = METRICS.snapshot()
+        if snapshot:
+            st.sidebar.table([
+                {"Phase": phase, "Calls": v["calls"], "p50 ms": f"{v['p50_ms']:.1f}", "p95 ms": f"{v['p95_ms']:.1f}",
+                 "KB": f"{v['bytes'] / 1024:.1f}"}
+                for phase, v in snapshot.items()
+            ])
+        if st.sidebar.button("Export metrics"):
+            written = METRICS.export(self.config.get('instrumentation'))
+            st.sidebar.caption("Wrote " + ", ".join(written) if written else "No export paths in the instrumentation config")
+
+    def display_startup_time(self):
+        startup_ms = st.session_state.get('startup_ms')
+        if startup_ms is not None:
+            st.sidebar.caption(f"Startup: {startup_ms:.1f} ms")
+
+    @timed("update_and_save")
+    def update_and_save(self, data: list, data_index: int, prop, value, filepath: str):
+        """
+        Update data[data_index][prop] and persist the change.
+        prop is a field name or a nested path, e.g. ('question1_aspects', 0, 'points', 2, 'choice').
+        Only this field-level change is appended to the journal; the file is not rewritten.
+        """
+        # Render-time no-op saves (e.g. clearing an empty comment) must not trip the lease check below
+        if get_path(data[data_index], prop, default=object()) == value:
+            return
+        dataset = st.session_state.get('dataset')
+        if dataset is not None and dataset.filepath == filepath:
+            holder = dataset.queue.holder(data_index)
+            if holder is not None and holder != self.active_reviewer():
+                st.warning(f"Item {data_index} is leased to {holder}; your change was not saved.")
+                return
+            if holder is not None:
+                # Fragment reruns skip display_work_queue, so writing to a held item renews its lease here
+                dataset.queue.renew(holder)
+            # Shared by all sessions: item-level lock, shared status counters, one save scheduler
+            dataset.edit(data_index, prop, value)
+            return
+        set_path(data[data_index], prop, value)
+        self.save_annotations(data, filepath)
 
     def initialize_annotation_state(self, index):
         if f"feedback_{index}" not in st.session_state:
             st.session_state[f"feedback_{index}"] = ""
 
+    @timed("load_data_file")
     def load_data_file(self, uploaded_file):
+        METRICS.add_bytes("load_data_file", getattr(uploaded_file, 'size', 0) or 0)
         dataset_name = os.path.splitext(os.path.basename(uploaded_file.name))[0]
         annotation_filename = f"{dataset_name}_annotation.json"
         annotation_filepath = os.path.join('data', dataset_name, annotation_filename)
         os.makedirs(os.path.dirname(annotation_filepath), exist_ok=True)
 
-        if os.path.exists(annotation_filepath):
-            with open(annotation_filepath, "r") as file:
-                data = json.load(file)
-                st.success(f"Loaded annotation file: {annotation_filename}")
-        else:
-            data = json.load(uploaded_file)
-            for item in (data if isinstance(data, list) else [data]):
+        st.session_state.prefetcher.close()
+        st.session_state.prefetcher = Prefetcher()
+        # Slot-based records with interned choices instead of nested dicts (lazy sharded data stays as is)
+        register_config_options(self.config)
+
+        def with_feedback(items):
+            for item in items:
                 if 'feedback' not in item:
                     item['feedback'] = ""
-            # Ensure data is a list
-            if not isinstance(data, list):
-                data = [data]
-            with open(annotation_filepath, "w") as file:
-                json.dump(data, file, indent=4)
-            st.success(f"Created new annotation file: {annotation_filename}")
+                yield item
+
+        def import_upload(store):
+            # Parse the upload item by item straight into the store instead of json.load on the whole file
+            return store.create_from_iter(normalize_items(with_feedback(iter_json_array(uploaded_file)), missing_review_fields_legacy))
+
+        # One in-memory copy per dataset for all sessions of this server; edits go through dataset.edit
+        try:
+            dataset, outcome = get_dataset_manager().open(annotation_filepath, self.config.get('storage'), 'scenario_reality',
+                                                          missing_review_fields_legacy, import_upload,
+                                                          self.config.get('work_queue', {}).get('lease_minutes', 15) * 60)
+        except DatasetLockedError as e:
+            # Another process (batch_refine.py or a second server) is writing this dataset
+            st.error(f"{e}; try again once it has finished")
+            st.stop()
+        if outcome == "created":
+            st.success(f"Created new annotation file: {annotation_filename} ({len(dataset.data)} items)")
+        else:
+            st.success(f"Loaded annotation file: {annotation_filename}")
+            # Files saved before the review schema was built at import got it in one write when first opened
+            if outcome == "loaded" and dataset.migrated:
+                st.info(f"Prepared review fields for {dataset.migrated} items")
 
+        self.use_dataset(dataset)
+        data = dataset.data
         return data, annotation_filepath, dataset_name
 
+    def use_dataset(self, dataset):
+        st.session_state.dataset = dataset
+        st.session_state.store = dataset.store
+        st.session_state.save_scheduler = dataset.scheduler
+
+    def sync_dataset(self):
+        # Another process changed the files on disk: switch to the reloaded copy
+        dataset = st.session_state.get('dataset')
+        if dataset is None:
+            return
+        current = get_dataset_manager().refresh(dataset)
+        if current is not dataset:
+            self.use_dataset(current)
+            st.session_state.data = current.data
+            st.info("The annotation file was changed on disk by another process and has been reloaded")
+
+    def display_data_preview(self, data, page_size=5):
+        total = len(data)
+        st.write(f"Total items: {total}")
+        if total == 0:
+            return
+        n_pages = (total + page_size - 1) // page_size
+        page = st.number_input("Preview page", min_value=1, max_value=n_pages, value=1, step=1, key="preview_page")
+        start = (page - 1) * page_size
+        st.json([to_json(data[i]) for i in range(start, min(start + page_size, total))], expanded=False)
+
+    @timed("save_annotations")
     def save_annotations(self, data, filepath):
-        with open(filepath, "w") as file:
-            json.dump(data, file, indent=4)
+        # Full rewrite; also folds away the journal so it cannot replay stale edits on top
+        store = st.session_state.get('store')
+        if store is not None and store.filepath == filepath:
+            self.flush_pending_saves()
+            store.create(to_json(item) for item in data)
+            # The sharded and sqlite backends write no _annotation.json
+            METRICS.add_bytes("save_annotations", store.size_bytes())
+        else:
+            with open(filepath, "w") as file:
+                json.dump(to_json(list(data)), file, indent=4)
+            METRICS.add_bytes("save_annotations", os.path.getsize(filepath))
+
+    def prefetch_neighbours(self, data, current_index):
+        st.session_state.prefetcher.schedule(data, current_index)
+
+    def flush_pending_saves(self):
+        if st.session_state.get('save_scheduler') is not None:
+            try:
+                st.session_state.save_scheduler.flush()
+            except Exception as e:
+                # The edits stay queued and the scheduler keeps retrying them
+                st.error(f"Saving failed, your changes are kept and will be retried: {e}")
+
+    def display_save_status(self):
+        scheduler = st.session_state.get('save_scheduler')
+        if scheduler is not None:
+            stats = scheduler.stats()
+            st.sidebar.caption(
+                f"Pending saves: {stats['pending']} | "
+                f"last flush {stats['last_flush_ms']:.1f} ms | avg {stats['avg_flush_ms']:.1f} ms"
+            )
+            if stats['last_error']:
+                st.sidebar.error(f"Saving failed ({stats['failed_flushes']} attempts), retrying: {stats['last_error']}")
+        live = st.session_state.widget_state.live_keys(st.session_state)
+        st.sidebar.caption(f"Widget state: {live['total']} keys ({live['item']} for the last {live['items']} items)")
+
+    def active_reviewer(self):
+        # Work-queue mode is on once the reviewer has entered a name
+        if st.session_state.get('dataset') is None:
+            return ""
+        return st.session_state.get('reviewer_name', '').strip()
+
+    def on_reviewer_change(self):
+        reviewer = self.active_reviewer()
+        if reviewer:
+            self.flush_pending_saves()
+            index = st.session_state.dataset.queue.claim_next(reviewer)
+            if index is not None:
+                st.session_state.current_index = index
+
+    def display_work_queue(self, data):
+        dataset = st.session_state.get('dataset')
+        if dataset is None:
+            return
+        st.sidebar.text_input("Reviewer name", key="reviewer_name", on_change=self.on_reviewer_change)
+        reviewer = self.active_reviewer()
+        if not reviewer:
+            st.sidebar.caption("Enter your name to get items from the shared work queue.")
+            return
+        queue = dataset.queue
+        # Every rerun counts as activity; if the lease ran out, pick up the next free item
+        index = queue.renew(reviewer)
+        if index is None:
+            index = queue.claim_next(reviewer)
+            if index is not None and index != st.session_state.current_index:
+                st.sidebar.info(f"Your lease expired; you now have item {index}")
+        if index is None:
+            st.sidebar.success("No unreviewed items left in the queue")
+        else:
+            st.session_state.current_index = index
+            st.sidebar.caption(f"Item {index} is leased to you for {queue.expires_in(reviewer) / 60:.0f} more min")
+            if st.sidebar.button("Release item"):
+                queue.release(reviewer)
+                st.rerun()
+
+        status = dataset.status
+        st.sidebar.progress(status.items_done / status.total if status.total else 0.0,
+                            text=f"Items fully reviewed: {status.items_done}/{status.total}")
+        leases = queue.leases()
+        completed = queue.completed()
+        reviewers = sorted(set(leases) | set(completed))
+        if reviewers:
+            st.sidebar.table([
+                {"Reviewer": name, "Item": leases[name][0] if name in leases else "-", "Completed": completed.get(name, 0)}
+                for name in reviewers
+            ])
 
     def on_index_change(self):
+        self.flush_pending_saves()
         st.session_state.current_index = st.session_state.item_index
 
+    def on_search_hit(self):
+        if st.session_state.search_hit is not None:
+            self.flush_pending_saves()
+            st.session_state.current_index = st.session_state.search_hit
+
+    def display_search(self, data):
+        """Sidebar search over the dataset's index; Previous/Next then step through the matches."""
+        st.session_state.search_hits = None
+        dataset = st.session_state.get('dataset')
+        if dataset is None:
+            return
+        query = st.sidebar.text_input(
+            "Search items", key="search_query", placeholder="scenario:delete topic:hydrofluoric",
+            help="Words match Topic, Scenario and point/decision texts; topic:<word> matches Topic only; "
+                 "scenario:<choice> and choice:<choice> (e.g. choice:unreviewed) match review choices."
+        )
+        if not query.strip():
+            return
+        start = time.perf_counter()
+        hits = dataset.search.search(query)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if hits is None:
+            return
+        st.session_state.search_hits = hits
+        st.sidebar.caption(f"{len(hits)} matching items ({elapsed_ms:.2f} ms)")
+        if not hits:
+            return
+        # A selectbox with every hit of a 100k-item dataset would be too heavy to send
+        shown = hits[:SEARCH_RESULTS_SHOWN]
+        if st.session_state.get('search_hit') not in shown:
+            st.session_state.search_hit = None
+        st.sidebar.selectbox(
+            "Matching items", shown, key="search_hit", placeholder="Jump to a matching item",
+            format_func=lambda i: f"{i}: {data[i].get('Topic', '')}", on_change=self.on_search_hit
+        )
+        if len(hits) > len(shown):
+            st.sidebar.caption(f"Showing the first {len(shown)}; Previous/Next step through all matches.")
+
     def go_previous(self):
-        if st.session_state.current_index > 0:
+        self.flush_pending_saves()
+        reviewer = self.active_reviewer()
+        if reviewer:
+            index = st.session_state.dataset.queue.claim_previous(reviewer)
+            if index is None:
+                st.toast("No earlier item of yours is free to reopen")
+            else:
+                st.session_state.current_index = index
+        elif st.session_state.get('search_hits'):
+            hits = st.session_state.search_hits
+            position = bisect.bisect_left(hits, st.session_state.current_index)
+            if position > 0:
+                st.session_state.current_index = hits[position - 1]
+        elif st.session_state.current_index > 0:
             st.session_state.current_index -= 1
 
     def go_next(self):
-        if st.session_state.current_index < len(st.session_state.data) - 1:
+        self.flush_pending_saves()
+        reviewer = self.active_reviewer()
+        if reviewer:
+            # Hand the item back and lease the next unreviewed one
+            index = st.session_state.dataset.queue.complete_and_claim(reviewer)
+            if index is not None:
+                st.session_state.current_index = index
+        elif st.session_state.get('search_hits'):
+            hits = st.session_state.search_hits
+            position = bisect.bisect_right(hits, st.session_state.current_index)
+            if position < len(hits):
+                st.session_state.current_index = hits[position]
+        elif st.session_state.current_index < len(st.session_state.data) - 1:
             st.session_state.current_index += 1
 
     # Create a downloadable version of the file
     def provide_download(self, data, filename="new_QA_annotation.json"):
-        json_data = json.dumps(data, indent=4)  # Convert data to JSON string
+        fmt = st.selectbox("Download format", list(EXPORT_FORMATS), key="download_format")
+        # Serialized only when the button is clicked, and reused until the next edit
         st.download_button(
             label="Download JSON File",
-            data=json_data,
-            file_name=filename,
-            mime="application/json"
+            data=get_export_cache().payload_fn(st.session_state.dataset, fmt),
+            file_name=export_filename(filename, fmt),
+            mime=EXPORT_FORMATS[fmt][1],
+            on_click=self.flush_pending_saves
+        )
+
+    def select_point_page(self, points, aspect_shown, page_key, page_size):
+        """Page selector for one aspect's Task 1 points; returns the (start, stop) range to render."""
+        pages = point_pages(points, page_size)
+        if len(pages) == 1:
+            return pages[0]
+        # Open on the first page that still has unreviewed points
+        if page_key not in st.session_state or st.session_state[page_key] >= len(pages):
+            st.session_state[page_key] = first_open_page(points, pages)
+        page = st.selectbox(
+            f"{aspect_shown} points",
+            list(range(len(pages))),
+            format_func=lambda i: f"Points {pages[i][0] + 1}-{pages[i][1]} of {len(points)}",
+            key=page_key
         )
+        return pages[page]
 
+    @timed("display_annotation_interface")
     def display_annotation_interface(self, data, current_index, show_image=False):
+        # Drop widget keys of items outside the recent window; they are rebuilt from data on revisit
+        st.session_state.widget_state.touch(st.session_state, current_index)
+        self.prefetch_neighbours(data, current_index)
         self.initialize_annotation_state(current_index)
         item = data[current_index]
 
@@ -125,50 +434,7 @@ class AnnotationApp:
         # Scenario Reality
         st.markdown(f"### {scenario_cfg.get('label', 'Scenario Reality')}")
         scenario_desc = item.get('Scenario', 'No scenario description available.')
-        st.write(scenario_desc)
-        scenario_options = scenario_cfg.get('options', [])
-        scenario_edit_option = scenario_cfg.get('editable_option', None)
-
-        scenario_key = f"scenario_reality_radio_{current_index}"
-        scenario_mod_key = f"scenario_reality_mod_{current_index}"
-
-        if scenario_key not in st.session_state:
-            st.session_state[scenario_key] = item.get('scenario_reality', "")
-        if scenario_mod_key not in st.session_state:
-            st.session_state[scenario_mod_key] = item.get('scenario_reality_modified', "")
-
-        # If the stored choice is not in the list of available options, reset it
-        if st.session_state[scenario_key] not in scenario_options:
-            # Reset to the first available option or any default choice
-            st.session_state[scenario_key] = scenario_options[0]
-
-        def update_scenario_choice():
-            chosen = st.session_state[scenario_key]
-            data[current_index]['scenario_reality'] = chosen
-            if chosen != scenario_edit_option:
-                st.session_state[scenario_mod_key] = ""
-                data[current_index]['scenario_reality_modified'] = ""
-            self.save_annotations(data, st.session_state.annotation_filepath)
-
-        st.radio(
-            "Scenario Reality Options",
-            scenario_options,
-            index=0,
-            key=scenario_key,
-            on_change=update_scenario_choice
-        )
-
-        if st.session_state[scenario_key] == scenario_edit_option:
-            def update_scenario_mod():
-                modified_text = st.session_state[scenario_mod_key]
-                data[current_index]['scenario_reality_modified'] = modified_text
-                self.save_annotations(data, st.session_state.annotation_filepath)
-            st.text_area(
-                "Any comments on the scenario:",
-                value=st.session_state[scenario_mod_key],
-                key=scenario_mod_key,
-                on_change=update_scenario_mod
-            )
+        self.display_scenario_block(data, current_index)
 
         st.markdown('''### **When to Use "Delete"**
    - Completely unrealistic or illogical.  
@@ -183,8 +449,6 @@ class AnnotationApp:
 
         # Question 1
         st.markdown(f"### {q1_cfg.get('label', 'Question 1')}")
-        q1_options = q1_cfg.get('options', [])
-        q1_edit_option = q1_cfg.get('editable_option', None)
 
         st.markdown('''### **When to Use "Delete"**
    - Redundant or repetitive issues.  
@@ -193,13 +457,6 @@ class AnnotationApp:
    - Hard to modify or cannot guarantee correctness.
 ''')
 
-        lab_issues = item.get('LabSafetyRelatedIssues', {})
-        aspects_keys = [
-            "MostCommonHazards",
-            "ImproperOperationIssues",
-            "NegativeLabEnvironmentImpacts",
-            "MostLikelySafetyIncidents"
-        ]
         aspects_shown = [
             "Most Common Hazards",
             "Improper Operation Issues",
@@ -207,131 +464,9 @@ class AnnotationApp:
             "Most Likely Safety Incidents"
         ]
 
-        if 'question1_aspects' not in data[current_index]:
-            data[current_index]['question1_aspects'] = []
-            for a_idx, aspect_key in enumerate(aspects_keys):
-                aspect_obj = {
-                    "aspect_name": aspect_key,
-                    "points": []
-                }
-                for p_text in lab_issues.get(aspect_key, []):
-                    aspect_obj["points"].append({
-                        "original_text": p_text,
-                        "choice": "",
-                        "modified_text": ""
-                    })
-                data[current_index]['question1_aspects'].append(aspect_obj)
-            self.save_annotations(data, st.session_state.annotation_filepath)
-
-        point_choice_keys = []
-        point_mod_keys = []
-        missing_items_keys = []
-        for a_idx, aspect_data in enumerate(data[current_index]['question1_aspects']):
-            point_choice_keys.append([])
-            point_mod_keys.append([])
-            missing_items_keys.append([f"missing_items_text_{a_idx}_{current_index}"])
-            for p_idx, point_info in enumerate(aspect_data.get('points', [])):
-                point_choice_keys[a_idx].append(f"point_choice_{a_idx}_{p_idx}_{current_index}")
-                point_mod_keys[a_idx].append(f"point_mod_{a_idx}_{p_idx}_{current_index}")
-        # Display and edit aspects
-        for a_idx, aspect_data in enumerate(data[current_index]['question1_aspects']):
-            aspect_name = aspect_data.get('aspect_name', f"Aspect {a_idx+1}")
-            st.subheader(aspects_shown[a_idx])
-            points_data = aspect_data.get('points', [])
-
-            # Display each point
-            for p_idx, point_info in enumerate(points_data):
-                point_text = point_info.get('original_text', '')
-
-                if point_choice_keys[a_idx][p_idx] not in st.session_state:
-                    st.session_state[point_choice_keys[a_idx][p_idx]] = point_info.get('choice', "")
-
-                if point_mod_keys[a_idx][p_idx] not in st.session_state:
-                    st.session_state[point_mod_keys[a_idx][p_idx]] = point_info.get('modified_text', "")
-
-                st.write(point_text)
-
-                # If the stored choice is not in the list of available options, reset it
-                if st.session_state[point_choice_keys[a_idx][p_idx]] not in q1_options:
-                    # Reset to the first available option or any default choice
-                    st.session_state[point_choice_keys[a_idx][p_idx]] = q1_options[0]
-
-                def make_update_point_choice(a_index, p_index):
-                    def update_point_choice():
-                        print(point_choice_keys[a_index][p_index], a_index, p_index)
-                        chosen = st.session_state[point_choice_keys[a_index][p_index]]
-                        print(st.session_state[point_choice_keys[a_index][p_index]])
-                        data[current_index]['question1_aspects'][a_index]['points'][p_index]['choice'] = chosen
-                        if chosen != q1_edit_option:
-                            st.session_state[point_mod_keys[a_index][p_index]] = ""
-                            data[current_index]['question1_aspects'][a_index]['points'][p_index]['modified_text'] = ""
-                        self.save_annotations(data, st.session_state.annotation_filepath)
-
-                    return update_point_choice
-
-                # print(st.session_state[point_choice_key])
-                st.radio(
-                    f"{aspects_shown[a_idx]}, Point {p_idx + 1}",
-                    q1_options,
-                    index=0,
-                    key=point_choice_keys[a_idx][p_idx],
-                    on_change=make_update_point_choice(a_idx, p_idx),
-                    label_visibility="collapsed"
-                )
-
-                # print(st.session_state[point_choice_key])
-                if st.session_state[point_choice_keys[a_idx][p_idx]] == q1_edit_option:
-                    def make_update_point_mod(a_index, p_index):
-                        def update_point_mod():
-                            modified_text = st.session_state[point_mod_keys[a_index][p_index]]
-                            data[current_index]['question1_aspects'][a_index]['points'][p_index][
-                                'modified_text'] = modified_text
-                            self.save_annotations(data, st.session_state.annotation_filepath)
-
-                        return update_point_mod
-
-                    st.text_area(
-                        f"Comments on {aspects_shown[a_idx]}, Point {p_idx+1}:",
-                        value=st.session_state[point_mod_keys[a_idx][p_idx]],
-                        key=point_mod_keys[a_idx][p_idx],
-                        on_change=make_update_point_mod(a_idx, p_idx)
-                    )
-
-            # Add missing items section
-
-            if missing_items_keys[a_idx] not in st.session_state:
-                st.session_state[missing_items_keys[a_idx]] = ""
-
-            st.markdown(f"**Missing Points for {aspects_shown[a_idx]} (Add new points line by line):**")
-            st.text_area(
-                "Add Missing Points:",
-                value=st.session_state[missing_items_keys[a_idx]],
-                key=missing_items_keys[a_idx]
-            )
-
-            # def make_add_missing_points(a_index):
-            def add_missing_points(a_index):
-                lines = st.session_state[missing_items_keys[a_index]].strip().split('\n')
-                added = False
-                for line in lines:
-                    line = line.strip()
-                    if line:
-                        data[current_index]['question1_aspects'][a_index]['points'].append({
-                            "original_text": line,
-                            "choice": "",
-                            "modified_text": ""
-                        })
-                        added = True
-                if added:
-                    # st.session_state[missing_items_keys[a_index]] = ""
-                    self.save_annotations(data, st.session_state.annotation_filepath)
-                    st.rerun()
-
-                # return add_missing_points
-
-            add_button_key = f"add_missing_points_button_{a_idx}_{current_index}"
-            if st.button("Add Missing Points", key=add_button_key):
-                add_missing_points(a_index=a_idx)
+        # Display and edit aspects, each in its own fragment
+        for a_idx in range(len(data[current_index]['question1_aspects'])):
+            self.display_aspect(data, current_index, a_idx, aspects_shown)
 
         st.markdown("---")
 
@@ -339,8 +474,6 @@ class AnnotationApp:
         st.markdown(f"### {q2_cfg.get('label', 'Question 2')}")
         st.write('Original Scenario:')
         st.write(scenario_desc)
-        q2_options = q2_cfg.get('options', [])
-        q2_edit_option = q2_cfg.get('editable_option', None)
 
         st.markdown('''#### **When to Use "Delete"**
    - Illogical or nonsensical actions.  
@@ -349,77 +482,8 @@ class AnnotationApp:
    - Hard to modify or cannot guarantee correctness of the consequence.
 ''')
 
-        option_consequences = item.get('OptionConsequences', {})
-        if 'question2_situations' not in data[current_index]:
-            data[current_index]['question2_situations'] = []
-            for opt_key in ['A', 'B', 'C', 'D']:
-                if opt_key in option_consequences:
-                    desc = option_consequences[opt_key].get('Description', '')
-                    cons = option_consequences[opt_key].get('Consequence', '')
-                    full_text = f"Action {opt_key}: {desc}\n\nConsequence: {cons}"
-                    data[current_index]['question2_situations'].append({
-                        "option_key": opt_key,
-                        "original_text": full_text,
-                        "choice": "",
-                        "modified_text": ""
-                    })
-            self.save_annotations(data, st.session_state.annotation_filepath)
-
-        situation_choice_keys = []
-        situation_mod_keys = []
-        for s_idx, situation_info in enumerate(data[current_index]['question2_situations']):
-            situation_choice_keys.append(f"q2_situation{s_idx}_radio_{current_index}")
-            situation_mod_keys.append(f"q2_situation{s_idx}_mod_{current_index}")
-
-        for s_idx, situation_info in enumerate(data[current_index]['question2_situations']):
-            situation_text = situation_info.get('original_text', '')
-
-            if situation_choice_keys[s_idx] not in st.session_state:
-                st.session_state[situation_choice_keys[s_idx]] = situation_info.get('choice', "")
-
-            if situation_mod_keys[s_idx] not in st.session_state:
-                st.session_state[situation_mod_keys[s_idx]] = situation_info.get('modified_text', "")
-
-            st.write(situation_text)
-
-            # If the stored choice is not in the list of available options, reset it
-            if st.session_state[situation_choice_keys[s_idx]] not in q2_options:
-                # Reset to the first available option or any default choice
-                st.session_state[situation_choice_keys[s_idx]] = q2_options[0]
-            def make_update_situation_choice(s_index):
-                def update_situation_choice():
-                    chosen = st.session_state[situation_choice_keys[s_index]]
-                    data[current_index]['question2_situations'][s_index]['choice'] = chosen
-                    if chosen != q2_edit_option:
-                        st.session_state[situation_mod_keys[s_index]] = ""
-                        data[current_index]['question2_situations'][s_index]['modified_text'] = ""
-                    self.save_annotations(data, st.session_state.annotation_filepath)
-
-                return update_situation_choice
-
-            st.radio(
-                f"Action {s_idx+1}",
-                q2_options,
-                index=0,
-                key=situation_choice_keys[s_idx],
-                on_change=make_update_situation_choice(s_idx),
-                label_visibility="collapsed"
-            )
-            options = ['A', 'B', 'C', 'D']
-            if st.session_state[situation_choice_keys[s_idx]] == q2_edit_option:
-                def make_update_situation_mod(si_index):
-                    def update_situation_mod():
-                        modified_text = st.session_state[situation_mod_keys[si_index]]
-                        data[current_index]['question2_situations'][si_index]['modified_text'] = modified_text
-                        self.save_annotations(data, st.session_state.annotation_filepath)
-
-                    return update_situation_mod
-                st.text_area(
-                    f"Comments on Concequence of Option {options[s_idx]}:",
-                    value=st.session_state[situation_mod_keys[s_idx]],
-                    key=situation_mod_keys[s_idx],
-                    on_change=make_update_situation_mod(s_idx)
-                )
+        for s_idx in range(len(data[current_index]['question2_situations'])):
+            self.display_situation(data, current_index, s_idx)
 
         st.markdown("---")
 
@@ -428,8 +492,7 @@ class AnnotationApp:
         with feedback_col:
             def update_feedback():
                 st.session_state[f"feedback_{current_index}"] = st.session_state[f"feedback_textarea_{current_index}"]
-                data[current_index]['feedback'] = st.session_state[f"feedback_{current_index}"]
-                self.save_annotations(data, st.session_state.annotation_filepath)
+                self.update_and_save(data, current_index, 'feedback', st.session_state[f"feedback_{current_index}"], st.session_state.annotation_filepath)
 
             if f"feedback_textarea_{current_index}" not in st.session_state:
                 st.session_state[f"feedback_textarea_{current_index}"] = item.get('feedback', "")
@@ -455,16 +518,263 @@ class AnnotationApp:
 
         self.provide_download(data)
 
+    @st.fragment
+    @timed("scenario_fragment")
+    def display_scenario_block(self, data, current_index):
+        # A fragment: the scenario choice and comment rerun only this block
+        item = data[current_index]
+        scenario_cfg = self.config.get('scenario_reality', {})
+        scenario_desc = item.get('Scenario', 'No scenario description available.')
+        st.write(scenario_desc)
+        scenario_options = scenario_cfg.get('options', [])
+        scenario_edit_option = scenario_cfg.get('editable_option', None)
+
+        scenario_key = f"scenario_reality_radio_{current_index}"
+        scenario_mod_key = f"scenario_reality_mod_{current_index}"
+
+        if scenario_key not in st.session_state:
+            st.session_state[scenario_key] = item.get('scenario_reality', "")
+        if scenario_mod_key not in st.session_state:
+            st.session_state[scenario_mod_key] = item.get('scenario_reality_modified', "")
+
+        # If the stored choice is not in the list of available options, reset it
+        if st.session_state[scenario_key] not in scenario_options:
+            # Reset to the first available option or any default choice
+            st.session_state[scenario_key] = scenario_options[0]
+
+        def update_scenario_choice():
+            chosen = st.session_state[scenario_key]
+            self.update_and_save(data, current_index, 'scenario_reality', chosen, st.session_state.annotation_filepath)
+            if chosen != scenario_edit_option:
+                st.session_state[scenario_mod_key] = ""
+                self.update_and_save(data, current_index, 'scenario_reality_modified', "", st.session_state.annotation_filepath)
+
+        st.radio(
+            "Scenario Reality Options",
+            scenario_options,
+            index=0,
+            key=scenario_key,
+            on_change=update_scenario_choice
+        )
+
+        if st.session_state[scenario_key] == scenario_edit_option:
+            def update_scenario_mod():
+                modified_text = st.session_state[scenario_mod_key]
+                self.update_and_save(data, current_index, 'scenario_reality_modified', modified_text, st.session_state.annotation_filepath)
+            st.text_area(
+                "Any comments on the scenario:",
+                value=st.session_state[scenario_mod_key],
+                key=scenario_mod_key,
+                on_change=update_scenario_mod
+            )
+
+    @st.fragment
+    @timed("aspect_fragment")
+    def display_aspect(self, data, current_index, a_idx, aspects_shown):
+        # A fragment: a change to one of its widgets reruns (and saves) only this aspect
+        item = data[current_index]
+        q1_cfg = self.config.get('question1', {})
+        q1_options = q1_cfg.get('options', [])
+        q1_edit_option = q1_cfg.get('editable_option', None)
+        points_per_page = q1_cfg.get('points_per_page', 5)
+        aspect_data = item['question1_aspects'][a_idx]
+        n_points = len(aspect_data.get('points', []))
+        # Keyed by a_idx like the callbacks below expect
+        point_choice_keys = {a_idx: [f"point_choice_{a_idx}_{p_idx}_{current_index}" for p_idx in range(n_points)]}
+        point_mod_keys = {a_idx: [f"point_mod_{a_idx}_{p_idx}_{current_index}" for p_idx in range(n_points)]}
+        missing_items_keys = {a_idx: [f"missing_items_text_{a_idx}_{current_index}"]}
+
+        aspect_name = aspect_data.get('aspect_name', f"Aspect {a_idx+1}")
+        st.subheader(aspects_shown[a_idx])
+        points_data = aspect_data.get('points', [])
+
+        # Widgets only for the points on the selected page, so reruns stay bounded as points are added
+        start, stop = self.select_point_page(points_data, aspects_shown[a_idx], f"point_page_{a_idx}_{current_index}", points_per_page)
+
+        # Display each point of the page
+        for p_idx in range(start, stop):
+            point_info = points_data[p_idx]
+            point_text = point_info.get('original_text', '')
+
+            if point_choice_keys[a_idx][p_idx] not in st.session_state:
+                st.session_state[point_choice_keys[a_idx][p_idx]] = point_info.get('choice', "")
+
+            if point_mod_keys[a_idx][p_idx] not in st.session_state:
+                st.session_state[point_mod_keys[a_idx][p_idx]] = point_info.get('modified_text', "")
+
+            st.write(point_text)
+
+            # If the stored choice is not in the list of available options, reset it
+            if st.session_state[point_choice_keys[a_idx][p_idx]] not in q1_options:
+                # Reset to the first available option or any default choice
+                st.session_state[point_choice_keys[a_idx][p_idx]] = q1_options[0]
+
+            def make_update_point_choice(a_index, p_index):
+                def update_point_choice():
+                    print(point_choice_keys[a_index][p_index], a_index, p_index)
+                    chosen = st.session_state[point_choice_keys[a_index][p_index]]
+                    print(st.session_state[point_choice_keys[a_index][p_index]])
+                    self.update_and_save(data, current_index, ('question1_aspects', a_index, 'points', p_index, 'choice'), chosen, st.session_state.annotation_filepath)
+                    if chosen != q1_edit_option:
+                        st.session_state[point_mod_keys[a_index][p_index]] = ""
+                        self.update_and_save(data, current_index, ('question1_aspects', a_index, 'points', p_index, 'modified_text'), "", st.session_state.annotation_filepath)
+
+                return update_point_choice
+
+            # print(st.session_state[point_choice_key])
+            st.radio(
+                f"{aspects_shown[a_idx]}, Point {p_idx + 1}",
+                q1_options,
+                index=0,
+                key=point_choice_keys[a_idx][p_idx],
+                on_change=make_update_point_choice(a_idx, p_idx),
+                label_visibility="collapsed"
+            )
+
+            # print(st.session_state[point_choice_key])
+            if st.session_state[point_choice_keys[a_idx][p_idx]] == q1_edit_option:
+                def make_update_point_mod(a_index, p_index):
+                    def update_point_mod():
+                        modified_text = st.session_state[point_mod_keys[a_index][p_index]]
+                        self.update_and_save(data, current_index, ('question1_aspects', a_index, 'points', p_index, 'modified_text'), modified_text, st.session_state.annotation_filepath)
+
+                    return update_point_mod
+
+                st.text_area(
+                    f"Comments on {aspects_shown[a_idx]}, Point {p_idx+1}:",
+                    value=st.session_state[point_mod_keys[a_idx][p_idx]],
+                    key=point_mod_keys[a_idx][p_idx],
+                    on_change=make_update_point_mod(a_idx, p_idx)
+                )
+
+        # Add missing items section
+
+        if missing_items_keys[a_idx] not in st.session_state:
+            st.session_state[missing_items_keys[a_idx]] = ""
+
+        st.markdown(f"**Missing Points for {aspects_shown[a_idx]} (Add new points line by line):**")
+        st.text_area(
+            "Add Missing Points:",
+            value=st.session_state[missing_items_keys[a_idx]],
+            key=missing_items_keys[a_idx]
+        )
+
+        # def make_add_missing_points(a_index):
+        def add_missing_points(a_index):
+            lines = st.session_state[missing_items_keys[a_index]].strip().split('\n')
+            new_points = []
+            for line in lines:
+                line = line.strip()
+                if line:
+                    new_points.append({
+                        "original_text": line,
+                        "choice": "",
+                        "modified_text": ""
+                    })
+            if new_points:
+                # st.session_state[missing_items_keys[a_index]] = ""
+                self.update_and_save(data, current_index, ('question1_aspects', a_index, 'points'), data[current_index]['question1_aspects'][a_index]['points'] + new_points, st.session_state.annotation_filepath)
+                rerun_fragment()
+
+            # return add_missing_points
+
+        add_button_key = f"add_missing_points_button_{a_idx}_{current_index}"
+        if st.button("Add Missing Points", key=add_button_key):
+            add_missing_points(a_index=a_idx)
+
+    @st.fragment
+    @timed("situation_fragment")
+    def display_situation(self, data, current_index, s_idx):
+        # A fragment per option: changing it reruns and saves only this option
+        q2_cfg = self.config.get('question2', {})
+        q2_options = q2_cfg.get('options', [])
+        q2_edit_option = q2_cfg.get('editable_option', None)
+        situation_info = data[current_index]['question2_situations'][s_idx]
+        situation_choice_keys = {s_idx: f"q2_situation{s_idx}_radio_{current_index}"}
+        situation_mod_keys = {s_idx: f"q2_situation{s_idx}_mod_{current_index}"}
+
+        situation_text = situation_info.get('original_text', '')
+
+        if situation_choice_keys[s_idx] not in st.session_state:
+            st.session_state[situation_choice_keys[s_idx]] = situation_info.get('choice', "")
+
+        if situation_mod_keys[s_idx] not in st.session_state:
+            st.session_state[situation_mod_keys[s_idx]] = situation_info.get('modified_text', "")
+
+        st.write(situation_text)
+
+        # If the stored choice is not in the list of available options, reset it
+        if st.session_state[situation_choice_keys[s_idx]] not in q2_options:
+            # Reset to the first available option or any default choice
+            st.session_state[situation_choice_keys[s_idx]] = q2_options[0]
+        def make_update_situation_choice(s_index):
+            def update_situation_choice():
+                chosen = st.session_state[situation_choice_keys[s_index]]
+                self.update_and_save(data, current_index, ('question2_situations', s_index, 'choice'), chosen, st.session_state.annotation_filepath)
+                if chosen != q2_edit_option:
+                    st.session_state[situation_mod_keys[s_index]] = ""
+                    self.update_and_save(data, current_index, ('question2_situations', s_index, 'modified_text'), "", st.session_state.annotation_filepath)
+
+            return update_situation_choice
+
+        st.radio(
+            f"Action {s_idx+1}",
+            q2_options,
+            index=0,
+            key=situation_choice_keys[s_idx],
+            on_change=make_update_situation_choice(s_idx),
+            label_visibility="collapsed"
+        )
+        options = ['A', 'B', 'C', 'D']
+        if st.session_state[situation_choice_keys[s_idx]] == q2_edit_option:
+            def make_update_situation_mod(si_index):
+                def update_situation_mod():
+                    modified_text = st.session_state[situation_mod_keys[si_index]]
+                    self.update_and_save(data, current_index, ('question2_situations', si_index, 'modified_text'), modified_text, st.session_state.annotation_filepath)
+
+                return update_situation_mod
+            st.text_area(
+                f"Comments on Concequence of Option {options[s_idx]}:",
+                value=st.session_state[situation_mod_keys[s_idx]],
+                key=situation_mod_keys[s_idx],
+                on_change=make_update_situation_mod(s_idx)
+            )
+
     def display_overall_status(self, data):
+        # The shared dataset builds its counters on first use; they are kept current by every session's edits
+        dataset = st.session_state.get('dataset')
+        status = dataset.status if dataset is not None else st.session_state.get('status')
+        if status is None:
+            status = st.session_state.status = StatusCounters.from_data(data, 'scenario_reality')
+        scenario_options = self.config.get('scenario_reality', {}).get('options', [])
+        q1_options = self.config.get('question1', {}).get('options', [])
+        q2_options = self.config.get('question2', {}).get('options', [])
+
         st.sidebar.subheader("Overall Status of Annotations:")
         st.sidebar.markdown("---")
-        total = len(data)
-        conform_count = sum(1 for d in data if d.get('scenario_reality') == 'Conform')
-        st.sidebar.write(f"Scenario Conform Count: {conform_count}/{total}")
-
+        completion = status.completion()
+        st.sidebar.progress(completion, text=f"Completion: {completion:.1%}")
+        st.sidebar.write(f"Scenarios reviewed: {status.scenario_reviewed()}/{status.total}")
+        for option in scenario_options:
+            st.sidebar.write(f"Scenario {option} Count: {status.scenario[option]}/{status.total}")
+
+        st.sidebar.markdown(f"**Task 1 points reviewed: {status.points_reviewed}/{status.points_total}**")
+        st.sidebar.table([
+            {"Aspect": aspect.replace('_', ' '), **{option: counts[option] for option in q1_options}, "Pending": counts[""]}
+            for aspect, counts in status.aspects.items()
+        ])
+        st.sidebar.markdown(f"**Task 2 decisions reviewed: {status.situations_reviewed}/{status.situations_total}**")
+        st.sidebar.table([
+            {"Decision": situation, **{option: counts[option] for option in q2_options}, "Pending": counts[""]}
+            for situation, counts in status.situations.items()
+        ])
+
+    @timed("run")
     def run(self):
         self.load_css()
         st.sidebar.title("Navigation")
+        self.display_startup_time()
+        self.display_metrics_panel()
         page = st.sidebar.selectbox("Go to", ["Configuration", "Lab Safety Data Review Platform"], label_visibility="collapsed")
 
         if page == "Configuration":
@@ -474,34 +784,39 @@ class AnnotationApp:
                 data, annotation_filepath, dataset_name = self.load_data_file(uploaded_file)
                 st.session_state.annotation_filepath = annotation_filepath
                 st.session_state.dataset_name = dataset_name
-                st.write("JSON Data:", data)
+                self.display_data_preview(data)
                 # Since we now take all keys, no selection step is needed.
                 # All keys will be considered selected by default.
                 st.session_state.data = data
                 st.session_state.current_index = 0
-                for i in range(len(data)):
-                    self.initialize_annotation_state(i)
+                # Per-item state is initialized lazily when an item is displayed
                 st.success("All keys are considered selected. Proceed to the annotation platforms.")
 
         elif page == "Lab Safety Data Review Platform":
             st.title("Lab Safety Data Review Platform (First Phase)")
             # No longer checking for selected keys
+            self.sync_dataset()
             if st.session_state.data:
                 data = st.session_state.data
-                st.sidebar.number_input(
-                    "Select Item Index",
-                    min_value=0,
-                    max_value=len(data) - 1,
-                    value=st.session_state.current_index,
-                    step=1,
-                    key="item_index",
-                    on_change=self.on_index_change
-                )
+                self.display_work_queue(data)
+                if not self.active_reviewer():
+                    # Manual index picking only for a single reviewer outside the work queue
+                    st.sidebar.number_input(
+                        "Select Item Index",
+                        min_value=0,
+                        max_value=len(data) - 1,
+                        value=st.session_state.current_index,
+                        step=1,
+                        key="item_index",
+                        on_change=self.on_index_change
+                    )
+                    self.display_search(data)
                 st.sidebar.markdown(f'Total items: {len(data)}')
+                self.display_save_status()
                 current_index = st.session_state.current_index
                 self.display_annotation_interface(data, current_index, show_image=False)
 
-                if st.sidebar.button("Show Status"):
+                if st.sidebar.checkbox("Show Status", key="show_status"):
                     self.display_overall_status(data)
 
         # elif page == "Image Annotation Platform":
@@ -526,5 +841,9 @@ class AnnotationApp:
         #             self.display_overall_status(data)
 
 if __name__ == "__main__":
+    rerun_start = time.perf_counter()
     app = AnnotationApp()
+    st.session_state.startup_ms = (time.perf_counter() - rerun_start) * 1000
+    METRICS.observe("startup", st.session_state.startup_ms / 1000)
     app.run()
+    METRICS.maybe_export(app.config.get('instrumentation'))
@@ -1,15 +1,70 @@
 import os
+import time
+import bisect
 import streamlit as st
-import yaml
+from streamlit.errors import StreamlitAPIException
 import json
 # from prompts import *
 import os
 from streamlit_scroll_to_top import scroll_to_here
-import openai
-import requests
+from storage import get_path, set_path, DatasetLockedError
+from ingest import iter_json_array
+from status import StatusCounters
+from export import ExportCache, EXPORT_FORMATS, export_filename
+from resources import load_yaml, load_text
+from widget_state import WidgetStateManager
+from prefetch import Prefetcher
+from shared_dataset import DatasetManager
+from models import register_config_options, to_json
+from instrumentation import METRICS, timed
+from review_items import missing_review_fields, normalize_items, point_pages, first_open_page, ISSUE_ASPECTS
+from gpt_client import GPTExecutor
+from gpt_cache import ResponseCache
+from batch_refine import SUGGESTIONS_FIELD, suggestion_key
+from webdav_sync import WebDAVSync
+import uuid
 
 os.environ['OPENAI_API_KEY'] = st.secrets["OPENAI_API_KEY"]
 
+
+@st.cache_resource
+def get_gpt_executor():
+    # 整个进程共用一个 OpenAI client（复用 keep-alive 连接）和请求线程池
+    return GPTExecutor(cache=ResponseCache(os.path.join('data', 'gpt_cache.sqlite')))
+
+
+@st.cache_resource
+def get_dataset_manager():
+    # 同一个 server 进程里的所有审阅者共用一份数据
+    return DatasetManager()
+
+
+@st.cache_resource
+def get_export_cache():
+    # 下载内容按数据集和版本缓存，所有 session 共用
+    return ExportCache()
+
+
+@st.cache_resource
+def get_webdav_sync():
+    # 坚果云备份在后台线程上传，所有 session 共用一个 keep-alive 连接池
+    return WebDAVSync("https://dav.jianguoyun.com/dav",
+                      auth=(st.secrets["nutcloud"]["username"], st.secrets["nutcloud"]["password"]))
+
+
+REFINE_PROMPT = 'Refine the sentences. Please only output the refined content.'
+ANY_REQUEST_PROMPT = 'You are a helpful assistant.'
+# 侧边栏搜索 selectbox 里列出的匹配条数
+SEARCH_RESULTS_SHOWN = 500
+
+
+def rerun_fragment():
+    # scope="fragment" 只能在 fragment 自己重跑时使用；整页运行时就重跑整页
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
 scenario_instruction = '''**Task for Experts**
 
 Your task is to review and evaluate each **scenario** generated using the provided prompt. For each scenario, you need to:
@@ -162,13 +217,30 @@ class AnnotationApp:
         if key not in st.session_state:
             st.session_state[key] = default_value
 
-    def update_and_save(self, data: list, data_index: int, prop: str, value, filepath: str):
+    @timed("update_and_save")
+    def update_and_save(self, data: list, data_index: int, prop, value, filepath: str):
         """
         更新 data[data_index][prop] 的值并执行保存
+        prop 可以是字段名，也可以是嵌套路径，例如 ('question1_aspects', 0, 'points', 2, 'choice')
+        只把这一次字段修改追加到 journal，不再重写整个文件
         """
-        data[data_index][prop] = value
-        with open(filepath, "w") as file:
-            json.dump(data, file, indent=4)
+        # 渲染时的无变化保存（比如清空本来就为空的评论）不应触发下面的租约检查
+        if get_path(data[data_index], prop, default=object()) == value:
+            return
+        dataset = st.session_state.get('dataset')
+        if dataset is not None and dataset.filepath == filepath:
+            holder = dataset.queue.holder(data_index)
+            if holder is not None and holder != self.active_reviewer():
+                st.warning(f"Item {data_index} is leased to {holder}; your change was not saved.")
+                return
+            if holder is not None:
+                # fragment 重跑不会执行 display_work_queue，所以在写入自己租到的条目时续租
+                dataset.queue.renew(holder)
+            # 所有 session 共用：item 级锁、共享的状态计数、同一个保存调度器
+            dataset.edit(data_index, prop, value)
+            return
+        set_path(data[data_index], prop, value)
+        self.save_annotations(data, filepath)
     ############################################
 
     def session_state_initialization(self):
@@ -182,121 +254,515 @@ class AnnotationApp:
             st.session_state.annotation_filepath = ""
         if 'dataset_name' not in st.session_state:
             st.session_state.dataset_name = ""
+        if 'store' not in st.session_state:
+            st.session_state.store = None
+        if 'save_scheduler' not in st.session_state:
+            st.session_state.save_scheduler = None
+        if 'status' not in st.session_state:
+            st.session_state.status = None
+        if 'dataset' not in st.session_state:
+            st.session_state.dataset = None
+        if 'widget_state' not in st.session_state:
+            st.session_state.widget_state = WidgetStateManager()
+        if 'prefetcher' not in st.session_state:
+            st.session_state.prefetcher = Prefetcher()
+        if 'gpt_session_id' not in st.session_state:
+            st.session_state.gpt_session_id = uuid.uuid4().hex
 
     def load_css(self):
         css_path = "src/annotation/annotation.css"
         if os.path.exists(css_path):
-            with open(css_path) as css_file:
-                css_content = css_file.read()
-                st.markdown(f'<style>{css_content}</style>', unsafe_allow_html=True)
+            css_content = load_text(css_path)
+            st.markdown(f'<style>{css_content}</style>', unsafe_allow_html=True)
 
     def load_config(self):
-        with open("src/config/annotation_config_2.yaml", "r") as file:
-            config = yaml.safe_load(file)
-        return config
-
+        # 每个进程只解析一次（文件改动后重新读取），不再每次 rerun 都解析
+        return load_yaml("src/config/annotation_config_2.yaml")
+
+    def display_metrics_panel(self):
+        # 可选面板：本进程（所有 session）的耗时统计，p50/p95 取最近的调用
+        if not st.sidebar.checkbox("Show timings", key="show_timings"):
+            return
+        snapshot = METRICS.snapshot()
+        if snapshot:
+            st.sidebar.table([
+                {"Phase": phase, "Calls": v["calls"], "p50 ms": f"{v['p50_ms']:.1f}", "p95 ms": f"{v['p95_ms']:.1f}",
+                 "KB": f"{v['bytes'] / 1024:.1f}"}
+                for phase, v in snapshot.items()
+            ])
+        if st.sidebar.button("Export metrics"):
+            written = METRICS.export(self.config.get('instrumentation'))
+            st.sidebar.caption("Wrote " + ", ".join(written) if written else "No export paths in the instrumentation config")
+
+    def display_startup_time(self):
+        startup_ms = st.session_state.get('startup_ms')
+        if startup_ms is not None:
+            st.sidebar.caption(f"Startup: {startup_ms:.1f} ms")
+
+    @timed("load_data_file")
     def load_data_file(self, uploaded_file):
+        METRICS.add_bytes("load_data_file", getattr(uploaded_file, 'size', 0) or 0)
         dataset_name = os.path.splitext(os.path.basename(uploaded_file.name))[0]
         annotation_filename = f"{dataset_name}_annotation.json"
         annotation_filepath = os.path.join('data', dataset_name, annotation_filename)
         os.makedirs(os.path.dirname(annotation_filepath), exist_ok=True)
 
-        if os.path.exists(annotation_filepath):
-            with open(annotation_filepath, "r") as file:
-                data = json.load(file)
-                st.success(f"Loaded annotation file: {annotation_filename}")
+        st.session_state.prefetcher.close()
+        st.session_state.prefetcher = Prefetcher()
+        # 用 slot 记录和驻留的选项字符串代替嵌套 dict（分片的惰性数据保持原样）
+        register_config_options(self.config)
+
+        def import_upload(store):
+            # 逐个 item 解析上传的文件并直接写入 store，不再对整个文件 json.load
+            return store.create_from_iter(normalize_items(iter_json_array(uploaded_file), missing_review_fields))
+
+        # 每个数据集在 server 内存里只有一份，所有 session 共用；修改都通过 dataset.edit
+        try:
+            dataset, outcome = get_dataset_manager().open(annotation_filepath, self.config.get('storage'), 'Scenario_judge',
+                                                          missing_review_fields, import_upload,
+                                                          self.config.get('work_queue', {}).get('lease_minutes', 15) * 60)
+        except DatasetLockedError as e:
+            # 另一个进程（batch_refine.py 或另一个 server）正在写这个数据集
+            st.error(f"{e}; try again once it has finished")
+            st.stop()
+        if outcome == "created":
+            st.success(f"Created new annotation file: {annotation_filename} ({len(dataset.data)} items)")
         else:
-            data = json.load(uploaded_file)
-            # Ensure data is a list
-            if not isinstance(data, list):
-                data = [data]
-            with open(annotation_filepath, "w") as file:
-                json.dump(data, file, indent=4)
-            st.success(f"Created new annotation file: {annotation_filename}")
+            st.success(f"Loaded annotation file: {annotation_filename}")
+            # 导入时还没有审阅字段的旧文件，第一次打开时一次性写入这些字段
+            if outcome == "loaded" and dataset.migrated:
+                st.info(f"Prepared review fields for {dataset.migrated} items")
 
+        self.use_dataset(dataset)
+        data = dataset.data
         return data, annotation_filepath, dataset_name
 
+    def use_dataset(self, dataset):
+        st.session_state.dataset = dataset
+        st.session_state.store = dataset.store
+        st.session_state.save_scheduler = dataset.scheduler
+
+    def sync_dataset(self):
+        # 其他进程改了磁盘上的文件时，换成重新加载的那份数据
+        dataset = st.session_state.get('dataset')
+        if dataset is None:
+            return
+        current = get_dataset_manager().refresh(dataset)
+        if current is not dataset:
+            self.use_dataset(current)
+            st.session_state.data = current.data
+            st.info("The annotation file was changed on disk by another process and has been reloaded")
+
+    def display_data_preview(self, data, page_size=5):
+        total = len(data)
+        st.write(f"Total items: {total}")
+        if total == 0:
+            return
+        n_pages = (total + page_size - 1) // page_size
+        page = st.number_input("Preview page", min_value=1, max_value=n_pages, value=1, step=1, key="preview_page")
+        start = (page - 1) * page_size
+        st.json([to_json(data[i]) for i in range(start, min(start + page_size, total))], expanded=False)
+
+    @timed("save_annotations")
     def save_annotations(self, data, filepath):
-        with open(filepath, "w") as file:
-            json.dump(data, file, indent=4)
+        # 整体重写；同时清掉 journal，避免旧的修改再被重放到新文件上
+        store = st.session_state.get('store')
+        if store is not None and store.filepath == filepath:
+            self.flush_pending_saves()
+            store.create(to_json(item) for item in data)
+            # 分片和 sqlite 后端不会写 _annotation.json
+            METRICS.add_bytes("save_annotations", store.size_bytes())
+        else:
+            with open(filepath, "w") as file:
+                json.dump(to_json(list(data)), file, indent=4)
+            METRICS.add_bytes("save_annotations", os.path.getsize(filepath))
+
+    def prefetch_neighbours(self, data, current_index):
+        st.session_state.prefetcher.schedule(data, current_index)
+
+    def flush_pending_saves(self):
+        if st.session_state.get('save_scheduler') is not None:
+            try:
+                st.session_state.save_scheduler.flush()
+            except Exception as e:
+                # 修改仍留在队列里，调度器会继续重试
+                st.error(f"Saving failed, your changes are kept and will be retried: {e}")
+
+    def display_save_status(self):
+        scheduler = st.session_state.get('save_scheduler')
+        if scheduler is not None:
+            stats = scheduler.stats()
+            st.sidebar.caption(
+                f"Pending saves: {stats['pending']} | "
+                f"last flush {stats['last_flush_ms']:.1f} ms | avg {stats['avg_flush_ms']:.1f} ms"
+            )
+            if stats['last_error']:
+                st.sidebar.error(f"Saving failed ({stats['failed_flushes']} attempts), retrying: {stats['last_error']}")
+        live = st.session_state.widget_state.live_keys(st.session_state)
+        st.sidebar.caption(f"Widget state: {live['total']} keys ({live['item']} for the last {live['items']} items)")
+
+    def active_reviewer(self):
+        # 审阅者填写名字后进入工作队列模式
+        if st.session_state.get('dataset') is None:
+            return ""
+        return st.session_state.get('reviewer_name', '').strip()
+
+    def on_reviewer_change(self):
+        reviewer = self.active_reviewer()
+        if reviewer:
+            self.flush_pending_saves()
+            index = st.session_state.dataset.queue.claim_next(reviewer)
+            if index is not None:
+                st.session_state.current_index = index
+
+    def display_work_queue(self, data):
+        dataset = st.session_state.get('dataset')
+        if dataset is None:
+            return
+        st.sidebar.text_input("Reviewer name", key="reviewer_name", on_change=self.on_reviewer_change)
+        reviewer = self.active_reviewer()
+        if not reviewer:
+            st.sidebar.caption("Enter your name to get items from the shared work queue.")
+            return
+        queue = dataset.queue
+        # 每次 rerun 都算作活动；租约已过期的话就领取下一个空闲的 item
+        index = queue.renew(reviewer)
+        if index is None:
+            index = queue.claim_next(reviewer)
+            if index is not None and index != st.session_state.current_index:
+                st.sidebar.info(f"Your lease expired; you now have item {index}")
+        if index is None:
+            st.sidebar.success("No unreviewed items left in the queue")
+        else:
+            st.session_state.current_index = index
+            st.sidebar.caption(f"Item {index} is leased to you for {queue.expires_in(reviewer) / 60:.0f} more min")
+            if st.sidebar.button("Release item"):
+                queue.release(reviewer)
+                st.rerun()
+
+        status = dataset.status
+        st.sidebar.progress(status.items_done / status.total if status.total else 0.0,
+                            text=f"Items fully reviewed: {status.items_done}/{status.total}")
+        leases = queue.leases()
+        completed = queue.completed()
+        reviewers = sorted(set(leases) | set(completed))
+        if reviewers:
+            st.sidebar.table([
+                {"Reviewer": name, "Item": leases[name][0] if name in leases else "-", "Completed": completed.get(name, 0)}
+                for name in reviewers
+            ])
 
     def on_index_change(self):
+        self.flush_pending_saves()
         st.session_state.current_index = st.session_state.item_index
 
+    def on_search_hit(self):
+        if st.session_state.search_hit is not None:
+            self.flush_pending_saves()
+            st.session_state.current_index = st.session_state.search_hit
+
+    def display_search(self, data):
+        """侧边栏搜索（使用数据集的索引）；之后 Previous/Next 在搜索结果之间跳转"""
+        st.session_state.search_hits = None
+        dataset = st.session_state.get('dataset')
+        if dataset is None:
+            return
+        query = st.sidebar.text_input(
+            "Search items", key="search_query", placeholder="scenario:delete topic:hydrofluoric",
+            help="Words match Topic, Scenario and point/decision texts; topic:<word> matches Topic only; "
+                 "scenario:<choice> and choice:<choice> (e.g. choice:unreviewed) match review choices."
+        )
+        if not query.strip():
+            return
+        start = time.perf_counter()
+        hits = dataset.search.search(query)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if hits is None:
+            return
+        st.session_state.search_hits = hits
+        st.sidebar.caption(f"{len(hits)} matching items ({elapsed_ms:.2f} ms)")
+        if not hits:
+            return
+        # 十万条数据的全部命中都放进 selectbox 的话，发送的内容太大
+        shown = hits[:SEARCH_RESULTS_SHOWN]
+        if st.session_state.get('search_hit') not in shown:
+            st.session_state.search_hit = None
+        st.sidebar.selectbox(
+            "Matching items", shown, key="search_hit", placeholder="Jump to a matching item",
+            format_func=lambda i: f"{i}: {data[i].get('Topic', '')}", on_change=self.on_search_hit
+        )
+        if len(hits) > len(shown):
+            st.sidebar.caption(f"Showing the first {len(shown)}; Previous/Next step through all matches.")
+
     def go_previous(self):
-        if st.session_state.current_index > 0:
+        self.flush_pending_saves()
+        reviewer = self.active_reviewer()
+        if reviewer:
+            index = st.session_state.dataset.queue.claim_previous(reviewer)
+            if index is None:
+                st.toast("No earlier item of yours is free to reopen")
+            else:
+                st.session_state.current_index = index
+        elif st.session_state.get('search_hits'):
+            hits = st.session_state.search_hits
+            position = bisect.bisect_left(hits, st.session_state.current_index)
+            if position > 0:
+                st.session_state.current_index = hits[position - 1]
+        elif st.session_state.current_index > 0:
             st.session_state.current_index -= 1
 
     def go_next(self):
-        if st.session_state.current_index < len(st.session_state.data) - 1:
+        self.flush_pending_saves()
+        reviewer = self.active_reviewer()
+        if reviewer:
+            # 交还当前 item，领取下一个未审阅的
+            index = st.session_state.dataset.queue.complete_and_claim(reviewer)
+            if index is not None:
+                st.session_state.current_index = index
+        elif st.session_state.get('search_hits'):
+            hits = st.session_state.search_hits
+            position = bisect.bisect_right(hits, st.session_state.current_index)
+            if position < len(hits):
+                st.session_state.current_index = hits[position]
+        elif st.session_state.current_index < len(st.session_state.data) - 1:
             st.session_state.current_index += 1
 
     # Create a downloadable version of the file
     def provide_download(self, data, filename="new_QA_annotation.json"):
-        json_data = json.dumps(data, indent=4)  # Convert data to JSON string
+        fmt = st.sidebar.selectbox("Download format", list(EXPORT_FORMATS), key="download_format")
+        # 只在点击下载时才序列化，结果按 dataset.version 缓存到下一次修改
         if st.sidebar.download_button(
             label="Download JSON File",
-            data=json_data,
-            file_name=filename,
-            mime="application/json"
+            data=get_export_cache().payload_fn(st.session_state.dataset, fmt),
+            file_name=export_filename(filename, fmt),
+            mime=EXPORT_FORMATS[fmt][1]
         ):
-            local_path = st.session_state.annotation_filepath  # 假设这里是你保存的 JSON 文件路径
-            remote_filename = 'LabSafety/' + os.path.basename(local_path)
-            self.upload_to_jianguoyun(json_data, remote_filename)
-
-    def upload_to_jianguoyun(self, json_data, remote_filename: str):
-        username = st.secrets["nutcloud"]["username"]
-        password = st.secrets["nutcloud"]["password"]
+            self.flush_pending_saves()
+            remote_dir = 'LabSafety/' + st.session_state.dataset_name
+            self.upload_to_jianguoyun(remote_dir)
+        self.display_sync_status()
+
+    @timed("upload_to_jianguoyun")
+    def upload_to_jianguoyun(self, remote_dir: str):
+        # 只上传 store 里变化过的文件（快照 + journal / 改动的 chunk），在后台线程完成，不阻塞页面
+        get_webdav_sync().schedule(st.session_state.store, remote_dir)
+        st.sidebar.write("**Backup to Jianguoyun scheduled**")
+
+    def display_sync_status(self):
+        remote_dir = 'LabSafety/' + st.session_state.dataset_name
+        status = get_webdav_sync().status.get(remote_dir)
+        if not status:
+            return
+        if status.get("state") == "failed":
+            st.sidebar.error(f"Jianguoyun backup failed: {status['error']}")
+        elif status.get("state") == "done":
+            st.sidebar.caption(
+                f"Jianguoyun: {status['uploaded']} files uploaded ({status['bytes'] / 1024:.1f} KB), "
+                f"{status['skipped']} unchanged | {status['ms']:.0f} ms"
+            )
+        else:
+            st.sidebar.caption(f"Jianguoyun backup {status['state']}...")
+
+    def gpt_request_key(self, key):
+        # executor 是所有 session 共用的，所以请求按 session 区分
+        return f"{st.session_state.gpt_session_id}:{key}"
+
+    def submit_gpt_request(self, key, user_input, system_prompt):
+        if not user_input:
+            return False
+        get_gpt_executor().submit(self.gpt_request_key(key), user_input, system_prompt,
+                                  use_cache=not st.session_state.get('gpt_cache_bypass', False))
+        return True
+
+    def collect_gpt_answers(self):
+        """把本 session 已完成的请求移到 session_state（gpt_answer_<key>），并从共用的 executor 里删掉"""
+        executor = get_gpt_executor()
+        prefix = self.gpt_request_key("")
+        for request_key, future in executor.requests(prefix).items():
+            if not future.done():
+                continue
+            try:
+                answer = {"answer": future.result()}
+            except Exception as e:
+                answer = {"error": str(e)}
+            answer["metrics"] = executor.metrics.get(request_key)
+            # key 以 item 序号结尾，离开最近访问窗口后由 widget_state 清掉
+            st.session_state[f"gpt_answer_{request_key[len(prefix):]}"] = answer
+            executor.forget(request_key)
+
+    def display_gpt_answer(self, key):
+        future = get_gpt_executor().get(self.gpt_request_key(key))
+        if future is not None and not future.done():
+            st.info("GPT generating...")
+            return
+        self.collect_gpt_answers()
+        answer = st.session_state.get(f"gpt_answer_{key}")
+        if answer is None:
+            return
+        if "error" in answer:
+            st.error(f"GPT request failed: {answer['error']}")
+            return
+        st.markdown("**The response of GPT：**")
+        st.write(answer["answer"])
+        self.display_gpt_latency(key)
+
+    def display_gpt_latency(self, key):
+        metrics = st.session_state.get(f"gpt_answer_{key}", {}).get("metrics")
+        if metrics:
+            st.caption(f"First token: {metrics['ttft_ms']:.0f} ms | Total: {metrics['total_ms']:.0f} ms")
+
+    def display_gpt_cache_controls(self):
+        st.sidebar.checkbox("Stream GPT responses", value=True, key="gpt_streaming")
+        st.sidebar.checkbox("Bypass GPT cache", key="gpt_cache_bypass")
+        cache = get_gpt_executor().cache
+        if cache is not None:
+            stats = cache.stats()
+            st.sidebar.caption(
+                f"GPT cache: {stats['hits']} hits / {stats['misses']} misses | "
+                f"{stats['entries']} entries, {stats['bytes'] / 1024:.0f} KB"
+            )
 
+    def display_gpt_suggestion(self, item, key):
+        """显示 batch_refine.py 预先生成的 GPT 建议（如果有）"""
+        suggestion = (item.get(SUGGESTIONS_FIELD) or {}).get(key)
+        if suggestion:
+            st.info(f"**GPT suggestion:** {suggestion}")
+
+    def gpt_targets(self, item, current_index, edit_options):
+        """工作台可以挂上的字段: {key: (标签, 字段当前内容, system prompt, 是否处于编辑状态)}"""
+        targets = {}
+        targets[f"scenario_{current_index}"] = (
+            "Scenario", item.get('Scenario_modified') or item.get('Scenario', ''), REFINE_PROMPT,
+            item.get('Scenario_judge') in edit_options)
+        for a_idx, aspect in enumerate(item.get('question1_aspects', [])):
+            aspect_shown = ISSUE_ASPECTS[a_idx].replace('_', ' ') if a_idx < len(ISSUE_ASPECTS) else f"Aspect {a_idx + 1}"
+            for p_idx, point in enumerate(aspect.get('points', [])):
+                targets[f"point_{a_idx}_{p_idx}_{current_index}"] = (
+                    f"{aspect_shown}, Point {p_idx + 1}", point.get('modified_text') or point.get('original_text', ''),
+                    REFINE_PROMPT, point.get('choice') in edit_options)
+            targets[f"aspect_{a_idx}_{current_index}"] = (f"{aspect_shown}, Missing Points", "", REFINE_PROMPT, False)
+        for s_idx, situation in enumerate(item.get('question2_situations', [])):
+            targets[f"situation_{s_idx}_{current_index}"] = (
+                f"Decision {s_idx + 1}", situation.get('modified_decision') or situation.get('decision', ''),
+                REFINE_PROMPT, situation.get('choice') in edit_options)
+        targets[f"overall_{current_index}"] = ("Any request", "", ANY_REQUEST_PROMPT, False)
+        return targets
+
+    def note_edit_state(self, current_index, target, previous, chosen, edit_options):
+        """
+        选项回调里调用：字段进入或离开编辑状态时，进入编辑状态的字段挂到 GPT 工作台上，
+        并标记工作台需要刷新（它在侧边栏的另一个 fragment 里）
+        """
+        if (previous in edit_options) == (chosen in edit_options):
+            return
+        if chosen in edit_options:
+            st.session_state[f"gpt_target_{current_index}"] = target
+            drafts = st.session_state.get(f"gpt_drafts_{current_index}", {})
+            st.session_state[f"gpt_draft_{current_index}"] = drafts.get(target, "")
+        st.session_state.gpt_workbench_stale = True
+
+    def rerun_if_workbench_stale(self):
+        # fragment 重跑不会重画侧边栏的工作台，编辑状态变了就整页重跑一次
+        if st.session_state.pop('gpt_workbench_stale', False):
+            st.rerun()
+
+    @st.fragment
+    @timed("gpt_workbench")
+    def display_gpt_workbench(self, data, current_index, edit_options):
+        """
+        侧边栏里唯一的 GPT 面板，挂在选中的字段上（默认第一个处于编辑状态的字段）。
+        每个字段的草稿单独保存，所以控件数量是固定的，不随正在修改的字段数量增长。
+        """
+        targets = self.gpt_targets(data[current_index], current_index, edit_options)
+        target_key = f"gpt_target_{current_index}"
+        draft_key = f"gpt_draft_{current_index}"
+        drafts = st.session_state.setdefault(f"gpt_drafts_{current_index}", {})
+        self.collect_gpt_answers()
 
-        url = f"https://dav.jianguoyun.com/dav/{remote_filename}"
-        res = requests.put(url, data=json_data, auth=(username, password))
-        if res.status_code in [200, 201, 204]:
-            st.success(f"Successfully saved to Jianguoyun: {remote_filename}")
-            st.sidebar.write("**Successfully saved!**")
-        else:
-            st.error(f"Failed Upload: {res.status_code}, {res.text}")
-
-    def call_gpt_api(self, user_input: str, system_prompt='Refine the content:') -> str:
-        client = openai.OpenAI()
-        response = client.chat.completions.create(
-            model='gpt-4o-2024-11-20',
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_input}
-            ],
-            temperature=0.7
-        ).choices[0].message.content
-        return response
-
-    def gpt_input(self, key, system_prompt='Refine the sentences. Please only output the refined content.'):
-        st.markdown("---")
+        if st.session_state.get(target_key) not in targets:
+            st.session_state[target_key] = next((key for key, target in targets.items() if target[3]),
+                                                f"overall_{current_index}")
+            st.session_state[draft_key] = drafts.get(st.session_state[target_key], "")
 
+        def attach():
+            st.session_state[draft_key] = drafts.get(st.session_state[target_key], "")
 
-        if system_prompt == 'Refine the sentences. Please only output the refined content.':
-            st.markdown('**GPT-4o API (Sentence Refiner)**')
-            user_input = st.text_area(f"Please enter the content you need to refine. (System Prompt: {system_prompt})",
-                                      key=key,
-                                      )
+        def save_draft():
+            drafts[st.session_state[target_key]] = st.session_state[draft_key]
 
+        st.markdown("---")
+        st.markdown('**GPT-4o Workbench**')
+        # 标签要保持不变，selectbox 靠标签识别选中的选项
+        st.selectbox("Field", list(targets), key=target_key, format_func=lambda key: targets[key][0], on_change=attach)
+        target = st.session_state[target_key]
+        _, text, system_prompt, _ = targets[target]
+        if text:
+            st.caption(text)
+        if system_prompt == REFINE_PROMPT:
+            prompt_label = f"Please enter the content you need to refine. (System Prompt: {system_prompt})"
         else:
-            st.markdown('**GPT-4o API (Any Requests Here!)**')
-            user_input = st.text_area(f"Please enter any task you want GPT to complete. (System Prompt: {system_prompt})",
-                                      key=key,
-                                      )
+            prompt_label = f"Please enter any task you want GPT to complete. (System Prompt: {system_prompt})"
+        user_input = st.text_area(prompt_label, key=draft_key, on_change=save_draft)
 
+        submit_col, submit_all_col = st.columns(2)
+        submit = submit_col.button("Submit", key=f"gpt_submit_{current_index}")
+        # 一次提交所有写了草稿的字段，请求并发执行
+        submit_all = submit_all_col.button("Submit All", key=f"gpt_submit_all_{current_index}")
 
-        if st.button("Submit", key=key+'_botton'):  # 点击后执行以下操作
-            if user_input:
-                with st.spinner("GPT generating..."):
-                    answer = self.call_gpt_api(user_input, system_prompt)
-                st.markdown("**The response of GPT：**")
-                st.write(answer)
-            else:
+        streamed = False
+        if submit:
+            if not user_input:
                 st.warning("To use GPT, please enter the content and then click Submit.")
-        st.markdown("---")
+            elif st.session_state.get('gpt_streaming', True):
+                # 流式模式：逐 token 显示在工作台中
+                st.markdown("**The response of GPT：**")
+                try:
+                    st.write_stream(get_gpt_executor().stream(
+                        self.gpt_request_key(target), user_input, system_prompt,
+                        use_cache=not st.session_state.get('gpt_cache_bypass', False)))
+                    self.collect_gpt_answers()
+                    self.display_gpt_latency(target)
+                except Exception as e:
+                    st.error(f"GPT request failed: {e}")
+                streamed = True
+            elif self.submit_gpt_request(target, user_input, system_prompt):
+                with st.spinner("GPT generating..."):
+                    get_gpt_executor().wait([self.gpt_request_key(target)])
+        elif submit_all:
+            drafts[target] = user_input
+            keys = [self.gpt_request_key(key) for key, draft in drafts.items()
+                    if key in targets and self.submit_gpt_request(key, draft, targets[key][2])]
+            with st.spinner("GPT generating..."):
+                get_gpt_executor().wait(keys)
+        if not streamed:
+            self.display_gpt_answer(target)
+        running = get_gpt_executor().running([self.gpt_request_key(key) for key in targets])
+        states = {key: 'generating' if self.gpt_request_key(key) in running else 'answered'
+                  for key in targets if self.gpt_request_key(key) in running or f"gpt_answer_{key}" in st.session_state}
+        if states:
+            st.caption("GPT requests: " + ", ".join(f"{targets[key][0]} ({state})" for key, state in states.items()))
+
+    def select_point_page(self, points, aspect_shown, page_key, page_size):
+        """一个 aspect 的 Task 1 point 分页选择器，返回要渲染的 (start, stop) 区间"""
+        pages = point_pages(points, page_size)
+        if len(pages) == 1:
+            return pages[0]
+        # 默认打开第一个还有未审阅 point 的页
+        if page_key not in st.session_state or st.session_state[page_key] >= len(pages):
+            st.session_state[page_key] = first_open_page(points, pages)
+        page = st.selectbox(
+            f"{aspect_shown} points",
+            list(range(len(pages))),
+            format_func=lambda i: f"Points {pages[i][0] + 1}-{pages[i][1]} of {len(points)}",
+            key=page_key
+        )
+        return pages[page]
 
+    @timed("display_annotation_interface")
     def display_annotation_interface(self, data, current_index, show_image=False):
+        # 只保留最近访问的几个 item 的 widget key，其余的再次访问时从 data 重新初始化
+        st.session_state.widget_state.touch(st.session_state, current_index)
+        self.prefetch_neighbours(data, current_index)
         item = data[current_index]
 
         scenario_cfg = self.config.get('Scenario', {})
@@ -312,6 +778,77 @@ class AnnotationApp:
                            key='header')  # Scroll to the top of the page, 0 means instantly, but you can add a delay (im milliseconds)
             st.session_state.scroll_to_header = False  # Reset the state after scrolling
         st.markdown("---")
+        scenario_desc = item.get('Scenario', 'No scenario description available.')
+        self.display_scenario_block(data, current_index, edit_options)
+        st.markdown("**(If you choose to delete this scenario, you can directly jump to the next page.)**")
+        st.markdown("---")
+
+        # -------------------- Question 1 --------------------
+        st.markdown(f"### {q1_cfg.get('label', 'Question 1')}")
+
+        st.markdown(issues_instruction)
+        st.markdown("---")
+
+        aspects_keys = ISSUE_ASPECTS
+        aspects_shown = [
+            "Most Common Hazards",
+            "Improper Operation Issues",
+            "Negative Lab Environment Impacts",
+            "Most Likely Safety Incidents"
+        ]
+
+        # 每个 aspect 是一个 fragment：改动只重跑这个 aspect
+        for a_idx in range(len(data[current_index]['question1_aspects'])):
+            self.display_aspect(data, current_index, a_idx, aspects_shown, aspects_keys, edit_options)
+
+        # st.markdown("---")
+
+        # -------------------- Question 2 --------------------
+        st.markdown(f"### {q2_cfg.get('label', 'Question 2')}")
+
+        st.markdown(decision_instruction)
+        st.markdown("---")
+
+        st.write('**(Updated) Scenario**:')
+        if data[current_index].get('Scenario_modified', ""):
+            st.write(data[current_index].get('Scenario_modified', ""))
+        else:
+            st.write(scenario_desc)
+        st.markdown('---')
+
+        # 每个 decision 是一个 fragment
+        for s_idx in range(len(data[current_index]['question2_situations'])):
+            self.display_situation(data, current_index, s_idx, edit_options)
+
+
+        # 所有字段共用侧边栏里的一个 GPT 工作台
+        with st.sidebar:
+            self.display_gpt_workbench(data, current_index, edit_options)
+
+        prev_col, next_col = st.columns([1, 1])
+        with prev_col:
+            if st.button("Previous"):
+                self.go_previous()
+
+                st.session_state.scroll_to_header = True
+                st.rerun()
+
+        with next_col:
+            if st.button("Next"):
+                self.go_next()
+
+                st.session_state.scroll_to_header = True
+                st.rerun()
+
+
+
+
+    @st.fragment
+    @timed("scenario_fragment")
+    def display_scenario_block(self, data, current_index, edit_options):
+        # fragment：Scenario 的选择和修改只重跑这一块，不重画说明文字和下面的 Task
+        item = data[current_index]
+        scenario_cfg = self.config.get('Scenario', {})
         st.markdown('#### Scenario')
         scenario_desc = item.get('Scenario', 'No scenario description available.')
         st.write(scenario_desc)
@@ -335,7 +872,9 @@ class AnnotationApp:
 
         def update_scenario_choice():
             chosen = st.session_state[scenario_key]
+            previous = data[current_index].get('Scenario_judge', "")
             self.update_and_save(data, current_index, 'Scenario_judge', chosen, st.session_state.annotation_filepath)
+            self.note_edit_state(current_index, f"scenario_{current_index}", previous, chosen, edit_options)
             # 如果选择不属于 edit_options，则清空 modify 字段
             if chosen not in edit_options:
                 st.session_state[scenario_mod_key] = ""
@@ -349,6 +888,7 @@ class AnnotationApp:
             key=scenario_key,
             on_change=update_scenario_choice
         )
+        self.rerun_if_workbench_stale()
 
         if st.session_state[scenario_key] in ['Modify']:
             def update_scenario_mod():
@@ -380,359 +920,285 @@ class AnnotationApp:
             st.write("**Modified Scenario**:", data[current_index].get('Scenario_modified', ""))
 
         if st.session_state[scenario_key] in ['Modify']:
-            self.gpt_input(key=f"scenario_{current_index}")
-
-        st.markdown("**(If you choose to delete this scenario, you can directly jump to the next page.)**")
-        st.markdown("---")
+            self.display_gpt_suggestion(item, suggestion_key('Scenario'))
 
-        # -------------------- Question 1 --------------------
-        st.markdown(f"### {q1_cfg.get('label', 'Question 1')}")
+    @st.fragment
+    @timed("aspect_fragment")
+    def display_aspect(self, data, current_index, a_idx, aspects_shown, aspects_keys, edit_options):
+        # fragment：这里的 widget 改动只重跑（并保存）这一个 aspect
+        item = data[current_index]
+        q1_cfg = self.config.get('question1', {})
         q1_options = q1_cfg.get('options', [])
+        points_per_page = q1_cfg.get('points_per_page', 5)
+        aspect_data = item['question1_aspects'][a_idx]
+        n_points = len(aspect_data.get('points', []))
+        # 按 a_idx 索引，和下面回调里的写法一致
+        point_choice_keys = {a_idx: [f"point_choice_{a_idx}_{p_idx}_{current_index}" for p_idx in range(n_points)]}
+        point_mod_keys = {a_idx: [f"point_mod_{a_idx}_{p_idx}_{current_index}" for p_idx in range(n_points)]}
+        missing_items_keys = {a_idx: f"missing_items_text_{a_idx}_{current_index}"}
 
-        st.markdown(issues_instruction)
-        st.markdown("---")
+        st.subheader(aspects_shown[a_idx])
+        points_data = aspect_data.get('points', [])
 
-        lab_issues = item.get('LabSafety_Related_Issues', {})
-        aspects_keys = [
-            "Most_Common_Hazards",
-            "Improper_Operation_Issues",
-            "Negative_Lab_Environment_Impacts",
-            "Most_Likely_Safety_Incidents"
-        ]
-        aspects_shown = [
-            "Most Common Hazards",
-            "Improper Operation Issues",
-            "Negative Lab Environment Impacts",
-            "Most Likely Safety Incidents"
-        ]
+        # 只为当前页的 point 建 widget，不管 "Add Missing Points" 加了多少条，每次 rerun 的开销都有上限
+        start, stop = self.select_point_page(points_data, aspects_shown[a_idx], f"point_page_{a_idx}_{current_index}", points_per_page)
 
-        # 初始化 question1_aspects
-        if 'question1_aspects' not in data[current_index]:
-            data[current_index]['question1_aspects'] = []
-            for a_idx, aspect_key in enumerate(aspects_keys):
-                aspect_obj = {
-                    "aspect_name": aspect_key,
-                    "points": []
-                }
-                for p_text in lab_issues.get(aspect_key, []):
-                    aspect_obj["points"].append({
-                        "original_text": p_text,
-                        "choice": "",
-                        "modified_text": "",
-                        "comment": ""
-                    })
-                data[current_index]['question1_aspects'].append(aspect_obj)
-            self.save_annotations(data, st.session_state.annotation_filepath)
-
-        # 准备 point_choice_keys, point_mod_keys 等
-        point_choice_keys = []
-        point_mod_keys = []
-        # point_comment_keys = []
-        missing_items_keys = []
-        for a_idx, aspect_data in enumerate(data[current_index]['question1_aspects']):
-            point_choice_keys.append([])
-            point_mod_keys.append([])
-            # point_comment_keys.append([])
-            missing_items_keys.append(f"missing_items_text_{a_idx}_{current_index}")
-            for p_idx, point_info in enumerate(aspect_data.get('points', [])):
-                point_choice_keys[a_idx].append(f"point_choice_{a_idx}_{p_idx}_{current_index}")
-                point_mod_keys[a_idx].append(f"point_mod_{a_idx}_{p_idx}_{current_index}")
-                # point_comment_keys[a_idx].append(f"point_comment_{a_idx}_{p_idx}_{current_index}")
-
-        for a_idx, aspect_data in enumerate(data[current_index]['question1_aspects']):
-            st.subheader(aspects_shown[a_idx])
-            points_data = aspect_data.get('points', [])
-
-            # 遍历每个 point
-            for p_idx, point_info in enumerate(points_data):
-                point_text = point_info.get('original_text', '')
-
-                # 初始化 session_state
-                self.ensure_session_state_key(point_choice_keys[a_idx][p_idx], point_info.get('choice', ""))
-                self.ensure_session_state_key(point_mod_keys[a_idx][p_idx], point_info.get('modified_text', ""))
-                # self.ensure_session_state_key(point_comment_keys[a_idx][p_idx], point_info.get('comment', ""))
-
-                st.write(point_text)
-
-                if data[current_index]['question1_aspects'][a_idx]['points'][p_idx].get('comment', ""):
-                    st.write("**Comments**:", data[current_index]['question1_aspects'][a_idx]['points'][p_idx]['comment'])
-
-                # 如果当前 choice 不在可选项内，重置为第一个选项
-                if st.session_state[point_choice_keys[a_idx][p_idx]] not in q1_options and len(q1_options) > 0:
-                    st.session_state[point_choice_keys[a_idx][p_idx]] = q1_options[0]
-
-                def make_update_point_choice(a_index, p_index):
-                    def update_point_choice():
-                        chosen = st.session_state[point_choice_keys[a_index][p_index]]
-                        # 更新 data
-                        data[current_index]['question1_aspects'][a_index]['points'][p_index]['choice'] = chosen
-                        self.save_annotations(data, st.session_state.annotation_filepath)
-
-                        # 如果 chosen 不等于可编辑选项，则清空改写字段
-                        if chosen not in edit_options:
-                            st.session_state[point_mod_keys[a_index][p_index]] = ""
-                            # st.session_state[point_comment_keys[a_index][p_index]] = ""
-                            data[current_index]['question1_aspects'][a_index]['points'][p_index]['modified_text'] = ""
-                            self.save_annotations(data, st.session_state.annotation_filepath)
-
-                    return update_point_choice
-
-                st.radio(
-                    f"{aspects_shown[a_idx]}, Point {p_idx + 1}",
-                    q1_options,
-                    index=q1_options.index(st.session_state[point_choice_keys[a_idx][p_idx]]) if st.session_state[point_choice_keys[a_idx][p_idx]] in q1_options else 0,
-                    key=point_choice_keys[a_idx][p_idx],
-                    on_change=make_update_point_choice(a_idx, p_idx),
-                    label_visibility="collapsed"
-                )
-
-                if st.session_state[point_choice_keys[a_idx][p_idx]] in edit_options:
-                    def make_update_point_mod(a_index, p_index, mod=True):
-                        def update_point_mod():
-                            modified_text = st.session_state[point_mod_keys[a_index][p_index]]
-                            data[current_index]['question1_aspects'][a_index]['points'][p_index]['modified_text'] = modified_text
-                            self.save_annotations(data, st.session_state.annotation_filepath)
-                        # def update_point_comment():
-                        #     comment = st.session_state[point_comment_keys[a_index][p_index]]
-                        #     data[current_index]['question1_aspects'][a_index]['points'][p_index]['comment'] = comment
-                        #     self.save_annotations(data, st.session_state.annotation_filepath)
-                        if mod:
-                            return update_point_mod
-                        # else:
-                        #     return update_point_comment
-
-                    # if st.session_state[point_choice_keys[a_idx][p_idx]] == 'Modify':
-                    st.text_area(
-                        f"Revised text for {aspects_shown[a_idx]}, Point {p_idx+1}:",
-                        value=st.session_state[point_mod_keys[a_idx][p_idx]],
-                        key=point_mod_keys[a_idx][p_idx],
-                        on_change=make_update_point_mod(a_idx, p_idx)
-                    )
-                    # st.session_state[point_comment_keys[a_idx][p_idx]] = ""
-                    # data[current_index]['question1_aspects'][a_idx]['points'][p_idx]['comment'] = ""
-                    # else:
-                    #     st.text_area(
-                    #         f"Comments for {aspects_shown[a_idx]}, Point {p_idx+1}:",
-                    #         value=st.session_state[point_comment_keys[a_idx][p_idx]],
-                    #         key=point_comment_keys[a_idx][p_idx],
-                    #         on_change=make_update_point_mod(a_idx, p_idx, False)
-                    #     )
-                    #     st.session_state[point_mod_keys[a_idx][p_idx]] = ""
-                    #     data[current_index]['question1_aspects'][a_idx]['points'][p_idx]['modified_text'] = ""
-
-                if data[current_index]['question1_aspects'][a_idx]['points'][p_idx].get('modified_text', ""):
-                    st.write("**Modified Point**:", data[current_index]['question1_aspects'][a_idx]['points'][p_idx]['modified_text'])
-
-
-            # 显示添加缺失点的 text_area
-            self.ensure_session_state_key(missing_items_keys[a_idx], "")
-            st.markdown(f"**Missing Points for {aspects_shown[a_idx]} (Add new points line by line):**")
-            st.text_area(
-                "Add Missing Points:",
-                value=st.session_state[missing_items_keys[a_idx]],
-                key=missing_items_keys[a_idx]
-            )
+        # 遍历当前页的每个 point
+        for p_idx in range(start, stop):
+            point_info = points_data[p_idx]
+            point_text = point_info.get('original_text', '')
 
+            # 初始化 session_state
+            self.ensure_session_state_key(point_choice_keys[a_idx][p_idx], point_info.get('choice', ""))
+            self.ensure_session_state_key(point_mod_keys[a_idx][p_idx], point_info.get('modified_text', ""))
+            # self.ensure_session_state_key(point_comment_keys[a_idx][p_idx], point_info.get('comment', ""))
 
-            def add_missing_points(a_index):
-                lines = st.session_state[missing_items_keys[a_index]].strip().split('\n')
-                added = False
-                for line in lines:
-                    line = line.strip()
-                    if line:
-                        data[current_index]['question1_aspects'][a_index]['points'].append({
-                            "original_text": line,
-                            "choice": "",
-                            "modified_text": ""
-                        })
-                        added = True
-                if added:
-                    self.save_annotations(data, st.session_state.annotation_filepath)
-                    # 如果希望添加后自动清空输入框，可自行解除下面注释
-                    # st.session_state[missing_items_keys[a_index]] = ""
-                    st.rerun()
-
-            add_button_key = f"add_missing_points_button_{a_idx}_{current_index}"
-            if st.button("Add Missing Points", key=add_button_key):
-                add_missing_points(a_idx)
-
-            self.gpt_input(key=f"aspect_{a_idx}_{current_index}")
-
-        # st.markdown("---")
-
-        # -------------------- Question 2 --------------------
-        st.markdown(f"### {q2_cfg.get('label', 'Question 2')}")
-
-        q2_options = q2_cfg.get('options', [])
-
-        st.markdown(decision_instruction)
-        st.markdown("---")
-
-        st.write('**(Updated) Scenario**:')
-        if data[current_index].get('Scenario_modified', ""):
-            st.write(data[current_index].get('Scenario_modified', ""))
-        else:
-            st.write(scenario_desc)
-        st.markdown('---')
+            st.write(point_text)
 
-        option_consequences = item.get('Decisions', {})
-        if 'question2_situations' not in data[current_index]:
-            data[current_index]['question2_situations'] = []
-            for opt_key in range(4):
-                desc = option_consequences[opt_key].get('Decision', '')
-                cons = option_consequences[opt_key].get('Consequence', '')
-                data[current_index]['question2_situations'].append({
-                    "decision": desc,
-                    "consequence": cons,
-                    "choice": "",
-                    "modified_decision": "",
-                    "modified_consequence": "",
-                    "comment": ""
-                })
-            self.save_annotations(data, st.session_state.annotation_filepath)
-
-        situation_choice_keys = []
-        situation_mod_deci_keys = []
-        situation_mod_cons_keys = []
-        # situation_comment_keys = []
-        for s_idx, situation_info in enumerate(data[current_index]['question2_situations']):
-            situation_choice_keys.append(f"q2_situation{s_idx}_radio_{current_index}")
-            situation_mod_deci_keys.append(f"q2_situation{s_idx}_mod_{current_index}")
-            situation_mod_cons_keys.append(f"q2_situation{s_idx}_mod_cons_{current_index}")
-            # situation_comment_keys.append(f"q2_situation{s_idx}_comment_{current_index}")
-
-        for s_idx, situation_info in enumerate(data[current_index]['question2_situations']):
-            decision = situation_info.get('decision', '')
-            consequence = situation_info.get('consequence', '')
-
-            self.ensure_session_state_key(situation_choice_keys[s_idx], situation_info.get('choice', ""))
-            self.ensure_session_state_key(situation_mod_deci_keys[s_idx], situation_info.get('modified_decision', ""))
-            self.ensure_session_state_key(situation_mod_cons_keys[s_idx], situation_info.get('modified_consequence', ""))
-            # self.ensure_session_state_key(situation_comment_keys[s_idx], situation_info.get('comment', ""))
-
-            st.markdown('**Decision:**')
-            st.write( decision)
-            st.markdown('**Consequence:**')
-            st.write(consequence)
-
-            if data[current_index]['question2_situations'][s_idx].get('comment', ""):
-                st.write("**Comments**:", data[current_index]['question2_situations'][s_idx]['comment'])
+            if data[current_index]['question1_aspects'][a_idx]['points'][p_idx].get('comment', ""):
+                st.write("**Comments**:", data[current_index]['question1_aspects'][a_idx]['points'][p_idx]['comment'])
 
             # 如果当前 choice 不在可选项内，重置为第一个选项
-            if st.session_state[situation_choice_keys[s_idx]] not in q2_options and len(q2_options) > 0:
-                st.session_state[situation_choice_keys[s_idx]] = q2_options[0]
-
-            def make_update_situation_choice(s_index):
-                def update_situation_choice():
-                    chosen = st.session_state[situation_choice_keys[s_index]]
-                    data[current_index]['question2_situations'][s_index]['choice'] = chosen
-                    self.save_annotations(data, st.session_state.annotation_filepath)
-
+            if st.session_state[point_choice_keys[a_idx][p_idx]] not in q1_options and len(q1_options) > 0:
+                st.session_state[point_choice_keys[a_idx][p_idx]] = q1_options[0]
+
+            def make_update_point_choice(a_index, p_index):
+                def update_point_choice():
+                    chosen = st.session_state[point_choice_keys[a_index][p_index]]
+                    previous = data[current_index]['question1_aspects'][a_index]['points'][p_index].get('choice', "")
+                    # 更新 data
+                    self.update_and_save(data, current_index, ('question1_aspects', a_index, 'points', p_index, 'choice'), chosen, st.session_state.annotation_filepath)
+                    self.note_edit_state(current_index, f"point_{a_index}_{p_index}_{current_index}", previous, chosen, edit_options)
+
+                    # 如果 chosen 不等于可编辑选项，则清空改写字段
                     if chosen not in edit_options:
-                        st.session_state[situation_mod_deci_keys[s_index]] = ""
-                        st.session_state[situation_mod_cons_keys[s_index]] = ""
-                        # st.session_state[situation_comment_keys[s_index]] = ""
-                        data[current_index]['question2_situations'][s_index]['modified_decision'] = ""
-                        data[current_index]['question2_situations'][s_index]['modified_consequence'] = ""
-                        # data[current_index]['question2_situations'][s_index]['comment'] = ""
-                        self.save_annotations(data, st.session_state.annotation_filepath)
-                return update_situation_choice
+                        st.session_state[point_mod_keys[a_index][p_index]] = ""
+                        # st.session_state[point_comment_keys[a_index][p_index]] = ""
+                        self.update_and_save(data, current_index, ('question1_aspects', a_index, 'points', p_index, 'modified_text'), "", st.session_state.annotation_filepath)
+
+                return update_point_choice
 
             st.radio(
-                f"Decision {s_idx+1}",
-                q2_options,
-                index=q2_options.index(st.session_state[situation_choice_keys[s_idx]]) if st.session_state[situation_choice_keys[s_idx]] in q2_options else 0,
-                key=situation_choice_keys[s_idx],
-                on_change=make_update_situation_choice(s_idx),
+                f"{aspects_shown[a_idx]}, Point {p_idx + 1}",
+                q1_options,
+                index=q1_options.index(st.session_state[point_choice_keys[a_idx][p_idx]]) if st.session_state[point_choice_keys[a_idx][p_idx]] in q1_options else 0,
+                key=point_choice_keys[a_idx][p_idx],
+                on_change=make_update_point_choice(a_idx, p_idx),
                 label_visibility="collapsed"
             )
-
-            if st.session_state[situation_choice_keys[s_idx]] in edit_options:
-                def make_update_situation_mod(si_index, mod=True, mod_decision=True):
-                    def update_situation_mod_deci():
-                        modified_text = st.session_state[situation_mod_deci_keys[si_index]]
-                        data[current_index]['question2_situations'][si_index]['modified_decision'] = modified_text
-                        self.save_annotations(data, st.session_state.annotation_filepath)
-                    def update_situation_mod_cons():
-                        modified_text = st.session_state[situation_mod_cons_keys[si_index]]
-                        data[current_index]['question2_situations'][si_index]['modified_consequence'] = modified_text
-                        self.save_annotations(data, st.session_state.annotation_filepath)
-                    # def update_situation_comment():
-                    #     modified_text = st.session_state[situation_comment_keys[si_index]]
-                    #     data[current_index]['question2_situations'][si_index]['comment'] = modified_text
+            self.rerun_if_workbench_stale()
+
+            if st.session_state[point_choice_keys[a_idx][p_idx]] in edit_options:
+                self.display_gpt_suggestion(item, suggestion_key('LabSafety_Related_Issues', aspects_keys[a_idx], p_idx))
+
+                def make_update_point_mod(a_index, p_index, mod=True):
+                    def update_point_mod():
+                        modified_text = st.session_state[point_mod_keys[a_index][p_index]]
+                        self.update_and_save(data, current_index, ('question1_aspects', a_index, 'points', p_index, 'modified_text'), modified_text, st.session_state.annotation_filepath)
+                    # def update_point_comment():
+                    #     comment = st.session_state[point_comment_keys[a_index][p_index]]
+                    #     data[current_index]['question1_aspects'][a_index]['points'][p_index]['comment'] = comment
                     #     self.save_annotations(data, st.session_state.annotation_filepath)
                     if mod:
-                        if mod_decision:
-                            return update_situation_mod_deci
-                        return update_situation_mod_cons
-                    # return update_situation_comment
+                        return update_point_mod
+                    # else:
+                    #     return update_point_comment
 
-                # if st.session_state[situation_choice_keys[s_idx]] == 'Modify':
+                # if st.session_state[point_choice_keys[a_idx][p_idx]] == 'Modify':
                 st.text_area(
-                    f"Revised Decision {s_idx}:",
-                    value=st.session_state[situation_mod_deci_keys[s_idx]],
-                    key=situation_mod_deci_keys[s_idx],
-                    on_change=make_update_situation_mod(s_idx),
+                    f"Revised text for {aspects_shown[a_idx]}, Point {p_idx+1}:",
+                    value=st.session_state[point_mod_keys[a_idx][p_idx]],
+                    key=point_mod_keys[a_idx][p_idx],
+                    on_change=make_update_point_mod(a_idx, p_idx)
                 )
-                st.text_area(
-                    f"Revised Consequence of Decision {s_idx}:",
-                    value=st.session_state[situation_mod_cons_keys[s_idx]],
-                    key=situation_mod_cons_keys[s_idx],
-                    on_change=make_update_situation_mod(s_idx, True, False),
-                )
-                # st.session_state[situation_comment_keys[s_idx]] = ""
-                data[current_index]['question2_situations'][s_idx]['comment'] = ""
+                # st.session_state[point_comment_keys[a_idx][p_idx]] = ""
+                # data[current_index]['question1_aspects'][a_idx]['points'][p_idx]['comment'] = ""
                 # else:
                 #     st.text_area(
-                #         f"Comments:",
-                #         value=st.session_state[situation_comment_keys[s_idx]],
-                #         key=situation_comment_keys[s_idx],
-                #         on_change=make_update_situation_mod(s_idx, False, False),
+                #         f"Comments for {aspects_shown[a_idx]}, Point {p_idx+1}:",
+                #         value=st.session_state[point_comment_keys[a_idx][p_idx]],
+                #         key=point_comment_keys[a_idx][p_idx],
+                #         on_change=make_update_point_mod(a_idx, p_idx, False)
                 #     )
-                #     st.session_state[situation_mod_deci_keys[s_idx]] = ""
-                #     st.session_state[situation_mod_cons_keys[s_idx]] = ""
-                #     data[current_index]['question2_situations'][s_idx]['modified_decision'] = ""
-                #     data[current_index]['question2_situations'][s_idx]['modified_consequence'] = ""
-
+                #     st.session_state[point_mod_keys[a_idx][p_idx]] = ""
+                #     data[current_index]['question1_aspects'][a_idx]['points'][p_idx]['modified_text'] = ""
 
-            if data[current_index]['question2_situations'][s_idx].get('modified_decision', ""):
-                st.write("**Modified Decision**:", data[current_index]['question2_situations'][s_idx]['modified_decision'])
-            if data[current_index]['question2_situations'][s_idx].get('modified_consequence', ""):
-                st.write("**Modified Consequence**:", data[current_index]['question2_situations'][s_idx]['modified_consequence'])
+            if data[current_index]['question1_aspects'][a_idx]['points'][p_idx].get('modified_text', ""):
+                st.write("**Modified Point**:", data[current_index]['question1_aspects'][a_idx]['points'][p_idx]['modified_text'])
 
-            if st.session_state[situation_choice_keys[s_idx]] in edit_options:
-                self.gpt_input(key=f"situation_{s_idx}_{current_index}")
 
+        # 显示添加缺失点的 text_area
+        self.ensure_session_state_key(missing_items_keys[a_idx], "")
+        st.markdown(f"**Missing Points for {aspects_shown[a_idx]} (Add new points line by line):**")
+        st.text_area(
+            "Add Missing Points:",
+            value=st.session_state[missing_items_keys[a_idx]],
+            key=missing_items_keys[a_idx]
+        )
 
-        self.gpt_input(key=f"overall_{current_index}", system_prompt='You are a helpful assistant.')
-
-        prev_col, next_col = st.columns([1, 1])
-        with prev_col:
-            if st.button("Previous"):
-                if st.session_state.current_index > 0:
-                    st.session_state.current_index -= 1
-
-                st.session_state.scroll_to_header = True
-                st.rerun()
 
-        with next_col:
-            if st.button("Next"):
-                if st.session_state.current_index < len(st.session_state.data) - 1:
-                    st.session_state.current_index += 1
+        def add_missing_points(a_index):
+            lines = st.session_state[missing_items_keys[a_index]].strip().split('\n')
+            new_points = []
+            for line in lines:
+                line = line.strip()
+                if line:
+                    new_points.append({
+                        "original_text": line,
+                        "choice": "",
+                        "modified_text": ""
+                    })
+            if new_points:
+                self.update_and_save(data, current_index, ('question1_aspects', a_index, 'points'), data[current_index]['question1_aspects'][a_index]['points'] + new_points, st.session_state.annotation_filepath)
+                # 如果希望添加后自动清空输入框，可自行解除下面注释
+                # st.session_state[missing_items_keys[a_index]] = ""
+                rerun_fragment()
+
+        add_button_key = f"add_missing_points_button_{a_idx}_{current_index}"
+        if st.button("Add Missing Points", key=add_button_key):
+            add_missing_points(a_idx)
+
+    @st.fragment
+    @timed("situation_fragment")
+    def display_situation(self, data, current_index, s_idx, edit_options):
+        # fragment：改动只重跑（并保存）这一个 decision
+        item = data[current_index]
+        q2_options = self.config.get('question2', {}).get('options', [])
+        situation_info = item['question2_situations'][s_idx]
+        situation_choice_keys = {s_idx: f"q2_situation{s_idx}_radio_{current_index}"}
+        situation_mod_deci_keys = {s_idx: f"q2_situation{s_idx}_mod_{current_index}"}
+        situation_mod_cons_keys = {s_idx: f"q2_situation{s_idx}_mod_cons_{current_index}"}
+
+        decision = situation_info.get('decision', '')
+        consequence = situation_info.get('consequence', '')
+
+        self.ensure_session_state_key(situation_choice_keys[s_idx], situation_info.get('choice', ""))
+        self.ensure_session_state_key(situation_mod_deci_keys[s_idx], situation_info.get('modified_decision', ""))
+        self.ensure_session_state_key(situation_mod_cons_keys[s_idx], situation_info.get('modified_consequence', ""))
+        # self.ensure_session_state_key(situation_comment_keys[s_idx], situation_info.get('comment', ""))
+
+        st.markdown('**Decision:**')
+        st.write( decision)
+        st.markdown('**Consequence:**')
+        st.write(consequence)
+
+        if data[current_index]['question2_situations'][s_idx].get('comment', ""):
+            st.write("**Comments**:", data[current_index]['question2_situations'][s_idx]['comment'])
+
+        # 如果当前 choice 不在可选项内，重置为第一个选项
+        if st.session_state[situation_choice_keys[s_idx]] not in q2_options and len(q2_options) > 0:
+            st.session_state[situation_choice_keys[s_idx]] = q2_options[0]
+
+        def make_update_situation_choice(s_index):
+            def update_situation_choice():
+                chosen = st.session_state[situation_choice_keys[s_index]]
+                previous = data[current_index]['question2_situations'][s_index].get('choice', "")
+                self.update_and_save(data, current_index, ('question2_situations', s_index, 'choice'), chosen, st.session_state.annotation_filepath)
+                self.note_edit_state(current_index, f"situation_{s_index}_{current_index}", previous, chosen, edit_options)
+
+                if chosen not in edit_options:
+                    st.session_state[situation_mod_deci_keys[s_index]] = ""
+                    st.session_state[situation_mod_cons_keys[s_index]] = ""
+                    # st.session_state[situation_comment_keys[s_index]] = ""
+                    self.update_and_save(data, current_index, ('question2_situations', s_index, 'modified_decision'), "", st.session_state.annotation_filepath)
+                    self.update_and_save(data, current_index, ('question2_situations', s_index, 'modified_consequence'), "", st.session_state.annotation_filepath)
+                    # data[current_index]['question2_situations'][s_index]['comment'] = ""
+            return update_situation_choice
 
-                st.session_state.scroll_to_header = True
-                st.rerun()
+        st.radio(
+            f"Decision {s_idx+1}",
+            q2_options,
+            index=q2_options.index(st.session_state[situation_choice_keys[s_idx]]) if st.session_state[situation_choice_keys[s_idx]] in q2_options else 0,
+            key=situation_choice_keys[s_idx],
+            on_change=make_update_situation_choice(s_idx),
+            label_visibility="collapsed"
+        )
+        self.rerun_if_workbench_stale()
+
+        if st.session_state[situation_choice_keys[s_idx]] in edit_options:
+            def make_update_situation_mod(si_index, mod=True, mod_decision=True):
+                def update_situation_mod_deci():
+                    modified_text = st.session_state[situation_mod_deci_keys[si_index]]
+                    self.update_and_save(data, current_index, ('question2_situations', si_index, 'modified_decision'), modified_text, st.session_state.annotation_filepath)
+                def update_situation_mod_cons():
+                    modified_text = st.session_state[situation_mod_cons_keys[si_index]]
+                    self.update_and_save(data, current_index, ('question2_situations', si_index, 'modified_consequence'), modified_text, st.session_state.annotation_filepath)
+                # def update_situation_comment():
+                #     modified_text = st.session_state[situation_comment_keys[si_index]]
+                #     data[current_index]['question2_situations'][si_index]['comment'] = modified_text
+                #     self.save_annotations(data, st.session_state.annotation_filepath)
+                if mod:
+                    if mod_decision:
+                        return update_situation_mod_deci
+                    return update_situation_mod_cons
+                # return update_situation_comment
+
+            # if st.session_state[situation_choice_keys[s_idx]] == 'Modify':
+            st.text_area(
+                f"Revised Decision {s_idx}:",
+                value=st.session_state[situation_mod_deci_keys[s_idx]],
+                key=situation_mod_deci_keys[s_idx],
+                on_change=make_update_situation_mod(s_idx),
+            )
+            st.text_area(
+                f"Revised Consequence of Decision {s_idx}:",
+                value=st.session_state[situation_mod_cons_keys[s_idx]],
+                key=situation_mod_cons_keys[s_idx],
+                on_change=make_update_situation_mod(s_idx, True, False),
+            )
+            # st.session_state[situation_comment_keys[s_idx]] = ""
+            self.update_and_save(data, current_index, ('question2_situations', s_idx, 'comment'), "", st.session_state.annotation_filepath)
+            # else:
+            #     st.text_area(
+            #         f"Comments:",
+            #         value=st.session_state[situation_comment_keys[s_idx]],
+            #         key=situation_comment_keys[s_idx],
+            #         on_change=make_update_situation_mod(s_idx, False, False),
+            #     )
+            #     st.session_state[situation_mod_deci_keys[s_idx]] = ""
+            #     st.session_state[situation_mod_cons_keys[s_idx]] = ""
+            #     data[current_index]['question2_situations'][s_idx]['modified_decision'] = ""
+            #     data[current_index]['question2_situations'][s_idx]['modified_consequence'] = ""
 
 
+        if data[current_index]['question2_situations'][s_idx].get('modified_decision', ""):
+            st.write("**Modified Decision**:", data[current_index]['question2_situations'][s_idx]['modified_decision'])
+        if data[current_index]['question2_situations'][s_idx].get('modified_consequence', ""):
+            st.write("**Modified Consequence**:", data[current_index]['question2_situations'][s_idx]['modified_consequence'])
 
+        if st.session_state[situation_choice_keys[s_idx]] in edit_options:
+            self.display_gpt_suggestion(item, suggestion_key('Decisions', s_idx))
 
     def display_overall_status(self, data):
+        # 共享数据集在首次使用时才构建计数器，之后随所有会话的编辑保持最新
+        dataset = st.session_state.get('dataset')
+        status = dataset.status if dataset is not None else st.session_state.get('status')
+        if status is None:
+            status = st.session_state.status = StatusCounters.from_data(data, 'Scenario_judge')
+        scenario_options = self.config.get('Scenario', {}).get('options', [])
+        q1_options = self.config.get('question1', {}).get('options', [])
+        q2_options = self.config.get('question2', {}).get('options', [])
+
         st.sidebar.subheader("Overall Status of Annotations:")
         st.sidebar.markdown("---")
-        total = len(data)
-        conform_count = sum(1 for d in data if d.get('scenario') == 'Conform')
-        st.sidebar.write(f"Scenario Conform Count: {conform_count}/{total}")
-
+        completion = status.completion()
+        st.sidebar.progress(completion, text=f"Completion: {completion:.1%}")
+        st.sidebar.write(f"Scenarios reviewed: {status.scenario_reviewed()}/{status.total}")
+        for option in scenario_options:
+            st.sidebar.write(f"Scenario {option} Count: {status.scenario[option]}/{status.total}")
+
+        st.sidebar.markdown(f"**Task 1 points reviewed: {status.points_reviewed}/{status.points_total}**")
+        st.sidebar.table([
+            {"Aspect": aspect.replace('_', ' '), **{option: counts[option] for option in q1_options}, "Pending": counts[""]}
+            for aspect, counts in status.aspects.items()
+        ])
+        st.sidebar.markdown(f"**Task 2 decisions reviewed: {status.situations_reviewed}/{status.situations_total}**")
+        st.sidebar.table([
+            {"Decision": situation, **{option: counts[option] for option in q2_options}, "Pending": counts[""]}
+            for situation, counts in status.situations.items()
+        ])
+
+    @timed("run")
     def run(self):
         # Step 1: Initialize scroll state in session_state
         if 'scroll_to_top' not in st.session_state:
@@ -755,6 +1221,8 @@ class AnnotationApp:
             st.session_state.scroll_to_header = True
 
         st.sidebar.title("Navigation")
+        self.display_startup_time()
+        self.display_metrics_panel()
         page = st.sidebar.selectbox("Go to", ["Configuration", "Lab Safety Data Review Platform"], label_visibility="collapsed")
 
         if page == "Configuration":
@@ -764,29 +1232,36 @@ class AnnotationApp:
                 data, annotation_filepath, dataset_name = self.load_data_file(uploaded_file)
                 st.session_state.annotation_filepath = annotation_filepath
                 st.session_state.dataset_name = dataset_name
-                st.write("JSON Data:", data)
+                self.display_data_preview(data)
                 st.session_state.data = data
                 st.session_state.current_index = 0
                 st.success("All keys are considered selected. Proceed to the annotation platforms.")
 
         elif page == "Lab Safety Data Review Platform":
             st.title("Lab Safety Data Review Platform")
+            self.sync_dataset()
             if st.session_state.data:
                 data = st.session_state.data
-                st.sidebar.number_input(
-                    "Select Item Index",
-                    min_value=0,
-                    max_value=len(data) - 1,
-                    value=st.session_state.current_index,
-                    step=1,
-                    key="item_index",
-                    on_change=self.on_index_change
-                )
+                self.display_work_queue(data)
+                if not self.active_reviewer():
+                    # 只有不在工作队列里的单人审阅才能手动选 index
+                    st.sidebar.number_input(
+                        "Select Item Index",
+                        min_value=0,
+                        max_value=len(data) - 1,
+                        value=st.session_state.current_index,
+                        step=1,
+                        key="item_index",
+                        on_change=self.on_index_change
+                    )
+                    self.display_search(data)
                 st.sidebar.markdown(f'Total items: {len(data)}')
+                self.display_save_status()
+                self.display_gpt_cache_controls()
                 current_index = st.session_state.current_index
                 self.display_annotation_interface(data, current_index, show_image=False)
 
-                if st.sidebar.button("Show Status"):
+                if st.sidebar.checkbox("Show Status", key="show_status"):
                     self.display_overall_status(data)
 
                 # 下载按钮
@@ -794,8 +1269,12 @@ class AnnotationApp:
 
 
 if __name__ == "__main__":
+    rerun_start = time.perf_counter()
     app = AnnotationApp()
+    st.session_state.startup_ms = (time.perf_counter() - rerun_start) * 1000
+    METRICS.observe("startup", st.session_state.startup_ms / 1000)
     app.run()
+    METRICS.maybe_export(app.config.get('instrumentation'))
 
 
 
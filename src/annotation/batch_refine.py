@@ -0,0 +1,214 @@
+"""
+Offline GPT pre-refinement of a whole annotation file.
+
+Runs every Scenario, lab-safety issue point and decision/consequence entry through the
+same GPT refiner the review UI uses, and stores the suggestions in `gpt_suggestions` on
+each item, so reviewers open items that already have them.
+
+    python src/annotation/batch_refine.py data/<dataset>/<dataset>_annotation.json --workers 4 --rpm 60
+
+Completed requests are appended to `<dataset>_annotation.refine_checkpoint.jsonl`; rerunning
+the same command resumes where it stopped. Point `--base-url` at any OpenAI-compatible
+server (e.g. a local stub) to test without calling the real API.
+
+Stop the review server first: it keeps the dataset in memory and writes the same store
+files. The dataset's lock file enforces this; the script exits while a server has the
+dataset open, and the server will not open it while the script runs.
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import openai
+import yaml
+
+from prompts import scenario_instruction, issues_instruction, decision_instruction
+from gpt_client import GPTExecutor, DEFAULT_MODEL
+from storage import open_store, DatasetLock, DatasetLockedError
+
+SUGGESTIONS_FIELD = 'gpt_suggestions'
+
+SYSTEM_PROMPTS = {
+    'scenario': scenario_instruction,
+    'issue': issues_instruction,
+    'decision': decision_instruction,
+}
+REFINE_REQUEST = ("\n\n---\n\nYou are assisting the expert described above. Suggest a refined version of the "
+                  "following {kind}. Please only output the refined content.")
+
+
+def suggestion_key(*parts):
+    """Key of one suggestion inside item['gpt_suggestions'], e.g. 'Decisions/2'."""
+    return '/'.join(str(part) for part in parts)
+
+
+def refinement_targets(item):
+    """Yield (suggestion_key, kind, text) for everything in an item that can be refined."""
+    if item.get('Scenario'):
+        yield suggestion_key('Scenario'), 'scenario', item['Scenario']
+
+    for issues_field in ('LabSafety_Related_Issues', 'LabSafetyRelatedIssues'):
+        for aspect, points in (item.get(issues_field) or {}).items():
+            for p_idx, text in enumerate(points or []):
+                yield suggestion_key(issues_field, aspect, p_idx), 'issue', text
+
+    for d_idx, decision in enumerate(item.get('Decisions') or []):
+        text = f"Decision: {decision.get('Decision', '')}\n\nConsequence: {decision.get('Consequence', '')}"
+        yield suggestion_key('Decisions', d_idx), 'decision', text
+    for opt_key, option in (item.get('OptionConsequences') or {}).items():
+        text = f"Decision: {option.get('Description', '')}\n\nConsequence: {option.get('Consequence', '')}"
+        yield suggestion_key('OptionConsequences', opt_key), 'decision', text
+
+
+class RateLimiter:
+    """Spaces request starts so that at most `rpm` requests begin per minute."""
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class Checkpoint:
+    """Append-only record of finished requests so an interrupted run can resume."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    self.done.setdefault(entry["i"], {})[entry["key"]] = entry["suggestion"]
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+
+    def add(self, index, key, suggestion):
+        with self._lock:
+            self._file.write(json.dumps({"i": index, "key": key, "suggestion": suggestion}) + "\n")
+            self._file.flush()
+            self.done.setdefault(index, {})[key] = suggestion
+
+    def close(self):
+        self._file.close()
+
+
+def refine_dataset(annotation_filepath, executor, storage_cfg=None, workers=4, rpm=60,
+                   model=DEFAULT_MODEL, limit=None, log=print):
+    lock = DatasetLock(annotation_filepath, "batch_refine.py")
+    lock.acquire()
+    try:
+        return _refine_dataset(annotation_filepath, executor, storage_cfg, workers, rpm, model, limit, log)
+    finally:
+        lock.release()
+
+
+def _refine_dataset(annotation_filepath, executor, storage_cfg, workers, rpm, model, limit, log):
+    store = open_store(annotation_filepath, storage_cfg)
+    data = store.load()
+    checkpoint = Checkpoint(os.path.splitext(annotation_filepath)[0] + '.refine_checkpoint.jsonl')
+    limiter = RateLimiter(rpm)
+
+    def run_one(index, key, kind, text):
+        limiter.acquire()
+        system_prompt = SYSTEM_PROMPTS[kind] + REFINE_REQUEST.format(kind=kind)
+        return index, key, executor.complete(text, system_prompt, model=model)
+
+    def flush_item(index):
+        suggestions = dict(data[index].get(SUGGESTIONS_FIELD) or {})
+        suggestions.update(checkpoint.done.get(index, {}))
+        if suggestions != data[index].get(SUGGESTIONS_FIELD):
+            data[index][SUGGESTIONS_FIELD] = suggestions
+            store.record(index, SUGGESTIONS_FIELD, suggestions)
+
+    n_items = len(data) if limit is None else min(limit, len(data))
+    remaining = {}
+    requested = failed = 0
+    inflight = set()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for index in range(n_items):
+            item = data[index]
+            have = dict(item.get(SUGGESTIONS_FIELD) or {})
+            have.update(checkpoint.done.get(index, {}))
+            todo = [t for t in refinement_targets(item) if t[0] not in have]
+            remaining[index] = len(todo)
+            if not todo:
+                flush_item(index)
+                continue
+            for key, kind, text in todo:
+                # Keep the queue bounded so huge datasets are not all scheduled up front
+                while len(inflight) >= workers * 2:
+                    finished, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                    failed += _collect(finished, checkpoint, remaining, flush_item, log)
+                inflight.add(pool.submit(run_one, index, key, kind, text))
+                requested += 1
+        finished, _ = wait(inflight)
+        failed += _collect(finished, checkpoint, remaining, flush_item, log)
+    finally:
+        pool.shutdown(wait=True)
+        checkpoint.close()
+        store.close()
+
+    log(f"Requested {requested} refinements for {n_items} items, {failed} failed")
+    if failed == 0 and n_items == len(data) and os.path.exists(checkpoint.path):
+        os.remove(checkpoint.path)
+    return requested, failed
+
+
+def _collect(finished, checkpoint, remaining, flush_item, log):
+    failed = 0
+    for future in finished:
+        try:
+            index, key, suggestion = future.result()
+        except Exception as e:
+            log(f"Request failed: {e}")
+            failed += 1
+            continue
+        checkpoint.add(index, key, suggestion)
+        remaining[index] -= 1
+        if remaining[index] == 0:
+            flush_item(index)
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-compute GPT refinement suggestions for an annotation file.")
+    parser.add_argument("annotation_file", help="data/<dataset>/<dataset>_annotation.json")
+    parser.add_argument("--config", default="src/config/annotation_config.yaml", help="YAML config with the storage section")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=60, help="max requests started per minute (0 = unlimited)")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--limit", type=int, default=None, help="only process the first N items")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible endpoint, e.g. a local stub server")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    storage_cfg = None
+    if os.path.exists(args.config):
+        with open(args.config, "r") as file:
+            storage_cfg = (yaml.safe_load(file) or {}).get('storage')
+
+    client = openai.OpenAI(base_url=args.base_url) if args.base_url else openai.OpenAI()
+    executor = GPTExecutor(client=client, max_workers=args.workers, timeout=args.timeout)
+    try:
+        refine_dataset(args.annotation_file, executor, storage_cfg, workers=args.workers, rpm=args.rpm,
+                       model=args.model, limit=args.limit)
+    except DatasetLockedError as e:
+        raise SystemExit(f"{e}; stop it before refining this dataset")
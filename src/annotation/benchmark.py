@@ -0,0 +1,288 @@
+"""
+Benchmarks for the persistence and render hot paths of the review apps.
+
+Generates synthetic LabSafety datasets (Scenario / LabSafetyRelatedIssues / OptionConsequences
+for `annotation.py`, LabSafety_Related_Issues / Decisions for `annotation_all*.py`) and times,
+inside a headless Streamlit AppTest session, the app's own methods: `load_data_file` (import
+of an upload and reopening the saved file), `update_and_save`, `save_annotations`, the
+`provide_download` serialization for every export format, sidebar search queries,
+`display_overall_status` and `display_annotation_interface`.
+
+    python src/annotation/benchmark.py --sizes 100 1000 10000 100000 --backend journal sqlite
+    python src/annotation/benchmark.py --save        # store the results as the new baseline
+
+Each case reports the median of `--repeat` runs. Results are compared with the stored baseline
+(`benchmark_baseline.json` next to this file); a case slower than baseline * (1 + tolerance)
+is reported as a regression and the command exits with status 1. Timings are machine
+specific, so refresh the baseline with `--save` when moving to another machine. The 100k
+size needs well over 6 GB of memory (the export builds the whole JSON), so it is not part of
+the default sizes.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+
+import streamlit
+from streamlit.testing.v1 import AppTest
+
+from review_items import ISSUE_ASPECTS, LEGACY_ISSUE_ASPECTS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(HERE))
+DEFAULT_BASELINE = os.path.join(HERE, "benchmark_baseline.json")
+
+# app module -> uses the legacy LabSafetyRelatedIssues / OptionConsequences schema
+APPS = {
+    "annotation": True,
+    "annotation_all": False,
+    "annotation_all2": False,
+}
+
+WORDS = ("fume hood", "nitrile gloves", "hydrofluoric acid", "waste container", "centrifuge", "spill kit",
+         "eyewash station", "flammable solvent", "gas cylinder", "autoclave", "lab coat", "ventilation",
+         "sodium azide", "heating mantle", "sharps", "biosafety cabinet", "label", "pressure", "exposure")
+
+
+def _sentence(rng, n_words):
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + "."
+
+
+def synthetic_item(i, legacy=True, rng=None):
+    """One generated item shaped like the real datasets, with similar text lengths."""
+    rng = rng or random.Random(i)
+    item = {
+        "Topic": f"Topic {i}: {rng.choice(WORDS)}",
+        "Scenario": " ".join(_sentence(rng, 12) for _ in range(rng.randint(3, 6))),
+    }
+    aspects = LEGACY_ISSUE_ASPECTS if legacy else ISSUE_ASPECTS
+    issues = {aspect: [_sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(3, 5))] for aspect in aspects}
+    if legacy:
+        item["LabSafetyRelatedIssues"] = issues
+        item["OptionConsequences"] = {key: {"Description": _sentence(rng, 15), "Consequence": _sentence(rng, 20)}
+                                      for key in "ABCD"}
+    else:
+        item["LabSafety_Related_Issues"] = issues
+        item["Decisions"] = [{"Decision": _sentence(rng, 15), "Consequence": _sentence(rng, 20)} for _ in range(4)]
+    return item
+
+
+def write_dataset(path, n_items, legacy=True, seed=0):
+    """Stream `n_items` synthetic items into a JSON array file (same content for the same seed)."""
+    rng = random.Random(seed)
+    with open(path, "w") as file:
+        file.write("[")
+        for i in range(n_items):
+            if i:
+                file.write(",\n")
+            json.dump(synthetic_item(i, legacy, rng), file)
+        file.write("]")
+
+
+def _bench_script(app_module, upload_path, storage_cfg, repeat, edits):
+    # Runs as the AppTest script, so it must be self-contained. The first run times the
+    # persistence paths; every rerun after it renders the page once, like a reviewer's rerun
+    # (widgets cannot be drawn twice in one run).
+    import time
+    import shutil
+    import importlib
+    import statistics
+    import streamlit as st
+    from export import ExportCache, EXPORT_FORMATS
+
+    module = importlib.import_module(app_module)
+    app = module.AnnotationApp()
+    app.config['storage'] = storage_cfg
+    scenario_field = 'scenario_reality' if app_module == 'annotation' else 'Scenario_judge'
+    scenario_options = app.config.get(scenario_field if app_module == 'annotation' else 'Scenario', {}).get('options', [])
+    q1_options = app.config.get('question1', {}).get('options', [])
+
+    if 'bench_results' in st.session_state:
+        data = st.session_state.data
+        # Normally set up by run() in annotation_all*.py
+        st.session_state.setdefault('scroll_to_header', False)
+        for name, render in (("display_overall_status", lambda: app.display_overall_status(data)),
+                             ("display_annotation_interface", lambda: app.display_annotation_interface(data, len(data) // 2))):
+            start = time.perf_counter()
+            render()
+            st.session_state.bench_renders.setdefault(name, []).append(time.perf_counter() - start)
+        return
+
+    results = {}
+
+    def measure(name, fn, setup=None):
+        runs = []
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            fn()
+            runs.append(time.perf_counter() - start)
+        results[name] = statistics.median(runs)
+
+    def close_dataset():
+        # Drop the previous round's copy before loading again, as a server restart would
+        dataset = st.session_state.get('dataset')
+        if dataset is not None:
+            dataset.scheduler.close()
+            dataset.store.close()
+        st.session_state.dataset = st.session_state.data = None
+        module.get_dataset_manager.clear()
+
+    def fresh_import():
+        close_dataset()
+        shutil.rmtree('data', ignore_errors=True)
+
+    def load():
+        with open(upload_path, 'rb') as upload:
+            data, filepath, _ = app.load_data_file(upload)
+        st.session_state.data = data
+        st.session_state.annotation_filepath = filepath
+
+    measure("load_data_file (import)", load, setup=fresh_import)
+    measure("load_data_file (reopen)", load, setup=close_dataset)
+
+    data = st.session_state.data
+    filepath = st.session_state.annotation_filepath
+    step = max(1, len(data) // edits)
+    targets = [i * step % len(data) for i in range(edits)]
+    rounds = [0]
+
+    def edit_batch():
+        # Alternate the values so that every call is a real change
+        rounds[0] += 1
+        for n, index in enumerate(targets):
+            app.update_and_save(data, index, scenario_field, scenario_options[(rounds[0] + n) % len(scenario_options)], filepath)
+            app.update_and_save(data, index, ('question1_aspects', 0, 'points', 0, 'choice'),
+                                q1_options[(rounds[0] + n) % len(q1_options)], filepath)
+        app.flush_pending_saves()
+
+    measure(f"update_and_save ({2 * edits} edits + flush)", edit_batch)
+    measure("save_annotations", lambda: app.save_annotations(data, filepath))
+
+    dataset = st.session_state.dataset
+    for fmt in EXPORT_FORMATS:
+        measure(f"provide_download serialize {fmt}", lambda fmt=fmt: ExportCache().payload(dataset, fmt))
+
+    search = st.session_state.dataset.search
+    for query in ("topic:hydrofluoric", "scenario:unreviewed", "spill kit choice:unreviewed"):
+        measure(f"search '{query}'", lambda query=query: search.search(query))
+
+    st.session_state.bench_results = results
+    st.session_state.bench_renders = {}
+
+
+def run_case(app_module, n_items, backend, repeat=3, edits=100, timeout=3600):
+    """Time every case for one app / dataset size / storage backend; returns {case: seconds}."""
+    legacy = APPS[app_module]
+    workdir = tempfile.mkdtemp(prefix="labsafety-bench-")
+    cwd = os.getcwd()
+    try:
+        # The apps read src/config and src/annotation relative to the working directory and
+        # write data/ next to them, so run in a scratch directory that links to the real src
+        os.symlink(os.path.join(REPO_ROOT, "src"), os.path.join(workdir, "src"))
+        upload_path = os.path.join(workdir, f"bench{n_items}.json")
+        write_dataset(upload_path, n_items, legacy)
+        os.chdir(workdir)
+        storage_cfg = {"backend": backend, "compact_every": 500, "chunk_size": 50}
+        at = AppTest.from_function(_bench_script, default_timeout=timeout,
+                                   args=(app_module, upload_path, storage_cfg, repeat, min(edits, n_items)))
+        # annotation_all*.py read these at import; nothing here calls GPT or the WebDAV server
+        at.secrets["OPENAI_API_KEY"] = "benchmark"
+        at.secrets["nutcloud"] = {"username": "benchmark", "password": "benchmark"}
+        # One persistence run, one warm-up render (first imports of the table code), `repeat` renders
+        for _ in range(repeat + 2):
+            at.run()
+            if at.exception:
+                raise RuntimeError(at.exception[0].value)
+        results = dict(at.session_state["bench_results"])
+        for name, runs in at.session_state["bench_renders"].items():
+            results[name] = statistics.median(runs[1:])
+        dataset = at.session_state["dataset"]
+        dataset.scheduler.close()
+        dataset.store.close()
+        return results
+    finally:
+        os.chdir(cwd)
+        _remove_tree(workdir)
+
+
+def _remove_tree(path):
+    link = os.path.join(path, "src")
+    if os.path.islink(link):
+        os.unlink(link)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def result_key(app_module, backend, n_items, case):
+    return f"{app_module}/{backend}/{n_items}/{case}"
+
+
+def compare(results, baseline, tolerance):
+    """[(key, current, baseline, ratio)] for every case slower than the baseline allows."""
+    regressions = []
+    for key, seconds in results.items():
+        base = baseline.get(key)
+        if base and seconds > base * (1 + tolerance):
+            regressions.append((key, seconds, base, seconds / base))
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as file:
+        return json.load(file).get("results", {})
+
+
+def save_baseline(path, results, baseline):
+    merged = dict(baseline)
+    merged.update(results)
+    with open(path, "w") as file:
+        json.dump({
+            "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                        "streamlit": streamlit.__version__},
+            "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "results": dict(sorted(merged.items())),
+        }, file, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark persistence and rendering of the review apps.")
+    parser.add_argument("--app", nargs="+", default=["annotation"], choices=list(APPS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100, 1000, 10000])
+    parser.add_argument("--backend", nargs="+", default=["journal"], choices=["journal", "sharded", "sqlite"])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the median is reported")
+    parser.add_argument("--edits", type=int, default=100, help="items edited per update_and_save run")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown before a case counts as a regression")
+    parser.add_argument("--save", action="store_true", help="store these results in the baseline file")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+    for app_module in args.app:
+        for backend in args.backend:
+            for n_items in args.sizes:
+                print(f"== {app_module} / {backend} / {n_items} items")
+                for case, seconds in run_case(app_module, n_items, backend, args.repeat, args.edits).items():
+                    key = result_key(app_module, backend, n_items, case)
+                    results[key] = seconds
+                    base = baseline.get(key)
+                    change = f"  ({seconds / base:5.2f}x baseline)" if base else ""
+                    print(f"  {case:<45} {seconds * 1000:10.1f} ms{change}")
+
+    if args.save:
+        save_baseline(args.baseline, results, baseline)
+        print(f"Saved {len(results)} results to {args.baseline}")
+        sys.exit(0)
+    regressions = compare(results, baseline, args.tolerance)
+    for key, seconds, base, ratio in regressions:
+        print(f"REGRESSION {key}: {seconds * 1000:.1f} ms vs {base * 1000:.1f} ms baseline ({ratio:.2f}x)")
+    sys.exit(1 if regressions else 0)
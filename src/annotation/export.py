@@ -0,0 +1,57 @@
+import gzip
+import json
+import threading
+
+from models import to_json
+
+# label -> (file suffix, mime type)
+EXPORT_FORMATS = {
+    "JSON (indented)": (".json", "application/json"),
+    "JSON (compact)": (".json", "application/json"),
+    "JSON (gzip)": (".json.gz", "application/gzip"),
+}
+
+
+def export_filename(filename, fmt):
+    base = filename[:-len(".json")] if filename.endswith(".json") else filename
+    return base + EXPORT_FORMATS[fmt][0]
+
+
+def serialize(data, fmt):
+    if fmt == "JSON (indented)":
+        return json.dumps([to_json(item) for item in data], indent=4).encode('utf-8')
+    compact = json.dumps([to_json(item) for item in data], separators=(',', ':')).encode('utf-8')
+    if fmt == "JSON (gzip)":
+        # mtime=0 keeps the archive byte-identical for identical data
+        return gzip.compress(compact, compresslevel=6, mtime=0)
+    return compact
+
+
+class ExportCache:
+    """
+    Memoized download payloads, one cache per server process (use via st.cache_resource).
+
+    `st.download_button` is given `payload_fn(...)`, a callable that Streamlit only runs
+    when Download is clicked, so reruns no longer serialize the dataset. The result is kept
+    per dataset and format and reused by every session until `dataset.version` changes
+    (SharedDataset.edit bumps it on every edit).
+    """
+
+    def __init__(self):
+        self._payloads = {}
+        self._lock = threading.Lock()
+
+    def payload(self, dataset, fmt):
+        key = (dataset.filepath, fmt)
+        with self._lock:
+            # A dataset reloaded from disk is a new object, so the identity check goes with the version
+            version = dataset.version
+            cached = self._payloads.get(key)
+            if cached is not None and cached[0] is dataset and cached[1] == version:
+                return cached[2]
+            payload = serialize(dataset.data, fmt)
+            self._payloads[key] = (dataset, version, payload)
+            return payload
+
+    def payload_fn(self, dataset, fmt):
+        return lambda: self.payload(dataset, fmt)
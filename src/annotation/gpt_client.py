@@ -0,0 +1,193 @@
+import time
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+import openai
+
+from gpt_cache import cache_key
+from instrumentation import METRICS
+
+DEFAULT_MODEL = 'gpt-4o-2024-11-20'
+DEFAULT_TEMPERATURE = 0.7
+
+# Errors worth retrying; anything else (bad request, auth) fails immediately
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class GPTExecutor:
+    """
+    One pooled OpenAI client plus a thread pool for running chat completions off the
+    Streamlit script thread.
+
+    The client is created once and reused, so requests share keep-alive HTTP connections
+    instead of paying a new TLS handshake per Submit. Requests are tracked in a registry
+    keyed by field: `submit` starts a request in the background, several keys submitted
+    together run concurrently, and `requests(prefix)` lists one session's requests.
+    Every request has its own timeout and is retried with exponential backoff on
+    transient errors. With a `cache` (gpt_cache.ResponseCache), repeated identical
+    requests are answered from disk unless `use_cache=False` is passed.
+    """
+
+    def __init__(self, client=None, max_workers=8, timeout=60.0, max_retries=3, backoff=1.0, cache=None):
+        # SDK-level retries are disabled; retrying is done here so the backoff is visible and bounded
+        self.client = (client or openai.OpenAI()).with_options(max_retries=0)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gpt")
+        self._inflight = {}
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def complete(self, user_input, system_prompt, model=DEFAULT_MODEL, temperature=DEFAULT_TEMPERATURE, timeout=None,
+                 use_cache=True):
+        key = None
+        if self.cache is not None:
+            key = cache_key(model, system_prompt, user_input, temperature)
+            if use_cache:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+        timeout = timeout or self.timeout
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.with_options(timeout=timeout).chat.completions.create(
+                    model=model,
+                    messages=self._messages(user_input, system_prompt),
+                    temperature=temperature
+                )
+                content = response.choices[0].message.content
+                if key is not None and content is not None:
+                    # Written even when bypassing, so the cache holds the freshest answer
+                    self.cache.put(key, content)
+                return content
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+                self._sleep_before_retry(attempt)
+
+    def stream(self, key, user_input, system_prompt, model=DEFAULT_MODEL, temperature=DEFAULT_TEMPERATURE,
+               timeout=None, use_cache=True):
+        """
+        Yield the completion for `key` token by token as it arrives (for st.write_stream).
+        Time to first token and total latency are recorded in `metrics[key]`, and the full
+        answer is kept like a finished `submit` so later reruns can show it.
+        """
+        start = time.perf_counter()
+        cache_id = None
+        if self.cache is not None:
+            cache_id = cache_key(model, system_prompt, user_input, temperature)
+            if use_cache:
+                cached = self.cache.get(cache_id)
+                if cached is not None:
+                    self._finish(key, cached, start, time.perf_counter(), streamed=True)
+                    yield cached
+                    return
+        timeout = timeout or self.timeout
+        parts = []
+        first_token_at = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.with_options(timeout=timeout).chat.completions.create(
+                    model=model,
+                    messages=self._messages(user_input, system_prompt),
+                    temperature=temperature,
+                    stream=True
+                )
+                for chunk in response:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        parts.append(delta)
+                        yield delta
+                break
+            except RETRYABLE_ERRORS:
+                # Once tokens are on screen a retry would repeat them, so only retry before the first token
+                if first_token_at is not None or attempt == self.max_retries:
+                    raise
+                self._sleep_before_retry(attempt)
+        content = "".join(parts)
+        if cache_id is not None:
+            self.cache.put(cache_id, content)
+        self._finish(key, content, start, first_token_at, streamed=True)
+
+    def submit(self, key, user_input, system_prompt, timeout=None, **kwargs):
+        """Start a request for `key` in the background; a request already running for `key` is reused."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None or future.done():
+                future = self._pool.submit(self._timed_complete, key, user_input, system_prompt, timeout=timeout, **kwargs)
+                self._inflight[key] = future
+            return future
+
+    def get(self, key):
+        with self._lock:
+            return self._inflight.get(key)
+
+    def pop(self, key):
+        with self._lock:
+            return self._inflight.pop(key, None)
+
+    def requests(self, prefix):
+        """{key: future} of every request (running or finished) whose key starts with `prefix`."""
+        with self._lock:
+            return {k: f for k, f in self._inflight.items() if k.startswith(prefix)}
+
+    def running(self, keys=None):
+        with self._lock:
+            items = self._inflight.items() if keys is None else ((k, self._inflight.get(k)) for k in keys)
+            return {k: f for k, f in items if f is not None and not f.done()}
+
+    def forget(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+            self.metrics.pop(key, None)
+
+    def wait(self, keys, timeout=None):
+        """Block until every in-flight request for `keys` has finished (they run concurrently)."""
+        futures = [f for f in (self.get(k) for k in keys) if f is not None]
+        wait(futures, timeout=timeout)
+
+    # ---------------- internals ----------------
+    @staticmethod
+    def _messages(user_input, system_prompt):
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_input}
+        ]
+
+    def _sleep_before_retry(self, attempt):
+        time.sleep(self.backoff * (2 ** attempt) * (1 + random.random() * 0.25))
+
+    def _timed_complete(self, key, user_input, system_prompt, **kwargs):
+        start = time.perf_counter()
+        content = self.complete(user_input, system_prompt, **kwargs)
+        now = time.perf_counter()
+        # Without streaming the first token arrives together with the last one
+        with self._lock:
+            self.metrics[key] = {"ttft_ms": (now - start) * 1000, "total_ms": (now - start) * 1000, "streamed": False}
+        METRICS.observe("gpt_request", now - start, len((content or '').encode('utf-8')))
+        return content
+
+    def _finish(self, key, content, start, first_token_at, streamed):
+        now = time.perf_counter()
+        future = Future()
+        future.set_result(content)
+        with self._lock:
+            self._inflight[key] = future
+            self.metrics[key] = {
+                "ttft_ms": ((first_token_at or now) - start) * 1000,
+                "total_ms": (now - start) * 1000,
+                "streamed": streamed,
+            }
+        METRICS.observe("gpt_request", now - start, len((content or '').encode('utf-8')))
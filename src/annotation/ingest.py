@@ -0,0 +1,88 @@
+import json
+import codecs
+
+_WHITESPACE = ' \t\n\r'
+
+
+class _ChunkedText:
+    """Text buffer over a binary or text file object that is refilled chunk by chunk."""
+
+    def __init__(self, fileobj, chunk_size):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.fileobj.read(self.chunk_size)
+        if isinstance(chunk, bytes):
+            text = self.decoder.decode(chunk, final=not chunk)
+        else:
+            text = chunk
+        if not chunk:
+            self.eof = True
+        # Drop what has already been consumed so the buffer stays around one item in size
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return bool(text) or not self.eof
+
+    def peek(self):
+        """Next non-whitespace character (not consumed), or '' at end of input."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def decode_value(self, decoder):
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.fill()
+                continue
+            # A value that ends exactly at the buffer end may be a truncated number or literal
+            if end == len(self.buf) and not self.eof:
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(fileobj, chunk_size=1 << 16):
+    """
+    Yield the items of a top-level JSON array one at a time without parsing the whole
+    document, so memory stays at roughly one item regardless of file size.
+    A top-level object is yielded as a single item (same as the old `[data]` wrapping).
+    """
+    decoder = json.JSONDecoder()
+    text = _ChunkedText(fileobj, chunk_size)
+
+    first = text.peek()
+    if first == '':
+        return
+    if first != '[':
+        yield text.decode_value(decoder)
+        return
+    text.pos += 1
+
+    if text.peek() == ']':
+        return
+    while True:
+        text.peek()
+        yield text.decode_value(decoder)
+        sep = text.peek()
+        if sep == ',':
+            text.pos += 1
+        elif sep == ']':
+            return
+        else:
+            raise json.JSONDecodeError("Expected ',' or ']'", text.buf, text.pos)
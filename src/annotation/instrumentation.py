@@ -0,0 +1,168 @@
+"""
+Low-overhead timing, byte and call counters for the review apps' hot paths.
+
+`METRICS` is shared by every session of the server process. Wrap a function with
+`@timed("phase")` (or a block with `METRICS.timer("phase")`) to count its calls and keep its
+recent durations; `METRICS.add_bytes` adds to the phase's byte counter. Phases can nest
+(`run` includes `display_annotation_interface`), so their times are not additive.
+
+Each phase keeps only the last `window` durations for the p50/p95 shown in the sidebar, so
+memory stays bounded however long the server runs. `write_jsonl` appends one snapshot line
+per phase and `write_prometheus` rewrites a Prometheus text-format file (e.g. for the
+node_exporter textfile collector).
+"""
+import os
+import json
+import math
+import time
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list (q in 0..1)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class PhaseStats:
+    __slots__ = ('calls', 'errors', 'total_s', 'bytes', 'samples')
+
+    def __init__(self, window):
+        self.calls = 0
+        self.errors = 0
+        self.total_s = 0.0
+        self.bytes = 0
+        self.samples = deque(maxlen=window)
+
+
+class Metrics:
+    def __init__(self, window=1000):
+        self.window = window
+        self._phases = {}
+        self._lock = threading.Lock()
+        self._last_export = time.monotonic()
+
+    def _phase(self, phase):
+        # Caller holds self._lock
+        stats = self._phases.get(phase)
+        if stats is None:
+            stats = self._phases[phase] = PhaseStats(self.window)
+        return stats
+
+    def observe(self, phase, seconds, nbytes=0, error=False):
+        with self._lock:
+            stats = self._phase(phase)
+            stats.calls += 1
+            stats.total_s += seconds
+            stats.bytes += nbytes
+            stats.errors += bool(error)
+            stats.samples.append(seconds)
+
+    def add_bytes(self, phase, nbytes):
+        with self._lock:
+            self._phase(phase).bytes += nbytes
+
+    @contextmanager
+    def timer(self, phase):
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            # Streamlit's rerun/stop exceptions are BaseExceptions and do not count as errors
+            self.observe(phase, time.perf_counter() - start, error=error)
+
+    def timed(self, phase):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(phase):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """{phase: {calls, errors, p50_ms, p95_ms, total_ms, bytes}} sorted by total time."""
+        with self._lock:
+            phases = [(phase, stats.calls, stats.errors, stats.total_s, stats.bytes, sorted(stats.samples))
+                      for phase, stats in self._phases.items()]
+        result = {}
+        for phase, calls, errors, total_s, nbytes, samples in sorted(phases, key=lambda p: -p[3]):
+            result[phase] = {
+                "calls": calls,
+                "errors": errors,
+                "p50_ms": percentile(samples, 0.50) * 1000,
+                "p95_ms": percentile(samples, 0.95) * 1000,
+                "total_ms": total_s * 1000,
+                "bytes": nbytes,
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._phases = {}
+
+    def write_jsonl(self, path):
+        now = time.time()
+        lines = "".join(json.dumps({"ts": now, "phase": phase, **values}) + "\n"
+                        for phase, values in self.snapshot().items())
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a") as file:
+            file.write(lines)
+
+    def write_prometheus(self, path, prefix="labsafety"):
+        out = [
+            f"# HELP {prefix}_phase_seconds Duration of instrumented phases (recent window).",
+            f"# TYPE {prefix}_phase_seconds summary",
+        ]
+        snapshot = self.snapshot()
+        for phase, values in snapshot.items():
+            label = f'phase="{phase}"'
+            out.append(f'{prefix}_phase_seconds{{{label},quantile="0.5"}} {values["p50_ms"] / 1000:.6f}')
+            out.append(f'{prefix}_phase_seconds{{{label},quantile="0.95"}} {values["p95_ms"] / 1000:.6f}')
+            out.append(f'{prefix}_phase_seconds_sum{{{label}}} {values["total_ms"] / 1000:.6f}')
+            out.append(f'{prefix}_phase_seconds_count{{{label}}} {values["calls"]}')
+        for name, key, help_text in (("bytes", "bytes", "Bytes read, written or sent per phase."),
+                                     ("errors", "errors", "Calls of a phase that raised.")):
+            out.append(f"# HELP {prefix}_phase_{name}_total {help_text}")
+            out.append(f"# TYPE {prefix}_phase_{name}_total counter")
+            for phase, values in snapshot.items():
+                out.append(f'{prefix}_phase_{name}_total{{phase="{phase}"}} {values[key]}')
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, "w") as file:
+            file.write("\n".join(out) + "\n")
+        # Scrapers never see a half-written file
+        os.replace(tmp_path, path)
+
+    def export(self, cfg):
+        """Write the files configured in the `instrumentation` section; returns their paths."""
+        cfg = cfg or {}
+        written = []
+        if cfg.get('jsonl'):
+            self.write_jsonl(cfg['jsonl'])
+            written.append(cfg['jsonl'])
+        if cfg.get('prometheus'):
+            self.write_prometheus(cfg['prometheus'])
+            written.append(cfg['prometheus'])
+        self._last_export = time.monotonic()
+        return written
+
+    def maybe_export(self, cfg):
+        """Export when `export_every_seconds` (0 = never automatically) have passed since the last one."""
+        every = (cfg or {}).get('export_every_seconds', 0)
+        if every and time.monotonic() - self._last_export >= every:
+            return self.export(cfg)
+        return []
+
+
+METRICS = Metrics()
+timed = METRICS.timed
@@ -0,0 +1,179 @@
+"""
+Compact in-memory model for loaded annotation data.
+
+A dataset loaded from JSON is a list of dicts, and every point and situation repeats the same
+keys and choice strings. `Item.from_json` turns the review structures into `__slots__`
+records (Aspect / Point / Situation) whose `choice` is stored as a small int interned in
+`CHOICES` (seeded from the YAML `options`). The records still behave like the dicts they
+replace (`rec['choice']`, `.get`, `get_path`/`set_path`, `==` with dicts), and `to_json`
+gives back exactly the original JSON. Anything that does not fit a record's fields, or
+stores them in a different order, is kept as a plain dict so the conversion stays lossless.
+"""
+import threading
+from collections.abc import MutableMapping
+
+UNREVIEWED = ""
+
+
+class ChoiceTable:
+    """Interns choice strings as small ints: '' is 0, then the YAML options, then any other value seen."""
+
+    def __init__(self):
+        self.values = [UNREVIEWED]
+        self.codes = {UNREVIEWED: 0}
+        self._lock = threading.Lock()
+
+    def register(self, options):
+        for option in options:
+            self.encode(option)
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self.codes.get(value)
+                if code is None:
+                    self.values.append(value)
+                    code = self.codes[value] = len(self.values) - 1
+        return code
+
+    def decode(self, code):
+        return self.values[code]
+
+
+CHOICES = ChoiceTable()
+
+
+def register_config_options(config):
+    """Register the options of every config section that has them (Scenario, scenario_reality, question1, ...)."""
+    for section in (config or {}).values():
+        if isinstance(section, dict) and isinstance(section.get('options'), list):
+            CHOICES.register(section['options'])
+
+
+class Record(MutableMapping):
+    """Dict-like record with a fixed, ordered set of optional fields stored in slots."""
+    __slots__ = ()
+    FIELDS = ()
+    LIST_FIELDS = {}
+
+    @classmethod
+    def from_json(cls, obj):
+        if type(obj) is not dict:
+            return obj
+        keys = tuple(obj)
+        if keys != tuple(f for f in cls.FIELDS if f in obj) or not isinstance(obj.get('choice', UNREVIEWED), str):
+            return obj
+        record = cls.__new__(cls)
+        for key, value in obj.items():
+            record[key] = value
+        return record
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        try:
+            value = getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+        return CHOICES.decode(value) if key == 'choice' else value
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(f"{type(self).__name__} has no field {key!r}")
+        if key == 'choice':
+            if not isinstance(value, str):
+                raise TypeError(f"choice must be a string, got {type(value).__name__}")
+            value = CHOICES.encode(value)
+        elif key in self.LIST_FIELDS and isinstance(value, list):
+            value = [self.LIST_FIELDS[key].from_json(v) for v in value]
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        delattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.FIELDS and hasattr(self, key)
+
+    def __iter__(self):
+        return (f for f in self.FIELDS if hasattr(self, f))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({to_json(self)!r})"
+
+
+class Point(Record):
+    __slots__ = FIELDS = ('original_text', 'choice', 'modified_text', 'comment')
+
+
+class Aspect(Record):
+    __slots__ = FIELDS = ('aspect_name', 'points')
+    LIST_FIELDS = {'points': Point}
+
+
+class Situation(Record):
+    # Union of the Decisions schema (decision/consequence/...) and the OptionConsequences one
+    # (option_key/original_text/...), ordered so both keep their original key order
+    __slots__ = FIELDS = ('option_key', 'original_text', 'decision', 'consequence', 'choice',
+                          'modified_text', 'modified_decision', 'modified_consequence', 'comment')
+
+
+class Item(MutableMapping):
+    """One dataset item: its own fields in their original order, review structures as records."""
+    __slots__ = ('_fields',)
+    LIST_FIELDS = {'question1_aspects': Aspect, 'question2_situations': Situation}
+
+    def __init__(self, fields=None):
+        self._fields = {}
+        for key, value in (fields or {}).items():
+            self[key] = value
+
+    @classmethod
+    def from_json(cls, obj):
+        return cls(obj) if type(obj) is dict else obj
+
+    def __getitem__(self, key):
+        return self._fields[key]
+
+    def __setitem__(self, key, value):
+        if key in self.LIST_FIELDS and isinstance(value, list):
+            value = [self.LIST_FIELDS[key].from_json(v) for v in value]
+        self._fields[key] = value
+
+    def __delitem__(self, key):
+        del self._fields[key]
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return f"Item({to_json(self)!r})"
+
+
+def to_json(obj):
+    """Plain JSON-ready copy of a model object (or of lists/dicts containing them)."""
+    if isinstance(obj, (Item, Record)):
+        return {key: to_json(obj[key]) for key in obj}
+    if isinstance(obj, list):
+        return [to_json(v) for v in obj]
+    if isinstance(obj, dict):
+        return {key: to_json(v) for key, v in obj.items()}
+    return obj
+
+
+def compact_dataset(data):
+    """Convert a fully loaded dataset (list of dicts) to Items; lazy sequences are returned as is."""
+    if isinstance(data, list):
+        return [Item.from_json(item) for item in data]
+    return data
@@ -0,0 +1,51 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# One small pool for every session in the process; prefetching is only an optimisation
+_POOL_WORKERS = 2
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=_POOL_WORKERS, thread_name_prefix="prefetch")
+        return _pool
+
+
+class Prefetcher:
+    """
+    Loads the items around the current one on a background thread.
+
+    `schedule(data, index)` reads the `radius` neighbours of `index` off the script thread
+    (for the sharded store this loads their chunk, GPT suggestions included). Review
+    structures are already built at import (review_items.normalize_items), so by the time
+    the reviewer clicks Next or Previous the item only has to be rendered. Datasets that are
+    already in memory (journal and SQLite backends load a list) have nothing to prefetch.
+
+    All sessions share one bounded executor; each Prefetcher only tracks its own requests.
+    """
+
+    def __init__(self, radius=2):
+        self.radius = radius
+        self._futures = {}
+
+    def schedule(self, data, index):
+        if isinstance(data, list):
+            return
+        # Finished requests are dropped so the map only holds what is still queued or running
+        self._futures = {i: future for i, future in self._futures.items() if not future.done()}
+        pool = _get_pool()
+        lo = max(0, index - self.radius)
+        hi = min(len(data) - 1, index + self.radius)
+        for i in range(lo, hi + 1):
+            if i != index and i not in self._futures:
+                self._futures[i] = pool.submit(data.__getitem__, i)
+
+    def close(self):
+        # The pool is shared; only this session's queued requests are cancelled
+        for future in self._futures.values():
+            future.cancel()
+        self._futures = {}
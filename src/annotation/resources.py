@@ -0,0 +1,26 @@
+import os
+
+import yaml
+import streamlit as st
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _load_yaml(path, mtime_ns):
+    with open(path, "r") as file:
+        return yaml.safe_load(file)
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _load_text(path, mtime_ns):
+    with open(path, "r") as file:
+        return file.read()
+
+
+def load_yaml(path):
+    """Parsed YAML file, read once per process and re-read only when its mtime changes."""
+    return _load_yaml(path, os.stat(path).st_mtime_ns)
+
+
+def load_text(path):
+    """Text file contents (CSS, prompt templates), cached like `load_yaml`."""
+    return _load_text(path, os.stat(path).st_mtime_ns)
@@ -0,0 +1,146 @@
+"""
+Review structures derived from a raw generated item.
+
+`question1_aspects` / `question2_situations` hold one reviewer entry (choice, edits) per
+lab-safety issue point and per decision. They are built for every item when a dataset is
+imported (`normalize_items`) or first opened (`migrate_items`), and each item is stamped with
+`review_schema`, so the review pages only read them. `annotation.py` uses the older
+LabSafetyRelatedIssues / OptionConsequences schema, `annotation_all*.py` the
+LabSafety_Related_Issues / Decisions one.
+"""
+
+REVIEW_SCHEMA_VERSION = 1
+SCHEMA_FIELD = 'review_schema'
+
+ISSUE_ASPECTS = [
+    "Most_Common_Hazards",
+    "Improper_Operation_Issues",
+    "Negative_Lab_Environment_Impacts",
+    "Most_Likely_Safety_Incidents"
+]
+LEGACY_ISSUE_ASPECTS = [
+    "MostCommonHazards",
+    "ImproperOperationIssues",
+    "NegativeLabEnvironmentImpacts",
+    "MostLikelySafetyIncidents"
+]
+
+
+def build_question1_aspects(lab_issues, aspects_keys, with_comment=True):
+    question1_aspects = []
+    for aspect_key in aspects_keys:
+        aspect_obj = {
+            "aspect_name": aspect_key,
+            "points": []
+        }
+        for p_text in lab_issues.get(aspect_key, []):
+            point = {
+                "original_text": p_text,
+                "choice": "",
+                "modified_text": ""
+            }
+            if with_comment:
+                point["comment"] = ""
+            aspect_obj["points"].append(point)
+        question1_aspects.append(aspect_obj)
+    return question1_aspects
+
+
+def build_decision_situations(decisions):
+    question2_situations = []
+    for decision in list(decisions)[:4]:
+        question2_situations.append({
+            "decision": decision.get('Decision', ''),
+            "consequence": decision.get('Consequence', ''),
+            "choice": "",
+            "modified_decision": "",
+            "modified_consequence": "",
+            "comment": ""
+        })
+    return question2_situations
+
+
+def build_option_situations(option_consequences):
+    question2_situations = []
+    for opt_key in ['A', 'B', 'C', 'D']:
+        if opt_key in option_consequences:
+            desc = option_consequences[opt_key].get('Description', '')
+            cons = option_consequences[opt_key].get('Consequence', '')
+            question2_situations.append({
+                "option_key": opt_key,
+                "original_text": f"Action {opt_key}: {desc}\n\nConsequence: {cons}",
+                "choice": "",
+                "modified_text": ""
+            })
+    return question2_situations
+
+
+def missing_review_fields(item):
+    """Review structures `item` does not have yet (LabSafety_Related_Issues / Decisions schema)."""
+    fields = {}
+    if 'question1_aspects' not in item:
+        fields['question1_aspects'] = build_question1_aspects(item.get('LabSafety_Related_Issues', {}), ISSUE_ASPECTS)
+    if 'question2_situations' not in item:
+        fields['question2_situations'] = build_decision_situations(item.get('Decisions', {}))
+    return fields
+
+
+def missing_review_fields_legacy(item):
+    """Same as `missing_review_fields` for the LabSafetyRelatedIssues / OptionConsequences schema."""
+    fields = {}
+    if 'question1_aspects' not in item:
+        fields['question1_aspects'] = build_question1_aspects(item.get('LabSafetyRelatedIssues', {}),
+                                                              LEGACY_ISSUE_ASPECTS, with_comment=False)
+    if 'question2_situations' not in item:
+        fields['question2_situations'] = build_option_situations(item.get('OptionConsequences', {}))
+    return fields
+
+
+def point_pages(points, page_size):
+    """(start, stop) ranges splitting an aspect's points into pages of `page_size` (one page if 0)."""
+    if page_size <= 0 or len(points) <= page_size:
+        return [(0, len(points))]
+    return [(start, min(start + page_size, len(points))) for start in range(0, len(points), page_size)]
+
+
+def first_open_page(points, pages):
+    """Index of the first page that still has an unreviewed point, else 0."""
+    for page, (start, stop) in enumerate(pages):
+        if any(not points[p].get('choice') for p in range(start, stop)):
+            return page
+    return 0
+
+
+def normalize_items(items, derive):
+    """Yield `items` with their review structures filled in, for streaming into a new store."""
+    for item in items:
+        if item.get(SCHEMA_FIELD, 0) < REVIEW_SCHEMA_VERSION:
+            item.update(derive(item))
+            item[SCHEMA_FIELD] = REVIEW_SCHEMA_VERSION
+        yield item
+
+
+def migrate_items(data, store, derive):
+    """
+    Bring items saved by an older version up to REVIEW_SCHEMA_VERSION in one pass and one
+    batched store write. Returns the number of items changed.
+    """
+    if hasattr(store, 'schema_version') and store.schema_version() >= REVIEW_SCHEMA_VERSION:
+        # The store remembers that every item is current; a lazy dataset is not scanned again
+        return 0
+    changes = []
+    migrated = 0
+    for index, item in enumerate(data):
+        if item.get(SCHEMA_FIELD, 0) >= REVIEW_SCHEMA_VERSION:
+            continue
+        # Lazy stores yield detached copies while iterating; edit the indexed item
+        item = data[index]
+        fields = derive(item)
+        fields[SCHEMA_FIELD] = REVIEW_SCHEMA_VERSION
+        item.update(fields)
+        changes.extend((index, field, value) for field, value in fields.items())
+        migrated += 1
+    store.record_many(changes)
+    if hasattr(store, 'set_schema_version'):
+        store.set_schema_version(REVIEW_SCHEMA_VERSION)
+    return migrated
@@ -0,0 +1,165 @@
+import time
+import atexit
+import threading
+
+from storage import normalize_path
+
+
+class SaveScheduler:
+    """
+    Debounced, coalescing background writer in front of an annotation store.
+
+    `submit` only queues the change and returns immediately. A worker thread writes the
+    queued changes in one batch once edits have been idle for `idle_ms`, or at the latest
+    `interval_ms` after the oldest pending edit. Repeated edits of the same field inside one
+    batch collapse into a single write of the last value.
+
+    A batch the store fails to write (disk full, locked file) is put back in front of newer
+    edits and retried; the error is kept in `stats()["last_error"]` until a write succeeds,
+    and `flush` raises it.
+    """
+
+    def __init__(self, store, interval_ms=500, idle_ms=200):
+        self.store = store
+        self.interval = interval_ms / 1000.0
+        self.idle = idle_ms / 1000.0
+        self._pending = {}
+        self._writing = frozenset()
+        self._first_pending_at = None
+        self._last_submit_at = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._flush_lock = threading.Lock()
+
+        self.submitted = 0
+        self.written = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.failed_flushes = 0
+        self.last_error = None
+
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, index, path, value):
+        now = time.monotonic()
+        with self._cond:
+            key = (index, tuple(normalize_path(path)))
+            # Re-insert so the batch keeps the order of the latest edits
+            self._pending.pop(key, None)
+            self._pending[key] = value
+            self.submitted += 1
+            if self._first_pending_at is None:
+                self._first_pending_at = now
+            self._last_submit_at = now
+            self._cond.notify()
+
+    def flush(self):
+        """Write everything queued so far before returning (used on Next/Previous/download); raises if the store fails."""
+        self._drain()
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending)
+
+    def pending_indices(self):
+        """Indices of items with edits that are queued or being written."""
+        with self._cond:
+            return {index for index, _ in self._pending} | self._writing
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+            lag_ms = (time.monotonic() - self._first_pending_at) * 1000 if self._first_pending_at else 0.0
+        return {
+            "pending": pending,
+            "oldest_pending_ms": lag_ms,
+            "submitted": self.submitted,
+            "written": self.written,
+            "flushes": self.flushes,
+            "last_flush_ms": self.last_flush_ms,
+            "avg_flush_ms": self.total_flush_ms / self.flushes if self.flushes else 0.0,
+            "max_flush_ms": self.max_flush_ms,
+            "failed_flushes": self.failed_flushes,
+            "last_error": self.last_error,
+        }
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._worker.join()
+        self.flush()
+
+    # ---------------- internals ----------------
+    def _take_batch(self):
+        # Caller holds self._cond
+        batch = [(index, list(path), value) for (index, path), value in self._pending.items()]
+        self._pending = {}
+        self._first_pending_at = None
+        self._last_submit_at = None
+        return batch
+
+    def _requeue(self, batch):
+        # The failed batch goes before edits submitted meanwhile; a newer value of the same field wins
+        now = time.monotonic()
+        with self._cond:
+            pending = {(index, tuple(path)): value for index, path, value in batch}
+            for key, value in self._pending.items():
+                pending.pop(key, None)
+                pending[key] = value
+            self._pending = pending
+            # Retry after the idle delay rather than in a tight loop
+            self._first_pending_at = self._last_submit_at = now
+
+    def _drain(self):
+        # Taking and writing a batch under one lock keeps batches in submit order on disk
+        with self._flush_lock:
+            with self._cond:
+                batch = self._take_batch()
+                self._writing = frozenset(index for index, _, _ in batch)
+            if not batch:
+                return
+            start = time.perf_counter()
+            try:
+                self.store.record_many(batch)
+            except Exception as e:
+                self._requeue(batch)
+                self.failed_flushes += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                with self._cond:
+                    self._writing = frozenset()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        self.last_error = None
+        self.written += len(batch)
+        self.flushes += 1
+        self.last_flush_ms = elapsed_ms
+        self.total_flush_ms += elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._pending:
+                        now = time.monotonic()
+                        due = min(self._last_submit_at + self.idle, self._first_pending_at + self.interval)
+                        if now >= due:
+                            break
+                        self._cond.wait(due - now)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+            try:
+                self._drain()
+            except Exception:
+                # Recorded in last_error and requeued; keep the worker alive for the retry
+                pass
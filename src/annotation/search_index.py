@@ -0,0 +1,135 @@
+import string
+import threading
+from functools import lru_cache
+from collections import defaultdict
+
+from status import UNREVIEWED
+
+# Punctuation and whitespace separate words; str.translate + split is about twice as fast as a regex
+SEPARATORS = str.maketrans({c: " " for c in string.punctuation + string.whitespace + "–—‘’“”…·，。：；！？（）、"})
+STOPWORDS = frozenset("a an and are as at be by for from in into is it of on or that the this to was with".split())
+# Text of Task 1 points and Task 2 options/decisions, old and new schema
+TEXT_KEYS = ('original_text', 'modified_text', 'decision', 'modified_decision')
+# Edits below these keys can change which words an item contains
+TEXT_FIELDS = TEXT_KEYS + ('Topic', 'Scenario', 'Scenario_modified', 'points', 'question1_aspects', 'question2_situations')
+# topic:<word> matches Topic only; scenario:/choice: match the scenario choice / any point or decision choice
+FIELDS = ('topic', 'scenario', 'choice')
+
+
+def words(text):
+    return text.lower().translate(SEPARATORS).split()
+
+
+def tokens(text):
+    return [token for token in words(text) if token not in STOPWORDS]
+
+
+@lru_cache(maxsize=256)
+def choice_term(field, value):
+    # "Delete" -> "scenario:delete"; unreviewed fields can be found with scenario:unreviewed
+    value = "_".join(words(value or UNREVIEWED)) or "unreviewed"
+    return f"{field}:{value}"
+
+
+def item_terms(item, scenario_field, text=True):
+    """
+    Index terms of one item: the scenario/choice terms, plus (with `text`) the words of
+    Topic, Scenario and the point/decision texts and the topic: terms.
+    """
+    entries = [point for aspect in item.get('question1_aspects', []) for point in aspect.get('points', [])]
+    entries.extend(item.get('question2_situations', []))
+    terms = {choice_term('choice', entry.get('choice')) for entry in entries}
+    terms.add(choice_term('scenario', item.get(scenario_field)))
+    if not text:
+        return terms
+    topic = set(tokens(item.get('Topic') or ''))
+    terms.update('topic:' + token for token in topic)
+    texts = [item.get('Scenario') or '', item.get('Scenario_modified') or '']
+    for entry in entries:
+        for key in TEXT_KEYS:
+            if entry.get(key):
+                texts.append(entry[key])
+    # One pass over all the text is much cheaper than one per field
+    return terms | (set(words(" ".join(texts))) - STOPWORDS) | topic
+
+
+def parse_query(query):
+    """Index terms a query needs (all of them must match)."""
+    terms = []
+    for part in query.split():
+        field, sep, value = part.partition(':')
+        field = field.lower()
+        if sep and field == 'topic':
+            terms.extend('topic:' + token for token in tokens(value))
+        elif sep and field in FIELDS:
+            terms.append(choice_term(field, value))
+        else:
+            terms.extend(tokens(part))
+    return terms
+
+
+class SearchIndex:
+    """
+    In-memory inverted index (term -> item indices) for the sidebar search.
+
+    Built in one pass when first searched and kept current like StatusCounters: the dataset calls
+    `remove_item` before and `add_item` after each edit, so only the edited item is
+    re-indexed, and only its choice terms when `edit_scope` says the edit was a choice.
+    A query is the intersection of its terms' postings, smallest first, so selective
+    queries cost little however large the dataset is.
+    """
+
+    def __init__(self, scenario_field):
+        self.scenario_field = scenario_field
+        self._postings = defaultdict(set)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_data(cls, data, scenario_field):
+        index = cls(scenario_field)
+        for i, item in enumerate(data):
+            index.add_item(i, item)
+        return index
+
+    def edit_scope(self, path):
+        """None if an edit of `path` cannot change the index, "choices" if only choice terms can, else "all"."""
+        key = path[-1] if isinstance(path, (tuple, list)) else path
+        if key == 'choice' or key == self.scenario_field:
+            return "choices"
+        if not isinstance(key, str) or key in TEXT_FIELDS:
+            return "all"
+        return None
+
+    def add_item(self, i, item, text=True):
+        terms = item_terms(item, self.scenario_field, text)
+        with self._lock:
+            for term in terms:
+                self._postings[term].add(i)
+
+    def remove_item(self, i, item, text=True):
+        terms = item_terms(item, self.scenario_field, text)
+        with self._lock:
+            for term in terms:
+                posting = self._postings.get(term)
+                if posting is not None:
+                    posting.discard(i)
+                    if not posting:
+                        del self._postings[term]
+
+    def search(self, query):
+        """Sorted indices of the items matching every term of `query`; None for an empty query."""
+        terms = parse_query(query)
+        if not terms:
+            return None
+        with self._lock:
+            postings = sorted((self._postings.get(term, ()) for term in set(terms)), key=len)
+            hits = set(postings[0])
+            for posting in postings[1:]:
+                if not hits:
+                    break
+                hits &= posting
+        return sorted(hits)
+
+    def terms(self):
+        with self._lock:
+            return len(self._postings)
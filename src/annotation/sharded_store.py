@@ -0,0 +1,296 @@
+import os
+import json
+import shutil
+import argparse
+import threading
+from contextlib import contextmanager
+from collections import Counter, OrderedDict
+from collections.abc import Sequence
+
+from storage import set_path, write_json_atomic, files_size
+
+MANIFEST_NAME = "manifest.json"
+SHARD_FORMAT_VERSION = 1
+
+
+def shard_dir_for(filepath):
+    """data/<dataset>/<dataset>_annotation.json -> data/<dataset>/<dataset>_annotation.shards/"""
+    return os.path.splitext(filepath)[0] + '.shards'
+
+
+def chunk_filename(chunk_idx):
+    return f"chunk_{chunk_idx:06d}.json"
+
+
+class ShardedItems(Sequence):
+    """
+    Read-only list view over a sharded dataset. Items are only read from disk when they are
+    indexed, one chunk at a time, so opening a huge dataset costs the same as a tiny one.
+    Items returned by indexing can be edited in place like list items.
+
+    The last `max_chunks` chunks indexed are cached; older ones are dropped and read again
+    when needed. A chunk with edits that are not on disk yet (see `track_pending`), a chunk
+    held by `pinned` and the chunk just indexed are never dropped, so the cache grows past
+    `max_chunks` rather than lose an edit made to an item it returned.
+    """
+
+    def __init__(self, shard_dir, manifest, max_chunks=16):
+        self.shard_dir = shard_dir
+        self.count = manifest["count"]
+        self.chunk_size = manifest["chunk_size"]
+        self.max_chunks = max_chunks
+        self._chunks = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending_indices = None
+        self._pins = Counter()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("item index out of range")
+        chunk_idx, offset = divmod(index, self.chunk_size)
+        with self._lock:
+            chunk = self._chunks.get(chunk_idx)
+            if chunk is not None:
+                self._chunks.move_to_end(chunk_idx)
+                return chunk[offset]
+        chunk = self._read_chunk(chunk_idx)
+        with self._lock:
+            # setdefault keeps the first copy if the prefetch thread loaded the chunk concurrently
+            chunk = self._chunks.setdefault(chunk_idx, chunk)
+            self._evict(keep=chunk_idx)
+        return chunk[offset]
+
+    def __iter__(self):
+        # Chunks that were never indexed are streamed from disk without being cached,
+        # so a full scan (status, download) does not pull the whole dataset into memory.
+        n_chunks = (self.count + self.chunk_size - 1) // self.chunk_size
+        for chunk_idx in range(n_chunks):
+            with self._lock:
+                chunk = self._chunks.get(chunk_idx)
+            if chunk is None:
+                chunk = self._read_chunk(chunk_idx)
+            yield from chunk
+
+    def track_pending(self, pending_indices):
+        """`pending_indices()` returns the indices of items whose edits are not written yet."""
+        self._pending_indices = pending_indices
+
+    @contextmanager
+    def pinned(self, index):
+        """Keep the chunk of item `index` cached while the block runs, e.g. until its edit is queued."""
+        chunk_idx = index // self.chunk_size
+        with self._lock:
+            self._pins[chunk_idx] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins[chunk_idx] -= 1
+                if not self._pins[chunk_idx]:
+                    del self._pins[chunk_idx]
+
+    def loaded_items(self):
+        with self._lock:
+            return sum(len(chunk) for chunk in self._chunks.values())
+
+    def _evict(self, keep):
+        # Caller holds self._lock; least recently used chunks are first in the OrderedDict
+        if len(self._chunks) <= self.max_chunks:
+            return
+        pending = self._pending_indices() if self._pending_indices else ()
+        held = {index // self.chunk_size for index in pending}
+        held.update(self._pins)
+        held.add(keep)
+        for chunk_idx in list(self._chunks):
+            if len(self._chunks) <= self.max_chunks:
+                break
+            if chunk_idx not in held:
+                del self._chunks[chunk_idx]
+
+    def _read_chunk(self, chunk_idx):
+        with open(os.path.join(self.shard_dir, chunk_filename(chunk_idx)), "r") as file:
+            return json.load(file)
+
+
+class ShardedStore:
+    """
+    Annotation store that keeps a dataset as fixed-size chunk files plus a manifest in
+    `<dataset>_annotation.shards/`. An edit rewrites only the chunk that holds the item.
+
+    `filepath` is still the classic `<dataset>_annotation.json` path; it identifies the
+    dataset, and an existing single-file annotation there is imported on first load.
+    """
+
+    def __init__(self, filepath, chunk_size=50, cache_chunks=16):
+        self.filepath = filepath
+        self.shard_dir = shard_dir_for(filepath)
+        self.manifest_path = os.path.join(self.shard_dir, MANIFEST_NAME)
+        self.chunk_size = chunk_size
+        self.cache_chunks = cache_chunks
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._mtimes = {}
+
+    def exists(self):
+        return os.path.exists(self.manifest_path) or os.path.exists(self.filepath)
+
+    def create(self, data):
+        return self.create_from_iter(data)
+
+    def create_from_iter(self, items):
+        with self._lock:
+            self._manifest = write_shards(items, self.shard_dir, self.chunk_size)
+            self._mtimes = self._file_mtimes()
+        return self._manifest["count"]
+
+    def load(self):
+        if not os.path.exists(self.manifest_path):
+            import_annotation_file(self.filepath, self.shard_dir, self.chunk_size)
+        with open(self.manifest_path, "r") as file:
+            self._manifest = json.load(file)
+        with self._lock:
+            self._mtimes = self._file_mtimes()
+        return ShardedItems(self.shard_dir, self._manifest, self.cache_chunks)
+
+    def schema_version(self):
+        """Review schema version every item is known to have; 0 until `set_schema_version`."""
+        return self._manifest.get("review_schema", 0)
+
+    def set_schema_version(self, version):
+        with self._lock:
+            self._manifest["review_schema"] = version
+            write_json_atomic(self._manifest, self.manifest_path)
+            self._mtimes[self.manifest_path] = os.stat(self.manifest_path).st_mtime_ns
+
+    def record(self, index, path, value):
+        self.record_many([(index, path, value)])
+
+    def record_many(self, changes):
+        if not changes:
+            return
+        with self._lock:
+            chunk_size = self._manifest["chunk_size"]
+            # The writer reads its own copy of each chunk so a background flush never
+            # serializes objects the UI thread is mutating; the copies are dropped once written.
+            chunks = {}
+            for index, path, value in changes:
+                chunk_idx, offset = divmod(index, chunk_size)
+                if chunk_idx not in chunks:
+                    chunks[chunk_idx] = self._read_chunk(chunk_idx)
+                set_path(chunks[chunk_idx][offset], path, value)
+            for chunk_idx, chunk in chunks.items():
+                path = os.path.join(self.shard_dir, chunk_filename(chunk_idx))
+                write_json_atomic(chunk, path)
+                self._mtimes[path] = os.stat(path).st_mtime_ns
+
+    def compact(self):
+        # Every edit already lands in its chunk file; nothing to fold.
+        pass
+
+    def sync_files(self):
+        chunks = [os.path.join(self.shard_dir, chunk_filename(i)) for i in range(self._manifest["chunks"])]
+        return chunks + [self.manifest_path]
+
+    def size_bytes(self):
+        """Bytes the dataset takes on disk."""
+        return files_size(self.sync_files())
+
+    def changed_on_disk(self):
+        """True if another process rewrote a chunk or the manifest since this store last read or wrote it."""
+        with self._lock:
+            return self._file_mtimes() != self._mtimes
+
+    def close(self):
+        # Chunk files are only open while they are read or written
+        pass
+
+    def _read_chunk(self, chunk_idx):
+        with open(os.path.join(self.shard_dir, chunk_filename(chunk_idx)), "r") as file:
+            return json.load(file)
+
+    def _file_mtimes(self):
+        return {path: os.stat(path).st_mtime_ns for path in self.sync_files() if os.path.exists(path)}
+
+
+def write_shards(items, shard_dir, chunk_size=50):
+    """Write an iterable of items as chunk files + manifest. Returns the manifest."""
+    tmp_dir = shard_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    count = 0
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        count += 1
+        if len(chunk) == chunk_size:
+            _dump(chunk, os.path.join(tmp_dir, chunk_filename(count // chunk_size - 1)))
+            chunk = []
+    if chunk:
+        _dump(chunk, os.path.join(tmp_dir, chunk_filename(count // chunk_size)))
+
+    manifest = {
+        "version": SHARD_FORMAT_VERSION,
+        "count": count,
+        "chunk_size": chunk_size,
+        "chunks": (count + chunk_size - 1) // chunk_size,
+    }
+    _dump(manifest, os.path.join(tmp_dir, MANIFEST_NAME))
+
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    os.replace(tmp_dir, shard_dir)
+    return manifest
+
+
+def _dump(obj, path):
+    with open(path, "w") as file:
+        json.dump(obj, file, indent=4)
+
+
+def import_annotation_file(json_path, shard_dir=None, chunk_size=50):
+    """Convert a single-file `_annotation.json` (plus any pending journal) into shards."""
+    from storage import JournalStore
+
+    shard_dir = shard_dir or shard_dir_for(json_path)
+    data = JournalStore(json_path).load()
+    if not isinstance(data, list):
+        data = [data]
+    return write_shards(data, shard_dir, chunk_size)
+
+
+def export_annotation_file(shard_dir, json_path):
+    """Convert a shard directory back into the single-file `_annotation.json` format."""
+    with open(os.path.join(shard_dir, MANIFEST_NAME), "r") as file:
+        manifest = json.load(file)
+    items = ShardedItems(shard_dir, manifest)
+    write_json_atomic(list(items), json_path)
+    return manifest["count"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert annotation files to and from the sharded layout.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="single-file _annotation.json -> shards")
+    import_parser.add_argument("json_path")
+    import_parser.add_argument("--shard-dir", default=None)
+    import_parser.add_argument("--chunk-size", type=int, default=50)
+
+    export_parser = subparsers.add_parser("export", help="shards -> single-file _annotation.json")
+    export_parser.add_argument("shard_dir")
+    export_parser.add_argument("json_path")
+
+    args = parser.parse_args()
+    if args.command == "import":
+        manifest = import_annotation_file(args.json_path, args.shard_dir, args.chunk_size)
+        print(f"Wrote {manifest['count']} items in {manifest['chunks']} chunks")
+    else:
+        count = export_annotation_file(args.shard_dir, args.json_path)
+        print(f"Wrote {count} items to {args.json_path}")
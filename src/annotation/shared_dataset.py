@@ -0,0 +1,176 @@
+import atexit
+import threading
+from contextlib import nullcontext
+
+from storage import open_store, get_path, set_path, DatasetLock
+from save_scheduler import SaveScheduler
+from status import StatusCounters, is_item_done
+from review_items import migrate_items
+from models import compact_dataset, to_json
+from work_queue import WorkQueue
+from search_index import SearchIndex
+
+LOCK_STRIPES = 64
+_MISSING = object()
+
+
+class SharedDataset:
+    """
+    One loaded dataset shared by every reviewer session in the server process.
+
+    Sessions hold a reference to `data` instead of a copy. Edits go through `edit`, which
+    locks only the item's stripe, keeps the shared status counters current and queues the
+    change on the dataset's single SaveScheduler. `version` increases with every edit, so
+    per-session caches (download payload) notice other reviewers' changes. `queue` hands
+    items out to reviewers under expiring leases, and `search` indexes the items for the
+    sidebar search. `status` and `search` are built by one scan the first time either is
+    used, so opening a lazy (sharded) dataset does not read every chunk.
+    """
+
+    def __init__(self, filepath, store, data, scenario_field, lease_seconds=15 * 60, scheduler=None):
+        self.filepath = filepath
+        self.store = store
+        self.data = data
+        self.scheduler = scheduler or SaveScheduler(store)
+        if hasattr(data, 'track_pending'):
+            # Lazy (sharded) items keep the chunks of unsaved edits in memory
+            data.track_pending(self.scheduler.pending_indices)
+        self.scenario_field = scenario_field
+        self.version = 0
+        self.migrated = 0
+        self._item_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._status_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._status = None
+        self._search = None
+        self.queue = WorkQueue(data, lambda item: is_item_done(item, scenario_field), lease_seconds)
+
+    @property
+    def status(self):
+        if self._status is None:
+            self._build_indexes()
+        return self._status
+
+    @property
+    def search(self):
+        if self._search is None:
+            self._build_indexes()
+        return self._search
+
+    def _build_indexes(self):
+        with self._build_lock:
+            if self._status is not None:
+                return
+            # Holding every stripe keeps edits out, so the scan neither misses nor double-counts one
+            for lock in self._item_locks:
+                lock.acquire()
+            try:
+                status = StatusCounters(self.scenario_field)
+                search = SearchIndex(self.scenario_field)
+                for index, item in enumerate(self.data):
+                    status.add_item(item)
+                    search.add_item(index, item)
+                self._search = search
+                self._status = status
+            finally:
+                for lock in self._item_locks:
+                    lock.release()
+
+    def edit(self, index, path, value):
+        """Set `path` of item `index` to `value` and queue the write; returns False if unchanged."""
+        # A lazy (sharded) item stays cached from the read until the edit is pending
+        pinned = self.data.pinned(index) if hasattr(self.data, 'pinned') else nullcontext()
+        with self._item_locks[index % LOCK_STRIPES], pinned:
+            # The same item object is counted out, edited and counted back in
+            item = self.data[index]
+            if get_path(item, path, default=_MISSING) == value:
+                return False
+            # Not built yet: the first scan will see this edit
+            status, search = self._status, self._search
+            if status is not None:
+                with self._status_lock:
+                    status.remove_item(item)
+            scope = search.edit_scope(path) if search is not None else None
+            if scope:
+                search.remove_item(index, item, text=scope == "all")
+            set_path(item, path, value)
+            if scope:
+                search.add_item(index, item, text=scope == "all")
+            with self._status_lock:
+                if status is not None:
+                    status.add_item(item)
+                self.version += 1
+            self.scheduler.submit(index, path, to_json(value))
+        return True
+
+
+class DatasetManager:
+    """
+    Process-wide registry of SharedDatasets keyed by annotation file path (use via st.cache_resource).
+
+    An open dataset's lock file is held until the process exits, so offline writers such as
+    batch_refine.py refuse to run meanwhile (and `open` raises DatasetLockedError while one
+    runs). `refresh` still reloads a dataset whose files another process changed anyway.
+    """
+
+    def __init__(self):
+        self._datasets = {}
+        self._settings = {}
+        self._lock = threading.Lock()
+
+    def open(self, filepath, storage_cfg, scenario_field, derive, import_items, lease_seconds=15 * 60):
+        """
+        Return (dataset, outcome) where outcome is "shared" (already open in this process),
+        "loaded" (read from disk) or "created" (imported with `import_items(store)`).
+        """
+        with self._lock:
+            dataset = self._datasets.get(filepath)
+            if dataset is not None:
+                return dataset, "shared"
+            lock = DatasetLock(filepath, "the review server")
+            lock.acquire()
+            try:
+                store = open_store(filepath, storage_cfg)
+                if store.exists():
+                    outcome = "loaded"
+                    data = store.load()
+                    migrated = migrate_items(data, store, derive)
+                else:
+                    outcome = "created"
+                    import_items(store)
+                    data = store.load()
+                    migrated = 0
+            except BaseException:
+                lock.release()
+                raise
+            atexit.register(lock.release)
+            dataset = SharedDataset(filepath, store, compact_dataset(data), scenario_field, lease_seconds)
+            dataset.migrated = migrated
+            self._datasets[filepath] = dataset
+            self._settings[filepath] = (scenario_field, derive)
+            return dataset, outcome
+
+    def refresh(self, dataset):
+        """The current dataset for `dataset.filepath`, reloaded first if another process changed its files."""
+        with self._lock:
+            current = self._datasets.get(dataset.filepath, dataset)
+            if current is not dataset or not dataset.store.changed_on_disk():
+                return current
+            # Edits still queued here are newer than the other writer's; they go on top
+            dataset.scheduler.flush()
+            scenario_field, derive = self._settings[dataset.filepath]
+            data = dataset.store.load()
+            migrate_items(data, dataset.store, derive)
+            # Sessions still holding the old dataset keep saving through the same scheduler
+            reloaded = SharedDataset(dataset.filepath, dataset.store, compact_dataset(data), scenario_field,
+                                     dataset.queue.lease_seconds, scheduler=dataset.scheduler)
+            # Reviewers keep their leases, and per-version caches never mistake the new data for old
+            reloaded.queue = dataset.queue
+            reloaded.queue.data = reloaded.data
+            reloaded.version = dataset.version + 1
+            self._datasets[dataset.filepath] = reloaded
+            return reloaded
+
+    def datasets(self):
+        with self._lock:
+            return dict(self._datasets)
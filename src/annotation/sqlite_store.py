@@ -0,0 +1,305 @@
+import os
+import json
+import sqlite3
+import threading
+
+from storage import normalize_path, files_size
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    item_idx INTEGER PRIMARY KEY,
+    doc TEXT NOT NULL,
+    has_aspects INTEGER NOT NULL DEFAULT 0,
+    has_situations INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS aspects (
+    item_idx INTEGER NOT NULL,
+    aspect_idx INTEGER NOT NULL,
+    doc TEXT NOT NULL,
+    PRIMARY KEY (item_idx, aspect_idx)
+);
+CREATE TABLE IF NOT EXISTS points (
+    item_idx INTEGER NOT NULL,
+    aspect_idx INTEGER NOT NULL,
+    point_idx INTEGER NOT NULL,
+    doc TEXT NOT NULL,
+    PRIMARY KEY (item_idx, aspect_idx, point_idx)
+);
+CREATE TABLE IF NOT EXISTS situations (
+    item_idx INTEGER NOT NULL,
+    situation_idx INTEGER NOT NULL,
+    doc TEXT NOT NULL,
+    PRIMARY KEY (item_idx, situation_idx)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def sqlite_path_for(filepath):
+    """data/<dataset>/<dataset>_annotation.json -> data/<dataset>/<dataset>_annotation.sqlite"""
+    return os.path.splitext(filepath)[0] + '.sqlite'
+
+
+def json_path_expr(keys):
+    """('a', 0, 'b') -> '$."a"[0]."b"' for json_set()."""
+    expr = '$'
+    for key in keys:
+        if isinstance(key, int):
+            expr += f'[{key}]'
+        else:
+            expr += '."' + str(key).replace('"', '\\"') + '"'
+    return expr
+
+
+class SQLiteStore:
+    """
+    Annotation store backed by SQLite in WAL mode.
+
+    Items, `question1_aspects`, their `points` and `question2_situations` live in separate
+    tables keyed by their indices, so one edit is a single-row UPDATE in its own transaction.
+    Concurrent reviewer sessions on the same dataset only touch the rows they edit instead of
+    overwriting each other's work.
+    """
+
+    def __init__(self, filepath, timeout=30.0):
+        self.filepath = filepath
+        self.db_path = sqlite_path_for(filepath)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._conn = None
+        self._snapshot_version = None
+        self._data_version = None
+
+    def exists(self):
+        return self.import_complete() or os.path.exists(self.filepath)
+
+    def import_complete(self):
+        """True once an import has committed; a failed one leaves no database behind."""
+        if not os.path.exists(self.db_path):
+            return False
+        conn = self._connection()
+        with self._lock:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'import_complete'").fetchone():
+                return True
+            # Databases imported before the marker existed
+            return conn.execute("SELECT EXISTS (SELECT 1 FROM items)").fetchone()[0] == 1
+
+    def create(self, data):
+        return self.create_from_iter(data)
+
+    def create_from_iter(self, items):
+        """Replace the dataset in one transaction; if `items` fails midway the previous data stays."""
+        conn = self._connection()
+        count = 0
+        try:
+            with self._lock, conn:
+                conn.execute("DELETE FROM meta WHERE key = 'import_complete'")
+                for table in ('items', 'aspects', 'points', 'situations'):
+                    conn.execute(f"DELETE FROM {table}")
+                for item_idx, item in enumerate(items):
+                    self._insert_item(conn, item_idx, item)
+                    count += 1
+                conn.execute("INSERT INTO meta (key, value) VALUES ('import_complete', ?)", (str(count),))
+        except BaseException:
+            # A fresh database would otherwise stay behind empty and look like a 0-item dataset
+            if not self.import_complete():
+                self._remove_files()
+            raise
+        return count
+
+    def load(self):
+        if not self.import_complete():
+            import_annotation_file(self.filepath, self.db_path)
+        conn = self._connection()
+        with self._lock:
+            rows = conn.execute("SELECT item_idx, doc, has_aspects, has_situations FROM items ORDER BY item_idx").fetchall()
+            aspects = conn.execute("SELECT item_idx, aspect_idx, doc FROM aspects ORDER BY item_idx, aspect_idx").fetchall()
+            points = conn.execute("SELECT item_idx, aspect_idx, doc FROM points ORDER BY item_idx, aspect_idx, point_idx").fetchall()
+            situations = conn.execute("SELECT item_idx, doc FROM situations ORDER BY item_idx, situation_idx").fetchall()
+            self._data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+
+        data = []
+        for item_idx, doc, has_aspects, has_situations in rows:
+            item = json.loads(doc)
+            if has_aspects:
+                item['question1_aspects'] = []
+            if has_situations:
+                item['question2_situations'] = []
+            data.append(item)
+        for item_idx, aspect_idx, doc in aspects:
+            aspect = json.loads(doc)
+            aspect['points'] = []
+            data[item_idx]['question1_aspects'].append(aspect)
+        for item_idx, aspect_idx, doc in points:
+            data[item_idx]['question1_aspects'][aspect_idx]['points'].append(json.loads(doc))
+        for item_idx, doc in situations:
+            data[item_idx]['question2_situations'].append(json.loads(doc))
+        return data
+
+    def record(self, index, path, value):
+        self.record_many([(index, path, value)])
+
+    def record_many(self, changes):
+        if not changes:
+            return
+        conn = self._connection()
+        with self._lock, conn:
+            for index, path, value in changes:
+                self._apply(conn, index, normalize_path(path), value)
+
+    def compact(self):
+        conn = self._connection()
+        with self._lock:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def changed_on_disk(self):
+        """True if another connection committed since `load` (data_version ignores this connection's writes)."""
+        if self._data_version is None:
+            return False
+        conn = self._connection()
+        with self._lock:
+            return conn.execute("PRAGMA data_version").fetchone()[0] != self._data_version
+
+    def size_bytes(self):
+        """Bytes the dataset takes on disk (database plus its write-ahead log)."""
+        return files_size([self.db_path, self.db_path + '-wal'])
+
+    def sync_files(self):
+        # A consistent copy via the backup API; the live file may be mid-checkpoint. Each
+        # backup rewrites the copy's header, so it is only redone when the database changed.
+        snapshot_path = os.path.splitext(self.db_path)[0] + '.backup.sqlite'
+        conn = self._connection()
+        with self._lock:
+            version = (conn.total_changes, conn.execute("PRAGMA data_version").fetchone()[0])
+            if version != self._snapshot_version or not os.path.exists(snapshot_path):
+                target = sqlite3.connect(snapshot_path)
+                try:
+                    conn.backup(target)
+                finally:
+                    target.close()
+                self._snapshot_version = version
+        return [snapshot_path]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._snapshot_version = None
+                self._data_version = None
+
+    # ---------------- internals ----------------
+    def _remove_files(self):
+        self.close()
+        for path in (self.db_path, self.db_path + '-wal', self.db_path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _connection(self):
+        if self._conn is None:
+            # The save scheduler writes from its own thread; access is serialized by self._lock
+            self._conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _apply(self, conn, index, keys, value):
+        head = keys[0]
+        if head == 'question1_aspects':
+            if len(keys) == 1:
+                self._replace_aspects(conn, index, value)
+            elif len(keys) >= 3 and keys[2] == 'points':
+                if len(keys) == 3:
+                    self._replace_points(conn, index, keys[1], value)
+                else:
+                    self._set_doc(conn, "points", "item_idx = ? AND aspect_idx = ? AND point_idx = ?",
+                                  (index, keys[1], keys[3]), keys[4:], value)
+            else:
+                self._set_doc(conn, "aspects", "item_idx = ? AND aspect_idx = ?",
+                              (index, keys[1]), keys[2:], value)
+        elif head == 'question2_situations':
+            if len(keys) == 1:
+                self._replace_situations(conn, index, value)
+            else:
+                self._set_doc(conn, "situations", "item_idx = ? AND situation_idx = ?",
+                              (index, keys[1]), keys[2:], value)
+        else:
+            self._set_doc(conn, "items", "item_idx = ?", (index,), keys, value)
+
+    @staticmethod
+    def _set_doc(conn, table, where, params, keys, value):
+        if not keys:
+            conn.execute(f"UPDATE {table} SET doc = ? WHERE {where}", (json.dumps(value), *params))
+        else:
+            conn.execute(f"UPDATE {table} SET doc = json_set(doc, ?, json(?)) WHERE {where}",
+                         (json_path_expr(keys), json.dumps(value), *params))
+
+    def _insert_item(self, conn, item_idx, item):
+        doc = {k: v for k, v in item.items() if k not in ('question1_aspects', 'question2_situations')}
+        conn.execute("INSERT INTO items (item_idx, doc, has_aspects, has_situations) VALUES (?, ?, ?, ?)",
+                     (item_idx, json.dumps(doc), 'question1_aspects' in item, 'question2_situations' in item))
+        if 'question1_aspects' in item:
+            self._insert_aspects(conn, item_idx, item['question1_aspects'])
+        if 'question2_situations' in item:
+            self._insert_situations(conn, item_idx, item['question2_situations'])
+
+    def _replace_aspects(self, conn, item_idx, aspects):
+        conn.execute("DELETE FROM aspects WHERE item_idx = ?", (item_idx,))
+        conn.execute("DELETE FROM points WHERE item_idx = ?", (item_idx,))
+        conn.execute("UPDATE items SET has_aspects = 1 WHERE item_idx = ?", (item_idx,))
+        self._insert_aspects(conn, item_idx, aspects)
+
+    def _insert_aspects(self, conn, item_idx, aspects):
+        for aspect_idx, aspect in enumerate(aspects):
+            doc = {k: v for k, v in aspect.items() if k != 'points'}
+            conn.execute("INSERT INTO aspects (item_idx, aspect_idx, doc) VALUES (?, ?, ?)",
+                         (item_idx, aspect_idx, json.dumps(doc)))
+            self._insert_points(conn, item_idx, aspect_idx, aspect.get('points', []))
+
+    def _replace_points(self, conn, item_idx, aspect_idx, points):
+        conn.execute("DELETE FROM points WHERE item_idx = ? AND aspect_idx = ?", (item_idx, aspect_idx))
+        self._insert_points(conn, item_idx, aspect_idx, points)
+
+    @staticmethod
+    def _insert_points(conn, item_idx, aspect_idx, points):
+        conn.executemany("INSERT INTO points (item_idx, aspect_idx, point_idx, doc) VALUES (?, ?, ?, ?)",
+                         [(item_idx, aspect_idx, p_idx, json.dumps(point)) for p_idx, point in enumerate(points)])
+
+    def _replace_situations(self, conn, item_idx, situations):
+        conn.execute("DELETE FROM situations WHERE item_idx = ?", (item_idx,))
+        conn.execute("UPDATE items SET has_situations = 1 WHERE item_idx = ?", (item_idx,))
+        self._insert_situations(conn, item_idx, situations)
+
+    @staticmethod
+    def _insert_situations(conn, item_idx, situations):
+        conn.executemany("INSERT INTO situations (item_idx, situation_idx, doc) VALUES (?, ?, ?)",
+                         [(item_idx, s_idx, json.dumps(s)) for s_idx, s in enumerate(situations)])
+
+
+def import_annotation_file(json_path, db_path=None):
+    """Load a single-file `_annotation.json` (plus any pending journal) into SQLite."""
+    from storage import JournalStore
+
+    store = SQLiteStore(json_path)
+    if db_path:
+        store.db_path = db_path
+    data = JournalStore(json_path).load()
+    store.create(data if isinstance(data, list) else [data])
+    store.close()
+    return len(data)
+
+
+def export_annotation_file(db_path, json_path):
+    """Write the SQLite dataset back out in the single-file `_annotation.json` format."""
+    from storage import write_json_atomic
+
+    store = SQLiteStore(json_path)
+    store.db_path = db_path
+    data = store.load()
+    store.close()
+    write_json_atomic(data, json_path)
+    return len(data)
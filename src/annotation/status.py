@@ -0,0 +1,74 @@
+from collections import Counter, defaultdict
+
+UNREVIEWED = ""
+
+
+def is_item_done(item, scenario_field):
+    """True once the scenario, every point and every decision of `item` has a choice."""
+    if (item.get(scenario_field, UNREVIEWED) or UNREVIEWED) == UNREVIEWED:
+        return False
+    for aspect in item.get('question1_aspects', []):
+        for point in aspect.get('points', []):
+            if point.get('choice', UNREVIEWED) == UNREVIEWED:
+                return False
+    return all(s.get('choice', UNREVIEWED) != UNREVIEWED for s in item.get('question2_situations', []))
+
+
+class StatusCounters:
+    """
+    Running review counters for the sidebar status dashboard.
+
+    Built in one pass over the dataset when first needed and then kept current by
+    `update_and_save`, which calls `remove_item` before and `add_item` after each edit.
+    Only the edited item is rescanned, so the dashboard costs the same for any dataset size.
+    """
+
+    def __init__(self, scenario_field):
+        self.scenario_field = scenario_field
+        self.total = 0
+        self.items_done = 0
+        self.scenario = Counter()
+        self.aspects = defaultdict(Counter)
+        self.situations = defaultdict(Counter)
+        self.points_total = 0
+        self.points_reviewed = 0
+        self.situations_total = 0
+        self.situations_reviewed = 0
+
+    @classmethod
+    def from_data(cls, data, scenario_field):
+        counters = cls(scenario_field)
+        for item in data:
+            counters.add_item(item)
+        return counters
+
+    def add_item(self, item, sign=1):
+        self.total += sign
+        if is_item_done(item, self.scenario_field):
+            self.items_done += sign
+        self.scenario[item.get(self.scenario_field, UNREVIEWED) or UNREVIEWED] += sign
+        for aspect in item.get('question1_aspects', []):
+            for point in aspect.get('points', []):
+                choice = point.get('choice', UNREVIEWED)
+                self.aspects[aspect.get('aspect_name', '')][choice] += sign
+                self.points_total += sign
+                if choice != UNREVIEWED:
+                    self.points_reviewed += sign
+        for s_idx, situation in enumerate(item.get('question2_situations', [])):
+            choice = situation.get('choice', UNREVIEWED)
+            self.situations[situation.get('option_key', f"Decision {s_idx + 1}")][choice] += sign
+            self.situations_total += sign
+            if choice != UNREVIEWED:
+                self.situations_reviewed += sign
+
+    def remove_item(self, item):
+        self.add_item(item, sign=-1)
+
+    def scenario_reviewed(self):
+        return self.total - self.scenario[UNREVIEWED]
+
+    def completion(self):
+        """Share of all review decisions (scenarios, points, decisions) that have been made."""
+        done = self.scenario_reviewed() + self.points_reviewed + self.situations_reviewed
+        todo = self.total + self.points_total + self.situations_total
+        return done / todo if todo else 0.0
@@ -0,0 +1,341 @@
+import os
+import json
+import glob
+import time
+import threading
+
+
+def normalize_path(path):
+    """
+    A field path is either a single key ('Scenario_judge') or a sequence of keys/indices
+    (('question1_aspects', 0, 'points', 2, 'choice')).
+    """
+    if isinstance(path, (list, tuple)):
+        return list(path)
+    return [path]
+
+
+def get_path(item, path, default=None):
+    node = item
+    for key in normalize_path(path):
+        try:
+            node = node[key]
+        except (KeyError, IndexError, TypeError):
+            return default
+    return node
+
+
+def set_path(item, path, value):
+    keys = normalize_path(path)
+    node = item
+    for key in keys[:-1]:
+        node = node[key]
+    node[keys[-1]] = value
+
+
+def write_json_atomic(data, filepath, indent=4):
+    tmp_path = filepath + '.tmp'
+    with open(tmp_path, "w") as file:
+        json.dump(data, file, indent=indent)
+    os.replace(tmp_path, filepath)
+
+
+def write_json_array_atomic(items, filepath):
+    """
+    Stream an iterable of items to `filepath` as a JSON array, one item in memory at a time.
+    The output is byte-identical to json.dump(list(items), file, indent=4).
+    """
+    tmp_path = filepath + '.tmp'
+    count = 0
+    with open(tmp_path, "w") as file:
+        for item in items:
+            file.write("[\n" if count == 0 else ",\n")
+            file.write("    " + json.dumps(item, indent=4).replace("\n", "\n    "))
+            count += 1
+        file.write("\n]" if count else "[]")
+    os.replace(tmp_path, filepath)
+    return count
+
+
+def files_size(paths):
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+class DatasetLockedError(RuntimeError):
+    """Another live process holds the dataset's lock file."""
+
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        # os.kill would terminate the process on Windows
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DatasetLock:
+    """
+    `<dataset>_annotation.lock` next to the annotation file, naming the process that writes
+    the dataset. The review server holds it while the dataset is open and batch_refine.py
+    while it runs, so two processes never write the same store files. A lock left behind by
+    a process that has exited is taken over.
+    """
+
+    def __init__(self, filepath, owner):
+        self.path = os.path.splitext(filepath)[0] + '.lock'
+        self.owner = owner
+        self.held = False
+
+    def acquire(self):
+        info = json.dumps({"pid": os.getpid(), "owner": self.owner})
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(info)
+        try:
+            while True:
+                try:
+                    # link() creates the lock file with its content in one step, or fails if it exists
+                    os.link(tmp_path, self.path)
+                    break
+                except FileExistsError:
+                    holder = self.holder()
+                    if holder is None:
+                        self._remove_stale()
+                    elif holder["pid"] == os.getpid():
+                        break
+                    else:
+                        raise DatasetLockedError(
+                            f"{os.path.basename(self.path)} is held by {holder['owner']} (pid {holder['pid']})")
+        finally:
+            os.remove(tmp_path)
+        self.held = True
+
+    def holder(self):
+        """{"pid", "owner"} of the live process holding the lock, or None."""
+        try:
+            with open(self.path, "r") as file:
+                holder = json.load(file)
+        except (OSError, ValueError):
+            # Gone, or not a lock this code wrote (acquire never leaves a partial file)
+            return None
+        return holder if _pid_alive(holder["pid"]) else None
+
+    def release(self):
+        if self.held:
+            self.held = False
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _remove_stale(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def open_store(filepath, storage_cfg=None):
+    """Create the annotation store selected by the `storage` section of the YAML config."""
+    storage_cfg = storage_cfg or {}
+    backend = storage_cfg.get('backend', 'journal')
+    if backend == 'journal':
+        return JournalStore(filepath, compact_every=storage_cfg.get('compact_every', 500))
+    if backend == 'sharded':
+        from sharded_store import ShardedStore
+        return ShardedStore(filepath, chunk_size=storage_cfg.get('chunk_size', 50),
+                            cache_chunks=storage_cfg.get('cache_chunks', 16))
+    if backend == 'sqlite':
+        from sqlite_store import SQLiteStore
+        return SQLiteStore(filepath)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+class JournalStore:
+    """
+    Snapshot + append-only journal for one annotation file.
+
+    Every edit is appended as one JSON line (item index, field path, value, timestamp)
+    to `<dataset>_annotation.journal.jsonl` next to the snapshot, so an edit costs the same
+    no matter how large the dataset is. When the journal reaches `compact_every` entries it
+    is rotated into a frozen segment and merged into the snapshot on a background thread.
+    `load` replays the frozen segments and the live journal on top of the snapshot.
+    """
+
+    def __init__(self, filepath, compact_every=500):
+        self.filepath = filepath
+        base = os.path.splitext(filepath)[0]
+        self.journal_path = base + '.journal.jsonl'
+        self.segment_prefix = base + '.journal.'
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._journal = None
+        self._journal_state = None
+        self._entries = 0
+        self._compactor = None
+
+    def exists(self):
+        return os.path.exists(self.filepath)
+
+    def create(self, data):
+        return self.create_from_iter(data)
+
+    def create_from_iter(self, items):
+        """Start a fresh snapshot from an iterable of items (streamed, not held in memory)."""
+        # A running compaction writes the same snapshot (and .tmp file); let it finish first
+        with self._compact_lock, self._lock:
+            self._close_journal()
+            count = write_json_array_atomic(items, self.filepath)
+            for path in self._segments() + [self.journal_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+            self._entries = 0
+            self._journal_state = None
+        return count
+
+    def load(self):
+        self.wait_for_compaction()
+        with open(self.filepath, "r") as file:
+            data = json.load(file)
+        for segment in self._segments():
+            self._replay(data, segment)
+        self._entries, valid_bytes = self._replay(data, self.journal_path)
+        with self._lock:
+            # Reopened on the next append: another writer may have rotated the file this handle points to
+            self._close_journal()
+            if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > valid_bytes:
+                # Cut a torn last line off before appending, or the next edits would be glued onto it
+                os.truncate(self.journal_path, valid_bytes)
+            self._journal_state = self._journal_stat()
+        return data
+
+    def record(self, index, path, value):
+        self.record_many([(index, path, value)])
+
+    def record_many(self, changes):
+        if not changes:
+            return
+        now = time.time()
+        lines = "".join(
+            json.dumps({"i": index, "path": normalize_path(path), "value": value, "ts": now}) + "\n"
+            for index, path, value in changes
+        )
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a")
+            self._journal.write(lines)
+            self._journal.flush()
+            stat = os.fstat(self._journal.fileno())
+            self._journal_state = (stat.st_ino, stat.st_size)
+            self._entries += len(changes)
+            if self._entries >= self.compact_every:
+                self._rotate()
+                self._start_compaction()
+
+    def compact(self):
+        """Fold the whole journal into the snapshot right now (blocking)."""
+        with self._lock:
+            self._rotate()
+        self.wait_for_compaction()
+        self._compact()
+
+    def sync_files(self):
+        """Files that make up the dataset on disk, for backups (snapshot first, then the journal)."""
+        return [self.filepath] + self._segments() + [self.journal_path]
+
+    def size_bytes(self):
+        """Bytes the dataset takes on disk."""
+        return files_size(self.sync_files())
+
+    def changed_on_disk(self):
+        """True if another process appended to or rotated the journal since this store last read or wrote it."""
+        with self._lock:
+            return self._journal_stat() != self._journal_state
+
+    def wait_for_compaction(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    def close(self):
+        with self._lock:
+            self._close_journal()
+        self.wait_for_compaction()
+
+    # ---------------- internals ----------------
+    def _segments(self):
+        # Frozen segments are named <base>.journal.<seq>.jsonl; the live journal is <base>.journal.jsonl
+        segments = glob.glob(glob.escape(self.segment_prefix) + '*.jsonl')
+        return sorted(p for p in segments if p != self.journal_path)
+
+    def _journal_stat(self):
+        try:
+            stat = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _rotate(self):
+        # Caller holds self._lock
+        self._close_journal()
+        if os.path.exists(self.journal_path):
+            segment = f"{self.segment_prefix}{time.time_ns():020d}.jsonl"
+            os.replace(self.journal_path, segment)
+        self._entries = 0
+        self._journal_state = None
+
+    def _start_compaction(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self._compact, daemon=True)
+        self._compactor.start()
+
+    def _compact(self):
+        with self._compact_lock:
+            segments = self._segments()
+            if not segments:
+                return
+            with open(self.filepath, "r") as file:
+                data = json.load(file)
+            for segment in segments:
+                self._replay(data, segment)
+            write_json_atomic(data, self.filepath)
+            # Replaying a segment twice is harmless (every entry sets an absolute value),
+            # so a crash between the two steps below does not lose or corrupt anything.
+            for segment in segments:
+                os.remove(segment)
+
+    @staticmethod
+    def _replay(data, journal_path):
+        """Apply a journal file to `data`; returns (entries applied, bytes of complete entries)."""
+        if not os.path.exists(journal_path):
+            return 0, 0
+        count = 0
+        valid_bytes = 0
+        with open(journal_path, "rb") as file:
+            for line in file:
+                # A torn last line after a crash has no newline or is not valid JSON
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                set_path(data[entry["i"]], entry["path"], entry["value"])
+                count += 1
+                valid_bytes += len(line)
+        return count, valid_bytes
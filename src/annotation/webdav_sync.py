@@ -0,0 +1,137 @@
+import os
+import time
+import hashlib
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import METRICS
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class WebDAVSync:
+    """
+    Background, delta-based backup of annotation stores to a WebDAV server (Jianguoyun).
+
+    `schedule` returns immediately; a worker thread uploads over one pooled keep-alive
+    `requests.Session`. Only the store's own files are sent (snapshot + journal, changed
+    chunk files, or the SQLite database), and a file is skipped when its content hash
+    matches the last successful upload, so an unchanged dataset costs no upload at all.
+    Repeated schedules for the same remote directory collapse into one sync.
+    """
+
+    def __init__(self, base_url, auth, timeout=60.0, session=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.session.auth = auth
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.status = {}
+        self._uploaded = {}
+        self._collections = set()
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def schedule(self, store, remote_dir):
+        with self._cond:
+            self._pending[remote_dir] = store
+            self.status.setdefault(remote_dir, {})["state"] = "queued"
+            self._cond.notify()
+
+    def sync_now(self, store, remote_dir):
+        """Synchronous variant of `schedule` (scripts and tests)."""
+        return self._sync(store, remote_dir)
+
+    def wait_idle(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or any(s.get("state") == "syncing" for s in self.status.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    # ---------------- internals ----------------
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                remote_dir, store = self._pending.popitem()
+                self.status[remote_dir]["state"] = "syncing"
+            try:
+                self._sync(store, remote_dir)
+            except Exception as e:
+                with self._cond:
+                    self.status[remote_dir].update({"state": "failed", "error": str(e), "finished": time.time()})
+            with self._cond:
+                self._cond.notify_all()
+
+    def _sync(self, store, remote_dir):
+        start = time.perf_counter()
+        local_root = os.path.dirname(store.filepath)
+        uploaded = skipped = sent_bytes = 0
+        for path in store.sync_files():
+            if not os.path.exists(path):
+                continue
+            remote_path = f"{remote_dir}/{os.path.relpath(path, local_root).replace(os.sep, '/')}"
+            stat = os.stat(path)
+            last = self._uploaded.get(remote_path)
+            if last and last["size"] == stat.st_size and last["mtime_ns"] == stat.st_mtime_ns:
+                skipped += 1
+                continue
+            digest = file_sha256(path)
+            if last and last["sha256"] == digest:
+                last.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                skipped += 1
+                continue
+            self._ensure_collection(remote_path.rsplit('/', 1)[0])
+            with open(path, "rb") as file:
+                res = self.session.put(self._url(remote_path), data=file, timeout=self.timeout)
+            if res.status_code not in (200, 201, 204):
+                raise RuntimeError(f"Failed Upload {remote_path}: {res.status_code}, {res.text[:200]}")
+            self._uploaded[remote_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+            uploaded += 1
+            sent_bytes += stat.st_size
+        result = {
+            "state": "done",
+            "uploaded": uploaded,
+            "skipped": skipped,
+            "bytes": sent_bytes,
+            "ms": (time.perf_counter() - start) * 1000,
+            "finished": time.time(),
+            "error": "",
+        }
+        with self._cond:
+            self.status.setdefault(remote_dir, {}).update(result)
+        METRICS.observe("webdav_sync", result["ms"] / 1000, sent_bytes)
+        return result
+
+    def _ensure_collection(self, remote_dir):
+        # MKCOL each level once per process; 405 means it already exists
+        parts = remote_dir.split('/')
+        for depth in range(1, len(parts) + 1):
+            collection = '/'.join(parts[:depth])
+            if collection in self._collections:
+                continue
+            res = self.session.request("MKCOL", self._url(collection) + '/', timeout=self.timeout)
+            if res.status_code not in (200, 201, 204, 301, 405):
+                raise RuntimeError(f"Failed MKCOL {collection}: {res.status_code}")
+            self._collections.add(collection)
+
+    def _url(self, remote_path):
+        return f"{self.base_url}/{remote_path}"
@@ -0,0 +1,47 @@
+import re
+from collections import OrderedDict
+
+# Per-item widget keys end with the item index, e.g. point_choice_{a}_{p}_{idx},
+# q2_situation{s}_mod_{idx}, feedback_textarea_{idx}, gpt_draft_{idx}
+ITEM_KEY = re.compile(r"_(\d+)$")
+
+
+def item_index_of(key):
+    match = ITEM_KEY.search(key) if isinstance(key, str) else None
+    return int(match.group(1)) if match else None
+
+
+class WidgetStateManager:
+    """
+    Keeps session_state widget keys only for the `capacity` most recently visited items.
+
+    Every item a reviewer opens adds a few dozen keys (radio choices, text areas, GPT
+    inputs). `touch(state, index)` marks an item as visited and drops the keys of items
+    that fell out of the LRU window. Nothing is lost: the widgets are re-initialized from
+    the loaded data (the store) the next time their item is shown.
+    """
+
+    def __init__(self, capacity=8):
+        self.capacity = capacity
+        self.recent = OrderedDict()
+        self.evicted_keys = 0
+
+    def touch(self, state, index):
+        self.recent[index] = True
+        self.recent.move_to_end(index)
+        while len(self.recent) > self.capacity:
+            self.recent.popitem(last=False)
+        stale = []
+        for key in list(state.keys()):
+            key_index = item_index_of(key)
+            if key_index is not None and key_index not in self.recent:
+                stale.append(key)
+        for key in stale:
+            del state[key]
+        self.evicted_keys += len(stale)
+        return len(stale)
+
+    def live_keys(self, state):
+        keys = list(state.keys())
+        item_keys = sum(1 for key in keys if item_index_of(key) is not None)
+        return {"total": len(keys), "item": item_keys, "items": len(self.recent)}
@@ -0,0 +1,126 @@
+import time
+import threading
+from collections import Counter, defaultdict
+
+
+class WorkQueue:
+    """
+    Lease-based assignment of items to concurrent reviewers of one shared dataset.
+
+    `claim_next` atomically leases the next item that is not fully reviewed and not leased
+    to anyone else; a reviewer holds at most one lease. Leases are renewed on every rerun
+    of the reviewer's session and expire after `lease_seconds` without activity, which puts
+    abandoned items back in the pool. Edits to an item leased by somebody else are refused
+    by the app, so two reviewers never overwrite each other.
+    """
+
+    def __init__(self, data, is_done, lease_seconds=15 * 60, clock=time.time):
+        self.data = data
+        self.is_done = is_done
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+        self._leases = {}
+        self._held = {}
+        self._history = defaultdict(list)
+        self._completed = Counter()
+        self._cursor = 0
+        self._lock = threading.Lock()
+
+    def claim_next(self, reviewer, after=None):
+        """
+        Index leased to `reviewer` (their current one, else the next free unreviewed item), or None.
+        With `after`, the scan starts past that index and reaches it again only once every
+        other item has been checked.
+        """
+        with self._lock:
+            return self._claim_next(reviewer, after)
+
+    def complete_and_claim(self, reviewer):
+        with self._lock:
+            index = self._release(reviewer)
+            if index is not None:
+                self._history[reviewer].append(index)
+                if self.is_done(self.data[index]):
+                    self._completed[reviewer] += 1
+            # The released item is usually still unreviewed (e.g. a deleted scenario); move past it
+            return self._claim_next(reviewer, after=index)
+
+    def claim_previous(self, reviewer):
+        """Go back to the reviewer's last completed item if nobody else holds it."""
+        with self._lock:
+            self._expire()
+            history = self._history[reviewer]
+            while history:
+                index = history.pop()
+                if index not in self._leases:
+                    self._release(reviewer)
+                    return self._grant(reviewer, index)
+            return None
+
+    def renew(self, reviewer):
+        """Extend the reviewer's lease; returns its index, or None if it expired and was lost."""
+        with self._lock:
+            self._expire()
+            index = self._held.get(reviewer)
+            return None if index is None else self._grant(reviewer, index)
+
+    def release(self, reviewer):
+        with self._lock:
+            return self._release(reviewer)
+
+    def holder(self, index):
+        with self._lock:
+            self._expire()
+            lease = self._leases.get(index)
+            return lease[0] if lease else None
+
+    def expires_in(self, reviewer):
+        with self._lock:
+            index = self._held.get(reviewer)
+            return None if index is None else self._leases[index][1] - self.clock()
+
+    def leases(self):
+        """{reviewer: (index, seconds left)} for every live lease."""
+        with self._lock:
+            self._expire()
+            now = self.clock()
+            return {reviewer: (index, expires - now) for index, (reviewer, expires) in self._leases.items()}
+
+    def completed(self):
+        with self._lock:
+            return dict(self._completed)
+
+    # ---------------- internals (caller holds self._lock) ----------------
+    def _claim_next(self, reviewer, after):
+        self._expire()
+        if reviewer in self._held:
+            return self._grant(reviewer, self._held[reviewer])
+        n = len(self.data)
+        start = self._cursor if after is None else after + 1
+        for offset in range(n):
+            index = (start + offset) % n
+            if index in self._leases or self.is_done(self.data[index]):
+                continue
+            # Everything before the cursor was done or leased; start the next scan here
+            self._cursor = index
+            return self._grant(reviewer, index)
+        return None
+
+    def _grant(self, reviewer, index):
+        self._leases[index] = (reviewer, self.clock() + self.lease_seconds)
+        self._held[reviewer] = index
+        return index
+
+    def _release(self, reviewer):
+        index = self._held.pop(reviewer, None)
+        if index is not None:
+            self._leases.pop(index, None)
+        return index
+
+    def _expire(self):
+        now = self.clock()
+        for index, (reviewer, expires) in list(self._leases.items()):
+            if expires <= now:
+                del self._leases[index]
+                if self._held.get(reviewer) == index:
+                    del self._held[reviewer]
@@ -0,0 +1,18 @@
+import json
+from types import SimpleNamespace
+
+from export import ExportCache
+
+
+def test_payload_is_shared_until_the_dataset_changes():
+    dataset = SimpleNamespace(filepath="ds_annotation.json", data=[{"a": 1}], version=0)
+    cache = ExportCache()
+    first = cache.payload(dataset, "JSON (compact)")
+    assert cache.payload_fn(dataset, "JSON (compact)")() is first
+
+    dataset.data[0]["a"] = 2
+    dataset.version += 1
+    assert json.loads(cache.payload(dataset, "JSON (compact)")) == [{"a": 2}]
+
+    reloaded = SimpleNamespace(filepath=dataset.filepath, data=[{"a": 3}], version=dataset.version)
+    assert json.loads(cache.payload(reloaded, "JSON (compact)")) == [{"a": 3}]
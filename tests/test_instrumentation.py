@@ -0,0 +1,11 @@
+from instrumentation import percentile
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(100))
+    assert percentile(values, 0.5) == 49
+    assert percentile(values, 0.95) == 94
+    assert percentile(values, 0.0) == 0
+    assert percentile(values, 1.0) == 99
+    assert percentile([7], 0.95) == 7
+    assert percentile([], 0.5) == 0.0
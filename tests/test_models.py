@@ -0,0 +1,12 @@
+from models import CHOICES, register_config_options
+
+
+def test_every_section_with_options_is_registered():
+    register_config_options({
+        "scenario_reality": {"label": "Real?", "options": ["Reality check A"]},
+        "question1": {"options": ["Question check B"]},
+        "title": "not a section",
+        "storage": {"backend": "journal"},
+    })
+    assert "Reality check A" in CHOICES.codes
+    assert "Question check B" in CHOICES.codes
@@ -0,0 +1,35 @@
+import time
+from collections.abc import Sequence
+
+from prefetch import Prefetcher
+
+
+class LazyItems(Sequence):
+    def __init__(self, count):
+        self.count = count
+        self.read = []
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        self.read.append(index)
+        return {"index": index}
+
+
+def test_in_memory_data_is_not_prefetched():
+    prefetcher = Prefetcher()
+    prefetcher.schedule([{}] * 10, 5)
+    assert prefetcher._futures == {}
+
+
+def test_finished_requests_are_pruned():
+    prefetcher = Prefetcher(radius=1)
+    items = LazyItems(100)
+    for index in range(1, 99):
+        prefetcher.schedule(items, index)
+        time.sleep(0.005)
+    assert len(prefetcher._futures) <= 3
+    assert 0 in items.read and 99 in items.read
+    prefetcher.close()
+    assert prefetcher._futures == {}
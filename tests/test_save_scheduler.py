@@ -0,0 +1,36 @@
+import time
+
+import pytest
+
+from save_scheduler import SaveScheduler
+
+
+class FlakyStore:
+    def __init__(self):
+        self.fail = True
+        self.rows = []
+
+    def record_many(self, changes):
+        if self.fail:
+            raise OSError(28, "No space left on device")
+        self.rows.extend(changes)
+
+
+def test_failed_batch_is_retried_before_newer_edits():
+    store = FlakyStore()
+    scheduler = SaveScheduler(store, interval_ms=50, idle_ms=10)
+    scheduler.submit(0, "a", 1)
+    scheduler.submit(1, "b", 1)
+    time.sleep(0.2)
+    assert scheduler.stats()["last_error"].startswith("OSError")
+    assert scheduler._worker.is_alive()
+    scheduler.submit(1, "b", 2)
+    with pytest.raises(OSError):
+        scheduler.flush()
+    assert scheduler.pending_indices() == {0, 1}
+
+    store.fail = False
+    scheduler.close()
+    assert store.rows == [(0, ["a"], 1), (1, ["b"], 2)]
+    assert scheduler.stats()["last_error"] is None
+    assert scheduler.pending_indices() == set()
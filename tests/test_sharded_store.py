@@ -0,0 +1,63 @@
+from sharded_store import ShardedStore
+
+
+def make_store(tmp_path, count=20, chunk_size=2, cache_chunks=3):
+    store = ShardedStore(str(tmp_path / "ds_annotation.json"), chunk_size=chunk_size, cache_chunks=cache_chunks)
+    store.create([{"Topic": str(i)} for i in range(count)])
+    return store
+
+
+def test_chunk_cache_is_bounded(tmp_path):
+    items = make_store(tmp_path).load()
+    assert [item["Topic"] for item in items[:]] == [str(i) for i in range(20)]
+    assert items.loaded_items() == 3 * 2
+
+
+def test_chunks_with_unsaved_edits_stay_cached(tmp_path):
+    store = make_store(tmp_path)
+    items = store.load()
+    pending = {0}
+    items.track_pending(lambda: pending)
+    items[0]["Topic"] = "edited"
+    for i in range(2, 20):
+        items[i]
+    assert items[0]["Topic"] == "edited"
+
+    store.record(0, "Topic", "edited")
+    pending.clear()
+    for i in range(2, 20):
+        items[i]
+    assert items[0]["Topic"] == "edited"
+
+
+def test_record_writes_through_without_keeping_copies(tmp_path):
+    store = make_store(tmp_path)
+    store.record_many([(0, "Topic", "a"), (5, "Topic", "b")])
+    store.record(0, "Comment", "c")
+    items = store.load()
+    assert items[0] == {"Topic": "a", "Comment": "c"}
+    assert items[5]["Topic"] == "b"
+
+
+def test_indexed_chunk_is_kept_when_every_other_chunk_is_dirty(tmp_path):
+    items = make_store(tmp_path, count=30, chunk_size=10, cache_chunks=1).load()
+    items.track_pending(lambda: {24})
+    items[24]["v"] = "pending"
+    items[1]["v"] = "edited"
+    assert items[1]["v"] == "edited"
+    assert items[24]["v"] == "pending"
+
+
+def test_cache_grows_past_max_chunks_while_chunks_are_dirty_or_pinned(tmp_path):
+    items = make_store(tmp_path, count=30, chunk_size=10, cache_chunks=1).load()
+    pending = set()
+    items.track_pending(lambda: pending)
+    for index in (4, 14):
+        items[index]["v"] = index
+        pending.add(index)
+    with items.pinned(24):
+        items[24]["v"] = 24
+        items[4], items[14]
+        assert items[24]["v"] == 24
+    assert items.loaded_items() == 30
+    assert [items[i].get("v") for i in (4, 14)] == [4, 14]
@@ -0,0 +1,94 @@
+import random
+
+from shared_dataset import DatasetManager
+from sharded_store import ShardedStore
+from search_index import SearchIndex
+from status import StatusCounters
+from storage import JournalStore
+
+
+def open_dataset(manager, filepath):
+    def import_items(store):
+        store.create([{"Topic": "a", "Scenario_judge": ""}, {"Topic": "b", "Scenario_judge": ""}])
+    dataset, _ = manager.open(filepath, {"backend": "journal"}, "Scenario_judge", lambda item: {}, import_items)
+    return dataset
+
+
+def test_refresh_reloads_a_dataset_changed_by_another_process(tmp_path):
+    filepath = str(tmp_path / "ds_annotation.json")
+    manager = DatasetManager()
+    dataset = open_dataset(manager, filepath)
+    dataset.edit(0, "Scenario_judge", "Correct")
+    dataset.scheduler.flush()
+    assert manager.refresh(dataset) is dataset
+
+    # e.g. batch_refine.py run while the server was up
+    other = JournalStore(filepath)
+    other.load()
+    other.record(1, "gpt_suggestions", {"Scenario": "refined"})
+    other.close()
+
+    reloaded = manager.refresh(dataset)
+    assert reloaded is not dataset
+    assert reloaded.data[1]["gpt_suggestions"] == {"Scenario": "refined"}
+    assert reloaded.data[0]["Scenario_judge"] == "Correct"
+    assert reloaded.version > dataset.version
+    assert manager.refresh(dataset) is reloaded
+    assert open_dataset(manager, filepath) is reloaded
+
+
+SHARDED = {"backend": "sharded", "chunk_size": 5, "cache_chunks": 1}
+CHOICE_PATHS = ("Scenario_judge", ("question1_aspects", 0, "points", 0, "choice"), ("question2_situations", 0, "choice"))
+
+
+def open_sharded(manager, filepath, count=40):
+    def import_items(store):
+        store.create([{
+            "Topic": f"topic {i}", "Scenario": f"scenario {i}", "Scenario_judge": "", "review_schema": 1,
+            "question1_aspects": [{"aspect_name": "Hazards", "points": [{"original_text": f"point {i}", "choice": ""}]}],
+            "question2_situations": [{"option_key": "Decision 1", "decision": f"decision {i}", "choice": ""}],
+        } for i in range(count)])
+    dataset, _ = manager.open(filepath, SHARDED, "Scenario_judge", lambda item: {}, import_items)
+    return dataset
+
+
+def random_choice_edits(dataset, rng, n=150):
+    for _ in range(n):
+        dataset.edit(rng.randrange(len(dataset.data)), rng.choice(CHOICE_PATHS), rng.choice(["", "Correct", "Delete"]))
+
+
+def test_sharded_status_counters_match_a_rescan(tmp_path):
+    filepath = str(tmp_path / "ds_annotation.json")
+    dataset = open_sharded(DatasetManager(), filepath)
+    rng = random.Random(0)
+    # Edits made before the counters are first built, and edits that have to keep them current
+    random_choice_edits(dataset, rng)
+    assert dataset.status.total == 40
+    random_choice_edits(dataset, rng)
+
+    assert vars(dataset.status) == vars(StatusCounters.from_data(dataset.data, "Scenario_judge"))
+    dataset.scheduler.flush()
+    on_disk = ShardedStore(filepath).load()
+    assert vars(dataset.status) == vars(StatusCounters.from_data(on_disk, "Scenario_judge"))
+
+
+def test_sharded_search_index_matches_a_rebuilt_index(tmp_path):
+    dataset = open_sharded(DatasetManager(), str(tmp_path / "ds_annotation.json"))
+    rng = random.Random(1)
+    words = ["acid", "spill", "goggles", "fume", "hood"]
+    text_paths = ("Scenario_modified", ("question1_aspects", 0, "points", 0, "modified_text"))
+    for edits in range(300):
+        if edits == 100:
+            assert dataset.search.search("topic:topic") is not None
+        index = rng.randrange(len(dataset.data))
+        if rng.random() < 0.5:
+            dataset.edit(index, rng.choice(text_paths), " ".join(rng.sample(words, 2)))
+        else:
+            dataset.edit(index, rng.choice(CHOICE_PATHS), rng.choice(["", "Correct", "Delete"]))
+
+    rebuilt = SearchIndex.from_data(dataset.data, "Scenario_judge")
+    assert dataset.search.terms() == rebuilt.terms()
+    queries = words + ["scenario:correct", "scenario:delete", "scenario:unreviewed", "choice:correct",
+                       "choice:delete", "choice:unreviewed", "acid choice:delete", "topic:7"]
+    for query in queries:
+        assert dataset.search.search(query) == rebuilt.search(query), query
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from sqlite_store import SQLiteStore
+
+
+def items_then_error(items):
+    yield from items
+    raise ValueError("malformed upload")
+
+
+def test_failed_first_import_leaves_no_database(tmp_path):
+    store = SQLiteStore(str(tmp_path / "ds_annotation.json"))
+    with pytest.raises(ValueError):
+        store.create_from_iter(items_then_error([{"Topic": "a"}]))
+    assert not store.exists()
+    assert not os.path.exists(store.db_path)
+
+    assert store.create_from_iter([{"Topic": "a"}, {"Topic": "b"}]) == 2
+    assert store.exists()
+    assert store.load() == [{"Topic": "a"}, {"Topic": "b"}]
+    store.close()
+
+
+def test_failed_reimport_keeps_the_previous_data(tmp_path):
+    store = SQLiteStore(str(tmp_path / "ds_annotation.json"))
+    store.create_from_iter([{"Topic": "a"}])
+    with pytest.raises(ValueError):
+        store.create_from_iter(items_then_error([{"Topic": "x"}, {"Topic": "y"}]))
+    assert store.exists()
+    assert store.load() == [{"Topic": "a"}]
+    store.close()
+
+
+def test_empty_dataset_counts_as_imported(tmp_path):
+    store = SQLiteStore(str(tmp_path / "ds_annotation.json"))
+    store.create_from_iter([])
+    assert store.exists()
+    store.close()
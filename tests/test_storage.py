@@ -0,0 +1,81 @@
+import os
+import json
+import subprocess
+import sys
+
+import pytest
+
+from storage import JournalStore, DatasetLock, DatasetLockedError
+
+
+def test_edits_after_torn_journal_line_survive_reload(tmp_path):
+    filepath = str(tmp_path / "ds_annotation.json")
+    store = JournalStore(filepath)
+    store.create([{"a": 0}, {"a": 0}, {"a": 0}])
+    store.record(0, "a", 1)
+    store.close()
+    # Simulate a crash in the middle of writing the next entry
+    with open(store.journal_path, "a") as file:
+        file.write('{"i": 1, "path": ["a"], "va')
+
+    store = JournalStore(filepath)
+    assert store.load() == [{"a": 1}, {"a": 0}, {"a": 0}]
+    store.record_many([(1, "a", 2), (2, "a", 3)])
+    store.close()
+
+    assert JournalStore(filepath).load() == [{"a": 1}, {"a": 2}, {"a": 3}]
+    with open(store.journal_path, "r") as file:
+        assert [json.loads(line)["value"] for line in file] == [1, 2, 3]
+
+
+def test_dataset_lock_refuses_a_live_holder_and_takes_over_a_stale_one(tmp_path):
+    filepath = str(tmp_path / "ds_annotation.json")
+    lock = DatasetLock(filepath, "batch_refine.py")
+    with open(lock.path, "w") as file:
+        json.dump({"pid": os.getppid(), "owner": "the review server"}, file)
+    with pytest.raises(DatasetLockedError, match="the review server"):
+        lock.acquire()
+
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    with open(lock.path, "w") as file:
+        json.dump({"pid": int(exited.stdout), "owner": "the review server"}, file)
+    lock.acquire()
+    assert lock.holder()["owner"] == "batch_refine.py"
+    lock.release()
+    assert not os.path.exists(lock.path)
+
+
+def test_journal_changes_by_another_writer_are_noticed(tmp_path):
+    filepath = str(tmp_path / "ds_annotation.json")
+    JournalStore(filepath).create([{"a": 0}, {"a": 0}])
+    store = JournalStore(filepath)
+    store.load()
+    store.record(0, "a", 1)
+    assert not store.changed_on_disk()
+
+    other = JournalStore(filepath)
+    other.load()
+    other.record(1, "a", 2)
+    other.close()
+    assert store.changed_on_disk()
+    assert store.load() == [{"a": 1}, {"a": 2}]
+    assert not store.changed_on_disk()
+    store.close()
+
+
+def test_reload_after_another_writer_rotated_the_journal(tmp_path):
+    filepath = str(tmp_path / "ds_annotation.json")
+    JournalStore(filepath).create([{"a": 0}, {"a": 0}])
+    store = JournalStore(filepath)
+    store.load()
+    store.record(0, "a", 1)
+
+    other = JournalStore(filepath, compact_every=1)
+    other.load()
+    other.record(1, "a", 2)
+    other.close()
+    assert store.changed_on_disk()
+    store.load()
+    store.record(0, "a", 3)
+    store.close()
+    assert JournalStore(filepath).load() == [{"a": 3}, {"a": 2}]
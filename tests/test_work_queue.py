@@ -0,0 +1,22 @@
+from work_queue import WorkQueue
+
+
+def make_queue(n):
+    data = [{"done": False} for _ in range(n)]
+    return data, WorkQueue(data, lambda item: item["done"])
+
+
+def test_next_moves_past_an_item_that_is_still_unreviewed():
+    data, queue = make_queue(3)
+    assert queue.claim_next("alice") == 0
+    assert [queue.complete_and_claim("alice") for _ in range(3)] == [1, 2, 0]
+
+
+def test_next_skips_items_leased_to_others_and_done_items():
+    data, queue = make_queue(4)
+    assert queue.claim_next("alice") == 0
+    assert queue.claim_next("bob") == 1
+    data[2]["done"] = True
+    assert queue.complete_and_claim("alice") == 3
+    data[3]["done"] = True
+    assert queue.complete_and_claim("alice") == 0